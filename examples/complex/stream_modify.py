@@ -5,7 +5,10 @@ Be aware that content replacement isn't trivial:
     - If the transfer encoding isn't chunked, you cannot simply change the content length.
     - If you want to replace all occurences of "foobar", make sure to catch the cases
       where one chunk ends with [...]foo" and the next starts with "bar[...].
+Compressed bodies are decoded and re-encoded incrementally, so that only one
+chunk is held in memory at a time.
 """
+from mitmproxy.net.http import encoding
 
 
 def modify(chunks):
@@ -13,8 +16,16 @@ def modify(chunks):
     chunks is a generator that can be used to iterate over all chunks.
     """
     for chunk in chunks:
-        yield chunk.replace("foo", "bar")
+        yield chunk.replace(b"foo", b"bar")
 
 
 def responseheaders(flow):
-    flow.response.stream = modify
+    ce = flow.response.headers.get("content-encoding", "identity")
+    if ce not in encoding.stream_decoders:
+        return
+
+    def stream(chunks):
+        chunks = encoding.decode_stream(chunks, ce)
+        return encoding.encode_stream(modify(chunks), ce)
+
+    flow.response.stream = stream
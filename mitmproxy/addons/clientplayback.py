@@ -10,7 +10,9 @@ import typing
 
 class ClientPlayback:
     def __init__(self):
-        self.flows = []  # type: typing.List[flow.Flow]
+        self.flows = []  # type: typing.Sequence[flow.Flow]
+        # The index of the next flow to replay.
+        self.position = 0
         self.current_thread = None
         self.configured = False
 
@@ -19,7 +21,7 @@ class ClientPlayback:
             current = 1
         else:
             current = 0
-        return current + len(self.flows)
+        return current + len(self.flows) - self.position
 
     @command.command("replay.client.stop")
     def stop_replay(self) -> None:
@@ -27,6 +29,7 @@ class ClientPlayback:
             Stop client replay.
         """
         self.flows = []
+        self.position = 0
         ctx.log.alert("Client replay stopped.")
         ctx.master.addons.trigger("update", [])
 
@@ -39,40 +42,59 @@ class ClientPlayback:
             if f.live:
                 raise exceptions.CommandError("Can't replay live flow.")
         self.flows = list(flows)
+        self.position = 0
+        ctx.log.alert("Replaying %s flows." % len(self.flows))
+        ctx.master.addons.trigger("update", [])
+
+    def load_paths(self, paths: typing.Sequence[str]) -> None:
+        """
+            Replay requests from dumps. Flows are only deserialized when they are
+            replayed, and flows read from a dump are never live.
+        """
+        self.flows = io.LazyFlows(paths)
+        self.position = 0
         ctx.log.alert("Replaying %s flows." % len(self.flows))
         ctx.master.addons.trigger("update", [])
 
     @command.command("replay.client.file")
     def load_file(self, path: mitmproxy.types.Path) -> None:
         try:
-            flows = io.read_flows_from_paths([path])
+            self.load_paths([path])
         except exceptions.FlowReadException as e:
             raise exceptions.CommandError(str(e))
-        ctx.log.alert("Replaying %s flows." % len(self.flows))
-        self.flows = flows
-        ctx.master.addons.trigger("update", [])
 
     def configure(self, updated):
         if not self.configured and ctx.options.client_replay:
             self.configured = True
             ctx.log.info("Client Replay: {}".format(ctx.options.client_replay))
             try:
-                flows = io.read_flows_from_paths(ctx.options.client_replay)
+                self.load_paths(ctx.options.client_replay)
             except exceptions.FlowReadException as e:
                 raise exceptions.OptionsError(str(e))
-            self.start_replay(flows)
+
+    def next_flow(self) -> typing.Optional[flow.Flow]:
+        """
+            Take the next flow to replay. Flows from dumps are only read here, so
+            flows that can not be read are logged and skipped.
+        """
+        while self.position < len(self.flows):
+            self.position += 1
+            try:
+                return self.flows[self.position - 1]
+            except exceptions.FlowReadException as e:
+                ctx.log.error("Cannot replay flow {}: {}".format(self.position, e))
+        return None
 
     def tick(self):
         current_is_done = self.current_thread and not self.current_thread.is_alive()
         can_start_new = not self.current_thread or current_is_done
-        will_start_new = can_start_new and self.flows
+        f = self.next_flow() if can_start_new else None
 
         if current_is_done:
             self.current_thread = None
             ctx.master.addons.trigger("update", [])
-        if will_start_new:
-            f = self.flows.pop(0)
+        if f:
             self.current_thread = ctx.master.replay_request(f)
             ctx.master.addons.trigger("update", [f])
-        if current_is_done and not will_start_new:
+        if current_is_done and not f:
             ctx.master.addons.trigger("processing_complete")
@@ -27,6 +27,34 @@ class CoreOptionValidation:
                     "Invalid body size limit specification: %s" %
                     opts.body_size_limit
                 )
+        if "tcp_coalesce_size" in updated:
+            try:
+                human.parse_size(opts.tcp_coalesce_size)
+            except ValueError as e:
+                raise exceptions.OptionsError(
+                    "Invalid TCP coalesce size specification: %s" %
+                    opts.tcp_coalesce_size
+                )
+        if "tcp_chunk_size" in updated and opts.tcp_chunk_size <= 0:
+            raise exceptions.OptionsError(
+                "Invalid TCP chunk size: %s" % opts.tcp_chunk_size
+            )
+        if "tcp_max_messages" in updated and opts.tcp_max_messages < 0:
+            raise exceptions.OptionsError(
+                "Invalid TCP message limit: %s" % opts.tcp_max_messages
+            )
+        if "read_workers" in updated and opts.read_workers < 0:
+            raise exceptions.OptionsError(
+                "Invalid number of read workers: %s" % opts.read_workers
+            )
+        if "websocket_max_bytes" in updated:
+            try:
+                human.parse_size(opts.websocket_max_bytes)
+            except ValueError as e:
+                raise exceptions.OptionsError(
+                    "Invalid WebSocket size limit specification: %s" %
+                    opts.websocket_max_bytes
+                )
         if "mode" in updated:
             mode = opts.mode
             if mode.startswith("reverse:") or mode.startswith("upstream:"):
@@ -4,6 +4,7 @@ import typing
 
 from mitmproxy import ctx
 from mitmproxy import exceptions
+from mitmproxy import flow
 from mitmproxy import io
 
 
@@ -13,11 +14,13 @@ class ReadFile:
     """
 
     def load_flows(self, fo: typing.IO[bytes]) -> int:
+        return self._load(io.FlowReader(fo).stream())
+
+    def _load(self, flows: typing.Iterable[flow.Flow]) -> int:
         cnt = 0
-        freader = io.FlowReader(fo)
         try:
-            for flow in freader.stream():
-                ctx.master.load_flow(flow)
+            for f in flows:
+                ctx.master.load_flow(f)
                 cnt += 1
         except (IOError, exceptions.FlowReadException) as e:
             if cnt:
@@ -32,7 +35,9 @@ class ReadFile:
         path = os.path.expanduser(path)
         try:
             with open(path, "rb") as f:
-                return self.load_flows(f)
+                if ctx.options.read_workers == 1:
+                    return self.load_flows(f)
+            return self._load(io.read_flows_parallel([path], ctx.options.read_workers))
         except IOError as e:
             ctx.log.error("Cannot load flows: {}".format(e))
             raise exceptions.FlowReadException(str(e)) from e
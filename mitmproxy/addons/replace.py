@@ -4,6 +4,7 @@ import re
 from mitmproxy import exceptions
 from mitmproxy import flowfilter
 from mitmproxy import ctx
+from mitmproxy.utils import strutils
 
 
 def parse_hook(s):
@@ -67,8 +68,8 @@ class Replace:
                     )
                 try:
                     # We should ideally escape here before trying to compile
-                    re.compile(rex)
-                except re.error as e:
+                    rex = re.compile(strutils.escaped_str_to_bytes(rex), re.DOTALL)
+                except (re.error, ValueError) as e:
                     raise exceptions.OptionsError(
                         "Invalid regular expression: %s - %s" % (rex, str(e))
                     )
@@ -80,12 +81,38 @@ class Replace:
             self.lst = lst
 
     def execute(self, f):
+        """
+            Apply the replacements to the response of a flow, or to its request if
+            there is no response yet.
+
+            The body is decoded once, and only encoded again after all replacements
+            have been made. It is written back early if the filter of a later
+            replacement looks at bodies.
+        """
+        msg = f.response or f.request
+        # The decoded body with the replacements made so far, if it has not been
+        # written back yet.
+        content = None
         for rex, s, flt in self.lst:
-            if flt(f):
-                if f.response:
-                    self.replace(f.response, rex, s)
-                else:
-                    self.replace(f.request, rex, s)
+            if content is not None and flt.reads_body:
+                msg.content = content
+                content = None
+            if not flt(f):
+                continue
+            s = self.replacement(s)
+            if s is None:
+                continue
+            if content is None:
+                content = msg.content
+            if content:
+                content = rex.sub(s, content)
+            else:
+                content = None
+            msg.headers.replace(rex, s)
+            if msg is f.request:
+                msg.data.path = rex.sub(s, msg.data.path)
+        if content is not None:
+            msg.content = content
 
     def request(self, flow):
         if not flow.reply.has_message:
@@ -95,13 +122,16 @@ class Replace:
         if not flow.reply.has_message:
             self.execute(flow)
 
-    def replace(self, obj, rex, s):
+    def replacement(self, s):
+        """
+            Returns the replacement for s as bytes, reading it from file for @path.
+        """
         if s.startswith("@"):
             s = os.path.expanduser(s[1:])
             try:
                 with open(s, "rb") as f:
-                    s = f.read()
+                    return f.read()
             except IOError:
                 ctx.log.warn("Could not read replacement file: %s" % s)
-                return
-        obj.replace(rex, s, flags=re.DOTALL)
+                return None
+        return strutils.escaped_str_to_bytes(s)
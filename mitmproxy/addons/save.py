@@ -1,4 +1,7 @@
+import collections
+import concurrent.futures
 import os.path
+import time
 import typing
 
 from mitmproxy import command
@@ -7,14 +10,31 @@ from mitmproxy import flowfilter
 from mitmproxy import io
 from mitmproxy import ctx
 from mitmproxy import flow
+from mitmproxy.utils import human
 import mitmproxy.types
 
 
 class Save:
+    # Seconds between reports on a stream written in the background.
+    ReportInterval = 60
+
     def __init__(self):
         self.stream = None
         self.filt = None
         self.active_flows = set()  # type: Set[flow.Flow]
+        # The save_stream_file pattern, the file of the current segment and
+        # the segments of this stream that have not been pruned, oldest first.
+        self.stream_path = None  # type: typing.Optional[str]
+        self.stream_file = None
+        self.stream_started = 0.0
+        self.segments = collections.deque()  # type: typing.Deque[str]
+        self.used_paths = set()  # type: typing.Set[str]
+        self.rotate_size = None  # type: typing.Optional[int]
+        # Background writers of old segments that are still being closed.
+        self.closing = []  # type: typing.List[concurrent.futures.Future]
+        self.closer = None  # type: typing.Optional[concurrent.futures.ThreadPoolExecutor]
+        self.last_report = 0.0
+        self.dropping = False
 
     def open_file(self, path):
         if path.startswith("+"):
@@ -25,13 +45,146 @@ class Save:
         path = os.path.expanduser(path)
         return open(path, mode)
 
+    def open_index(self, f):
+        """
+            Opens the index for an open flow file, if indexes are enabled.
+        """
+        if not ctx.options.save_index or ctx.options.save_compress:
+            return None
+        return open(io.index.index_path(f.name), f.mode)
+
+    def open_bodies(self, f):
+        """
+            Opens the body store for an open flow file, if deduplication is enabled.
+        """
+        if not ctx.options.save_dedup_bodies:
+            return None
+        return open(io.bodies.bodies_path(f.name), f.mode)
+
+    def segment_path(self):
+        """
+            Expand the strftime patterns of the stream path. If the result has
+            already been used by this stream, a counter is appended so that
+            segments never overwrite each other.
+        """
+        prefix, path = "", self.stream_path
+        if path.startswith("+"):
+            prefix, path = "+", path[1:]
+        path = os.path.expanduser(time.strftime(path))
+        candidate, n = path, 0
+        while candidate in self.used_paths:
+            n += 1
+            candidate = "{}.{}".format(path, n)
+        return prefix + candidate
+
+    def open_segment(self):
+        f = self.open_file(self.segment_path())
+        index_fo = self.open_index(f)
+        bodies_fo = self.open_bodies(f)
+        stream = io.FilteredFlowWriter(f, self.filt, index_fo, ctx.options.save_compress, bodies_fo)
+        if ctx.options.save_stream_queue:
+            stream = io.AsyncFlowWriter(
+                stream,
+                ctx.options.save_stream_queue,
+                ctx.options.save_stream_fsync,
+                ctx.options.save_stream_overflow,
+            )
+        self.segments.append(f.name)
+        self.used_paths.add(f.name)
+        self.stream_file = f
+        self.stream_started = time.time()
+        return stream
+
     def start_stream_to_path(self, path, flt):
+        self.stream_path = path
+        self.filt = flt
+        self.segments = collections.deque()
+        self.used_paths = set()
         try:
-            f = self.open_file(path)
+            self.stream = self.open_segment()
         except IOError as v:
             raise exceptions.OptionsError(str(v))
-        self.stream = io.FilteredFlowWriter(f, flt)
         self.active_flows = set()
+        self.last_report = time.time()
+        self.dropping = False
+
+    def rotation_due(self):
+        interval = ctx.options.save_stream_rotate_interval
+        if interval and time.time() - self.stream_started >= interval:
+            return True
+        # For compressed and queued streams, this lags behind by the data that
+        # has not been written yet.
+        return bool(self.rotate_size and self.stream_file.tell() >= self.rotate_size)
+
+    def rotate(self):
+        """
+            Continue the stream in a new file. Queued writers are closed in
+            the background, so that rotating does not hold up traffic.
+        """
+        old, self.stream = self.stream, self.open_segment()
+        if isinstance(old, io.AsyncFlowWriter):
+            if not self.closer:
+                self.closer = concurrent.futures.ThreadPoolExecutor(1)
+            self.closing.append(self.closer.submit(self.close_stream, old))
+        else:
+            self.close_stream(old)
+            self.prune()
+        self.reap()
+
+    def close_stream(self, stream):
+        stream.close()
+        return stream
+
+    def reap(self, wait=False):
+        """
+            Report on old segments that have been closed in the background.
+        """
+        pending = []
+        for fut in self.closing:
+            if not wait and not fut.done():
+                pending.append(fut)
+                continue
+            try:
+                self.log_summary(fut.result())
+            except IOError as e:
+                ctx.log.error("Error saving flows: {}".format(e))
+        self.closing = pending
+        self.prune()
+
+    def prune(self):
+        """
+            Delete the oldest segments beyond save_stream_max_files, with their
+            index and body store. Only files written by the current stream are
+            ever deleted.
+        """
+        keep = ctx.options.save_stream_max_files
+        if not keep:
+            return
+        # Segments that are still being written to are never deleted.
+        while len(self.segments) > max(keep, len(self.closing) + 1):
+            path = self.segments.popleft()
+            for p in (path, io.index.index_path(path), io.bodies.bodies_path(path)):
+                try:
+                    os.remove(p)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    ctx.log.warn("Could not remove old flow file: {}".format(e))
+
+    def log_summary(self, stream):
+        if isinstance(stream, io.AsyncFlowWriter):
+            ctx.log.info(
+                "Saved {} flows, dropped {}, {} queued. Slowest write took {:.0f}ms, last {:.0f}ms.".format(
+                    stream.written, stream.dropped, stream.queue_depth,
+                    stream.max_write_latency * 1000, stream.write_latency * 1000
+                )
+            )
+
+    def tick(self):
+        if isinstance(self.stream, io.AsyncFlowWriter):
+            if time.time() - self.last_report > self.ReportInterval:
+                self.last_report = time.time()
+                self.log_summary(self.stream)
 
     def configure(self, updated):
         # We're already streaming - stop the previous stream and restart
@@ -44,7 +197,18 @@ class Save:
                     )
             else:
                 self.filt = None
-        if "save_stream_file" in updated or "save_stream_filter" in updated:
+        if "save_stream_rotate_size" in updated:
+            try:
+                self.rotate_size = human.parse_size(ctx.options.save_stream_rotate_size)
+            except ValueError:
+                raise exceptions.OptionsError(
+                    "Invalid rotation size specification: %s" %
+                    ctx.options.save_stream_rotate_size
+                )
+        if updated & {
+            "save_stream_file", "save_stream_filter", "save_index", "save_compress", "save_dedup_bodies",
+            "save_stream_queue", "save_stream_fsync", "save_stream_overflow",
+        }:
             if self.stream:
                 self.done()
             if ctx.options.save_stream_file:
@@ -58,21 +222,36 @@ class Save:
         """
         try:
             f = self.open_file(path)
+            index_fo = self.open_index(f)
+            bodies_fo = self.open_bodies(f)
         except IOError as v:
             raise exceptions.CommandError(v) from v
-        stream = io.FlowWriter(f)
+        stream = io.FlowWriter(f, index_fo, ctx.options.save_compress, bodies_fo)
         for i in flows:
             stream.add(i)
-        f.close()
+        stream.close()
         ctx.log.alert("Saved %s flows." % len(flows))
 
+    def write_flow(self, flow):
+        try:
+            if self.rotation_due():
+                self.rotate()
+            self.stream.add(flow)
+            if isinstance(self.stream, io.AsyncFlowWriter) and self.stream.dropped and not self.dropping:
+                self.dropping = True
+                ctx.log.warn("The save queue is full, flows are being dropped.")
+        except IOError as e:
+            ctx.log.error("Stopped saving flows: {}".format(e))
+            self.active_flows = set([])
+            self.done()
+
     def tcp_start(self, flow):
         if self.stream:
             self.active_flows.add(flow)
 
     def tcp_end(self, flow):
         if self.stream:
-            self.stream.add(flow)
+            self.write_flow(flow)
             self.active_flows.discard(flow)
 
     def websocket_start(self, flow):
@@ -81,12 +260,12 @@ class Save:
 
     def websocket_end(self, flow):
         if self.stream:
-            self.stream.add(flow)
+            self.write_flow(flow)
             self.active_flows.discard(flow)
 
     def response(self, flow):
         if self.stream:
-            self.stream.add(flow)
+            self.write_flow(flow)
             self.active_flows.discard(flow)
 
     def request(self, flow):
@@ -95,8 +274,18 @@ class Save:
 
     def done(self):
         if self.stream:
-            for f in self.active_flows:
-                self.stream.add(f)
+            stream, self.stream = self.stream, None
+            try:
+                try:
+                    for f in self.active_flows:
+                        stream.add(f)
+                finally:
+                    stream.close()
+            except IOError as e:
+                ctx.log.error("Error saving flows: {}".format(e))
             self.active_flows = set([])
-            self.stream.fo.close()
-            self.stream = None
+            self.log_summary(stream)
+        self.reap(wait=True)
+        if self.closer:
+            self.closer.shutdown(wait=True)
+            self.closer = None
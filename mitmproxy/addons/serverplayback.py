@@ -14,7 +14,8 @@ import mitmproxy.types
 
 class ServerPlayback:
     def __init__(self):
-        self.flowmap = {}
+        self.flows = []  # type: typing.Sequence[flow.Flow]
+        self.flowmap = {}  # type: typing.Dict[bytes, typing.List[int]]
         self.stop = False
         self.final_flow = None
         self.configured = False
@@ -24,26 +25,41 @@ class ServerPlayback:
         """
             Replay server responses from flows.
         """
+        self._load(flows, flows)
+
+    def _load(self, flows: typing.Sequence[flow.Flow], decoded: typing.Iterable[flow.Flow]) -> None:
+        """
+            Replay server responses from flows, where decoded yields the same flows.
+        """
+        # The flow map only stores positions in flows, so that flows can be a
+        # lazy sequence that deserializes a flow only when it is replayed.
+        self.flows = flows
         self.flowmap = {}
-        for i in flows:
+        for n, i in enumerate(decoded):
             if i.response:  # type: ignore
                 l = self.flowmap.setdefault(self._hash(i), [])
-                l.append(i)
+                l.append(n)
         ctx.master.addons.trigger("update", [])
 
+    def _load_paths(self, paths: typing.Sequence[str]) -> None:
+        try:
+            self._load(io.LazyFlows(paths), io.read_flows_parallel(paths, ctx.options.read_workers))
+        except IOError as e:
+            raise exceptions.FlowReadException(e.strerror)
+
     @command.command("replay.server.file")
     def load_file(self, path: mitmproxy.types.Path) -> None:
         try:
-            flows = io.read_flows_from_paths([path])
+            self._load_paths([path])
         except exceptions.FlowReadException as e:
             raise exceptions.CommandError(str(e))
-        self.load_flows(flows)
 
     @command.command("replay.server.stop")
     def clear(self) -> None:
         """
             Stop server replay.
         """
+        self.flows = []
         self.flowmap = {}
         ctx.master.addons.trigger("update", [])
 
@@ -106,21 +122,20 @@ class ServerPlayback:
         hsh = self._hash(request)
         if hsh in self.flowmap:
             if ctx.options.server_replay_nopop:
-                return self.flowmap[hsh][0]
+                return self.flows[self.flowmap[hsh][0]]
             else:
                 ret = self.flowmap[hsh].pop(0)
                 if not self.flowmap[hsh]:
                     del self.flowmap[hsh]
-                return ret
+                return self.flows[ret]
 
     def configure(self, updated):
         if not self.configured and ctx.options.server_replay:
             self.configured = True
             try:
-                flows = io.read_flows_from_paths(ctx.options.server_replay)
+                self._load_paths(ctx.options.server_replay)
             except exceptions.FlowReadException as e:
                 raise exceptions.OptionsError(str(e))
-            self.load_flows(flows)
 
     def tick(self):
         if self.stop and not self.final_flow.live:
@@ -7,8 +7,10 @@ The View:
 - Tracks focus within the view
 - Exposes a settings store for flows that automatically expires if the flow is
   removed from the store.
+- Optionally bounds the store, evicting the oldest flows.
 """
 import collections
+import itertools
 import typing
 import os
 
@@ -23,6 +25,8 @@ from mitmproxy import connections
 from mitmproxy import ctx
 from mitmproxy import io
 from mitmproxy import http  # noqa
+from mitmproxy.coretypes import bodystore
+from mitmproxy.utils import human
 
 # The underlying sorted list implementation expects the sort key to be stable
 # for the lifetime of the object. However, if we sort by size, for instance,
@@ -35,6 +39,35 @@ from mitmproxy import http  # noqa
 # when they are updated.
 
 
+class _Record:
+    """
+        What the view keeps for every flow in the store besides its order keys.
+    """
+    __slots__ = ("size", "match")
+
+    def __init__(self) -> None:
+        self.size = 0
+        # The filter, facet key and result of the last filter evaluation.
+        self.match = None  # type: typing.Optional[tuple]
+
+
+class _SortKeys(dict):
+    """
+        The keys of flows in one order. The sorted list of the view looks keys up
+        here directly, which spares it a Python call per key. Missing keys are
+        generated, and kept if the flow is in the store.
+    """
+    def __init__(self, order: "_OrderKey") -> None:
+        super().__init__()
+        self.order = order
+
+    def __missing__(self, f):
+        key = self.order.generate(f)
+        if f.id in self.order.view._store:
+            self[f] = key
+        return key
+
+
 class _OrderKey:
     def __init__(self, view):
         self.view = view
@@ -43,29 +76,17 @@ class _OrderKey:
         pass
 
     def refresh(self, f):
-        k = self._key()
-        old = self.view.settings[f][k]
+        keys = self.view._keys(self)
+        old = keys[f]
         new = self.generate(f)
         if old != new:
             self.view._view.remove(f)
-            self.view.settings[f][k] = new
+            keys[f] = new
             self.view._view.add(f)
             self.view.sig_view_refresh.send(self.view)
 
-    def _key(self):
-        return "_order_%s" % id(self)
-
     def __call__(self, f):
-        if f.id in self.view._store:
-            k = self._key()
-            s = self.view.settings[f]
-            if k in s:
-                return s[k]
-            val = self.generate(f)
-            s[k] = val
-            return val
-        else:
-            return self.generate(f)
+        return self.view._keys(self)[f]
 
 
 class OrderRequestStart(_OrderKey):
@@ -85,12 +106,27 @@ class OrderRequestURL(_OrderKey):
 
 class OrderKeySize(_OrderKey):
     def generate(self, f: http.HTTPFlow) -> int:
-        s = 0
-        if f.request.raw_content:
-            s += len(f.request.raw_content)
-        if f.response and f.response.raw_content:
-            s += len(f.response.raw_content)
-        return s
+        rec = self.view._records.get(f.id)
+        if rec is None:
+            return flow_size(f)
+        return rec.size
+
+
+def _content_size(m) -> int:
+    c = m.data.stored_content
+    if isinstance(c, bodystore.StoredBody):
+        return c.size
+    return len(c) if c else 0
+
+
+def flow_size(f: mitmproxy.flow.Flow) -> int:
+    """
+        The size of the message contents of a flow, without loading bodies that
+        have been moved to disk.
+    """
+    if isinstance(f, http.HTTPFlow):
+        return sum(_content_size(m) for m in (f.request, f.response) if m)
+    return sum(len(m.content) for m in getattr(f, "messages", ()))
 
 
 matchall = flowfilter.parse(".")
@@ -108,21 +144,56 @@ class View(collections.Sequence):
     def __init__(self):
         super().__init__()
         self._store = collections.OrderedDict()
+        self._records = {}  # type: typing.Dict[str, _Record]
+        # Large bodies of flows in the store are kept in a body store, which shares
+        # equal bodies and moves bodies to disk. _interned has the bodies that every
+        # flow holds a reference to.
+        self.bodies = bodystore.BodyStore(dedup=False)
+        self._interned = {}  # type: typing.Dict[str, typing.List[bodystore.StoredBody]]
+        # Flows in the store by their keys in flowfilter.INDEXES, which allows filters
+        # to skip most flows. _index_keys has the current keys of every flow.
+        self._indexes = {
+            name: {} for name in flowfilter.INDEXES
+        }  # type: typing.Dict[str, typing.Dict[typing.Any, typing.Dict[str, mitmproxy.flow.Flow]]]
+        self._index_keys = {}  # type: typing.Dict[str, tuple]
         self.filter = matchall
+        self._filter_facets = sorted(matchall.facets)
+        # Stores larger than refilter_chunk are refiltered in chunks of this many
+        # flows per tick, so that the master stays responsive. _refiltering has
+        # the flows that are left to check.
+        self.refilter_chunk = 5000
+        self._refiltering = None  # type: typing.Optional[typing.Iterator[mitmproxy.flow.Flow]]
         # Should we show only marked flows?
         self.show_marked = False
 
-        self.default_order = OrderRequestStart(self)
+        # Limits of the store. When they are exceeded, the oldest flows are evicted,
+        # except for marked and intercepted flows if keep_marked and keep_intercepted
+        # are set. Flows are evicted from the front of _evictable. Kept flows are
+        # moved to _kept when they reach the front, and back once an update shows
+        # that they may be evicted, so every flow is skipped at most once.
+        self.max_flows = 0
+        self.max_bytes = None  # type: typing.Optional[int]
+        self.keep_marked = True
+        self.keep_intercepted = True
+        self.archive = None  # type: typing.Optional[io.FlowWriter]
+        self.store_size = 0
+        self._evictable = collections.OrderedDict()  # type: typing.Dict[str, mitmproxy.flow.Flow]
+        self._kept = collections.OrderedDict()  # type: typing.Dict[str, mitmproxy.flow.Flow]
+
         self.orders = dict(
             time = OrderRequestStart(self), method = OrderRequestMethod(self),
             url = OrderRequestURL(self), size = OrderKeySize(self),
         )
+        # The default order shares its keys with the time order.
+        self.default_order = self.orders["time"]
         self.order_key = self.default_order
         self.order_reversed = False
         self.focus_follow = False
 
+        # The keys of flows in the store in every order that has been used.
+        self._order_keys = {}  # type: typing.Dict[_OrderKey, _SortKeys]
         self._view = sortedcontainers.SortedListWithKey(
-            key = self.order_key
+            key = self._keys(self.order_key).__getitem__
         )
 
         # The sig_view* signals broadcast events that affect the view. That is,
@@ -159,6 +230,60 @@ class View(collections.Sequence):
             "console_focus_follow", bool, False,
             "Focus follows new flows."
         )
+        loader.add_option(
+            "view_refilter_chunk", int, 5000,
+            """
+            Check at most this many flows at once when the view filter changes.
+            Larger stores are filtered incrementally. 0 means no limit.
+            """
+        )
+        loader.add_option(
+            "view_max_flows", int, 0,
+            "Keep at most this many flows, evicting the oldest ones. 0 means no limit."
+        )
+        loader.add_option(
+            "view_max_bytes", typing.Optional[str], None,
+            """
+            Keep flows with at most this much message content, e.g. 512m, evicting
+            the oldest ones.
+            """
+        )
+        loader.add_option(
+            "view_keep_marked", bool, True,
+            "Never evict marked flows."
+        )
+        loader.add_option(
+            "view_keep_intercepted", bool, True,
+            "Never evict intercepted flows."
+        )
+        loader.add_option(
+            "view_archive", typing.Optional[str], None,
+            """
+            Write evicted flows to this file. Prefix the path with + to append to
+            an existing file.
+            """
+        )
+        loader.add_option(
+            "view_dedup_bodies", bool, False,
+            """
+            Keep a single copy of equal large message bodies of flows in the view.
+            Every large body is hashed to find its copies.
+            """
+        )
+        loader.add_option(
+            "view_body_spill_size", typing.Optional[str], None,
+            """
+            Move message bodies larger than this to a temporary file, e.g. 1m.
+            They are read back whenever they are accessed.
+            """
+        )
+        loader.add_option(
+            "view_body_memory", typing.Optional[str], None,
+            """
+            Keep at most this much message body data in memory, e.g. 512m. The
+            least recently used bodies are moved to a temporary file.
+            """
+        )
 
     def store_count(self):
         return len(self._store)
@@ -200,21 +325,185 @@ class View(collections.Sequence):
     def __contains__(self, f: typing.Any) -> bool:
         return self._view.__contains__(f)
 
-    def _order_key_name(self):
-        return "_order_%s" % id(self.order_key)
+    def _keys(self, order: _OrderKey) -> _SortKeys:
+        keys = self._order_keys.get(order)
+        if keys is None:
+            keys = self._order_keys[order] = _SortKeys(order)
+        return keys
 
     def _base_add(self, f):
-        self.settings[f][self._order_key_name()] = self.order_key(f)
         self._view.add(f)
 
+    def _base_remove(self, f) -> int:
+        # We return the index because multiple flows may have the same sorting key,
+        # and we cannot reconstruct the index from that.
+        idx = self._view.index(f)
+        self._view.remove(f)
+        return idx
+
+    def _intern(self, f):
+        """
+            Move the bodies of a flow to the body store. Bodies that are already
+            stored are kept, bodies that the flow no longer holds are released.
+        """
+        held = self._interned.pop(f.id, [])
+        if self.bodies.active and isinstance(f, http.HTTPFlow):
+            interned = []
+            for m in (f.request, f.response):
+                if not m:
+                    continue
+                stored = m.data.stored_content
+                if isinstance(stored, bodystore.StoredBody) and stored in held:
+                    held.remove(stored)
+                elif stored is not None:
+                    stored = m.data.stored_content = self.bodies.add(m.data.content)
+                if isinstance(stored, bodystore.StoredBody):
+                    interned.append(stored)
+            self._interned[f.id] = interned
+        for sb in held:
+            self.bodies.release(sb)
+
+    def _release(self, f):
+        for body in self._interned.pop(f.id, ()):
+            self.bodies.release(body)
+
+    def _index(self, f):
+        keys = flowfilter.index_keys(f)
+        old = self._index_keys.get(f.id)
+        if keys == old:
+            return
+        for i, name in enumerate(flowfilter.INDEXES):
+            key = keys[i]
+            if old is not None:
+                if old[i] == key:
+                    continue
+                self._unindex_key(name, old[i], f)
+            index = self._indexes[name]
+            flows = index.get(key)
+            if flows is None:
+                flows = index[key] = {}
+            flows[f.id] = f
+        self._index_keys[f.id] = keys
+
+    def _unindex(self, f):
+        keys = self._index_keys.pop(f.id, None)
+        if keys is not None:
+            for name, key in zip(flowfilter.INDEXES, keys):
+                self._unindex_key(name, key, f)
+
+    def _unindex_key(self, name, key, f):
+        flows = self._indexes[name][key]
+        del flows[f.id]
+        if not flows:
+            del self._indexes[name][key]
+
+    def _resize(self, rec, f):
+        size = flow_size(f)
+        self.store_size += size - rec.size
+        rec.size = size
+
+    def _keep(self, f) -> bool:
+        return (self.keep_marked and f.marked) or (self.keep_intercepted and f.intercepted)
+
+    def _over_limit(self) -> bool:
+        return bool(
+            (self.max_flows and len(self._store) > self.max_flows) or
+            (self.max_bytes is not None and self.store_size > self.max_bytes)
+        )
+
+    def _evict(self):
+        """
+            Evict the oldest flows until the store is within its limits.
+        """
+        archived = False
+        while self._evictable and self._over_limit():
+            fid, f = self._evictable.popitem(last=False)  # type: ignore
+            if self._keep(f):
+                self._kept[fid] = f
+                continue
+            if self.archive:
+                self.archive.add(f)
+                archived = True
+            if f.intercepted and f.killable:
+                f.kill()
+            self._remove(f)
+        if archived:
+            self.archive.fo.flush()
+
+    def _requeue(self, f):
+        """
+            Make a kept flow evictable again, as the oldest flow.
+        """
+        if f.id in self._kept and not self._keep(f):
+            del self._kept[f.id]
+            self._evictable[f.id] = f
+            self._evictable.move_to_end(f.id, last=False)  # type: ignore
+
+    def _candidates(self, flt) -> typing.Optional[typing.Set[str]]:
+        """
+            The ids of the flows in the store that may match a filter, or None if
+            all flows have to be checked.
+        """
+        candidates = getattr(flt, "candidates", None)
+        return candidates(self._indexes) if candidates else None
+
+    def _match(self, f) -> bool:
+        """
+            Evaluate the filter for a flow in the store. The result is reused until
+            one of the facets of the flow that the filter looks at changes.
+        """
+        key = flowfilter.facet_key(self._filter_facets, f)
+        rec = self._records[f.id]
+        cached = rec.match
+        if cached and cached[0] is self.filter and cached[1] == key:
+            return cached[2]
+        match = bool(self.filter(f))
+        rec.match = (self.filter, key, match)
+        return match
+
     def _refilter(self):
+        """
+            Rebuild the view from the store. Only the first chunk of flows is
+            checked right away, the remaining ones are checked on tick. Refiltering
+            again cancels a refilter that is still in progress.
+        """
         self._view.clear()
-        for i in self._store.values():
+        ids = self._candidates(self.filter)
+        self._refiltering = iter([
+            i for i in self._store.values()
+            if ids is None or i.id in ids
+        ])
+        self._refilter_step(announce=False)
+        self.sig_view_refresh.send(self)
+
+    def _refilter_step(self, announce=True):
+        """
+            Check the next chunk of flows of a refilter in progress.
+        """
+        if self._refiltering is None:
+            return
+        n = 0
+        for i in itertools.islice(self._refiltering, self.refilter_chunk or None):
+            n += 1
+            # Flows may have been removed, or added to the view by an update, since
+            # the refilter started.
+            if i.id not in self._store or i in self._view:
+                continue
             if self.show_marked and not i.marked:
                 continue
-            if self.filter(i):
+            if self._match(i):
                 self._base_add(i)
-        self.sig_view_refresh.send(self)
+                if announce:
+                    self.sig_view_add.send(self, flow=i)
+        if not self.refilter_chunk or n < self.refilter_chunk:
+            self._refiltering = None
+
+    @property
+    def refiltering(self) -> bool:
+        """
+            Whether a refilter is still in progress.
+        """
+        return self._refiltering is not None
 
     # API
     @command.command("view.focus.next")
@@ -254,12 +543,17 @@ class View(collections.Sequence):
         self.order_reversed = value
         self.sig_view_refresh.send(self)
 
-    def set_order(self, order_key: typing.Callable):
+    def set_order(self, order_key: _OrderKey):
         """
             Sets the current view order.
         """
         self.order_key = order_key
-        newview = sortedcontainers.SortedListWithKey(key=order_key)
+        # Keys are kept for every order that has been used, so only the keys of
+        # flows that were added or updated since have to be generated.
+        keys = self._keys(order_key)
+        for f in set(self._view).difference(keys):
+            keys[f] = order_key.generate(f)
+        newview = sortedcontainers.SortedListWithKey(key=keys.__getitem__)
         newview.update(self._view)
         self._view = newview
 
@@ -268,13 +562,28 @@ class View(collections.Sequence):
             Sets the current view filter.
         """
         self.filter = flt or matchall
+        self._filter_facets = sorted(getattr(self.filter, "facets", flowfilter.ALL_FACETS))
         self._refilter()
 
     def clear(self) -> None:
         """
             Clears both the store and view.
         """
+        for f in self._store.values():
+            self._close_spill(f)
         self._store.clear()
+        self._refiltering = None
+        self._records.clear()
+        self._evictable.clear()
+        self._kept.clear()
+        self.store_size = 0
+        self._interned.clear()
+        for index in self._indexes.values():
+            index.clear()
+        self._index_keys.clear()
+        for keys in self._order_keys.values():
+            keys.clear()
+        self.bodies.clear()
         self._view.clear()
         self.sig_view_refresh.send(self)
         self.sig_store_refresh.send(self)
@@ -286,6 +595,7 @@ class View(collections.Sequence):
         for flow in self._store.copy().values():
             if not flow.marked:
                 self._store.pop(flow.id)
+                self._forget(flow)
 
         self._refilter()
         self.sig_store_refresh.send(self)
@@ -298,11 +608,17 @@ class View(collections.Sequence):
         for f in flows:
             if f.id not in self._store:
                 self._store[f.id] = f
-                if self.filter(f):
+                rec = self._records[f.id] = _Record()
+                self._evictable[f.id] = f
+                self._intern(f)
+                self._index(f)
+                self._resize(rec, f)
+                if self._match(f):
                     self._base_add(f)
                     if self.focus_follow:
                         self.focus.flow = f
                     self.sig_view_add.send(self, flow=f)
+        self._evict()
 
     def get_by_id(self, flow_id: str) -> typing.Optional[mitmproxy.flow.Flow]:
         """
@@ -357,12 +673,11 @@ class View(collections.Sequence):
         """
         spath = os.path.expanduser(path)
         try:
-            with open(spath, "rb") as f:
-                for i in io.FlowReader(f).stream():
-                    # Do this to get a new ID, so we can load the same file N times and
-                    # get new flows each time. It would be more efficient to just have a
-                    # .newid() method or something.
-                    self.add([i.copy()])
+            for i in io.read_flows_parallel([spath], ctx.options.read_workers):
+                # Do this to get a new ID, so we can load the same file N times and
+                # get new flows each time. It would be more efficient to just have a
+                # .newid() method or something.
+                self.add([i.copy()])
         except IOError as e:
             ctx.log.error(e.strerror)
             return
@@ -405,17 +720,41 @@ class View(collections.Sequence):
             if f.id in self._store:
                 if f.killable:
                     f.kill()
-                if f in self._view:
-                    # We manually pass the index here because multiple flows may have the same
-                    # sorting key, and we cannot reconstruct the index from that.
-                    idx = self._view.index(f)
-                    self._view.remove(f)
-                    self.sig_view_remove.send(self, flow=f, index=idx)
-                del self._store[f.id]
-                self.sig_store_remove.send(self, flow=f)
+                self._remove(f)
         if len(flows) > 1:
             ctx.log.alert("Removed %s flows" % len(flows))
 
+    def _remove(self, f):
+        if f in self._view:
+            idx = self._base_remove(f)
+            self.sig_view_remove.send(self, flow=f, index=idx)
+        del self._store[f.id]
+        self._forget(f)
+        self.sig_store_remove.send(self, flow=f)
+
+    def _forget(self, f):
+        """
+            Drop the bookkeeping for a flow that has been removed from the store.
+        """
+        self._release(f)
+        self._unindex(f)
+        self._evictable.pop(f.id, None)
+        self._kept.pop(f.id, None)
+        rec = self._records.pop(f.id, None)
+        if rec:
+            self.store_size -= rec.size
+        for keys in self._order_keys.values():
+            keys.pop(f, None)
+        self._close_spill(f)
+
+    def _close_spill(self, f):
+        # The proxy may still spill messages of a live flow, its file is left to the
+        # garbage collector.
+        spill = getattr(f, "spill", None)
+        if spill is not None and not f.live:
+            spill.close()
+            f.spill = None
+
     @command.command("view.resolve")
     def resolve(self, spec: str) -> typing.Sequence[mitmproxy.flow.Flow]:
         """
@@ -437,7 +776,11 @@ class View(collections.Sequence):
             filt = flowfilter.parse(spec)
             if not filt:
                 raise exceptions.CommandError("Invalid flow filter: %s" % spec)
-            return [i for i in self._store.values() if filt(i)]
+            ids = self._candidates(filt)
+            return [
+                i for i in self._store.values()
+                if (ids is None or i.id in ids) and filt(i)
+            ]
 
     @command.command("view.create")
     def create(self, method: str, url: str) -> None:
@@ -473,6 +816,69 @@ class View(collections.Sequence):
             self.set_reversed(ctx.options.view_order_reversed)
         if "console_focus_follow" in updated:
             self.focus_follow = ctx.options.console_focus_follow
+        if "view_refilter_chunk" in updated:
+            if ctx.options.view_refilter_chunk < 0:
+                raise exceptions.OptionsError("view_refilter_chunk must not be negative.")
+            self.refilter_chunk = ctx.options.view_refilter_chunk
+        if "view_dedup_bodies" in updated:
+            self.bodies.dedup = ctx.options.view_dedup_bodies
+        if "view_body_spill_size" in updated:
+            try:
+                self.bodies.spill_size = human.parse_size(ctx.options.view_body_spill_size)
+            except ValueError:
+                raise exceptions.OptionsError(
+                    "Invalid body spill size specification: %s" % ctx.options.view_body_spill_size
+                )
+        if "view_body_memory" in updated:
+            try:
+                self.bodies.memory_limit = human.parse_size(ctx.options.view_body_memory)
+            except ValueError:
+                raise exceptions.OptionsError(
+                    "Invalid body memory specification: %s" % ctx.options.view_body_memory
+                )
+            self.bodies.trim()
+        if "view_max_flows" in updated:
+            if ctx.options.view_max_flows < 0:
+                raise exceptions.OptionsError("view_max_flows must not be negative.")
+            self.max_flows = ctx.options.view_max_flows
+        if "view_max_bytes" in updated:
+            try:
+                self.max_bytes = human.parse_size(ctx.options.view_max_bytes)
+            except ValueError:
+                raise exceptions.OptionsError(
+                    "Invalid view size specification: %s" % ctx.options.view_max_bytes
+                )
+        if "view_keep_marked" in updated or "view_keep_intercepted" in updated:
+            self.keep_marked = ctx.options.view_keep_marked
+            self.keep_intercepted = ctx.options.view_keep_intercepted
+            for f in reversed(list(self._kept.values())):
+                self._requeue(f)
+        if "view_archive" in updated:
+            self.close_archive()
+            if ctx.options.view_archive:
+                path = ctx.options.view_archive
+                mode = "wb"
+                if path.startswith("+"):
+                    path, mode = path[1:], "ab"
+                try:
+                    fo = open(os.path.expanduser(path), mode)
+                except IOError as e:
+                    raise exceptions.OptionsError(
+                        "Can not open archive file: %s" % e.strerror
+                    )
+                self.archive = io.FlowWriter(fo)
+        self._evict()
+
+    def close_archive(self):
+        if self.archive:
+            self.archive.close()
+            self.archive = None
+
+    def done(self):
+        self.close_archive()
+
+    def tick(self):
+        self._refilter_step()
 
     def request(self, f):
         self.add([f])
@@ -498,7 +904,17 @@ class View(collections.Sequence):
         """
         for f in flows:
             if f.id in self._store:
-                if self.filter(f):
+                rec = self._records[f.id]
+                # Keys in orders other than the current one, and keys of flows
+                # that are not in the view, are generated again when they are needed.
+                for order, keys in self._order_keys.items():
+                    if order is not self.order_key or f not in self._view:
+                        keys.pop(f, None)
+                self._intern(f)
+                self._index(f)
+                self._resize(rec, f)
+                self._requeue(f)
+                if self._match(f):
                     if f not in self._view:
                         self._base_add(f)
                         if self.focus_follow:
@@ -511,14 +927,10 @@ class View(collections.Sequence):
                         # this happens, and re-fresh the item.
                         self.order_key.refresh(f)
                         self.sig_view_update.send(self, flow=f)
-                else:
-                    try:
-                        idx = self._view.index(f)
-                    except ValueError:
-                        pass  # The value was not in the view
-                    else:
-                        self._view.remove(f)
-                        self.sig_view_remove.send(self, flow=f, index=idx)
+                elif f in self._view:
+                    idx = self._base_remove(f)
+                    self.sig_view_remove.send(self, flow=f, index=idx)
+        self._evict()
 
 
 class Focus:
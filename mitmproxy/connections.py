@@ -30,6 +30,10 @@ class ClientConnection(tcp.BaseHandler, stateobject.StateObject):
         tls_version: TLS version
         tls_extensions: TLS ClientHello extensions
     """
+    __slots__ = (
+        "id", "mitmcert", "timestamp_start", "timestamp_end", "timestamp_tls_setup", "sni",
+        "cipher_name", "alpn_proto_negotiated", "tls_version", "tls_extensions", "reply",
+    )
 
     def __init__(self, client_connection, address, server):
         # Eventually, this object is restored from state. We don't have a
@@ -180,6 +184,10 @@ class ServerConnection(tcp.TCPClient, stateobject.StateObject):
         timestamp_tls_setup: TLS established timestamp
         timestamp_end: Connection end timestamp
     """
+    __slots__ = (
+        "id", "alpn_proto_negotiated", "tls_version", "via", "timestamp_start", "timestamp_end",
+        "timestamp_tcp_setup", "timestamp_tls_setup", "reply",
+    )
 
     def __init__(self, address, source_address=None, spoof_source_address=None):
         tcp.TCPClient.__init__(self, address, source_address, spoof_source_address)
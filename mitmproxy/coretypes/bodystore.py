@@ -0,0 +1,162 @@
+import collections
+import hashlib
+import tempfile
+import threading
+import typing
+
+
+class StoredBody:
+    """
+        A body in a BodyStore. Messages hold it in place of their content, and
+        read the content with load().
+    """
+    __slots__ = ("store", "digest", "data", "file", "offset", "size", "refs")
+
+    def __init__(self, store: "BodyStore", digest: typing.Optional[bytes], data: bytes) -> None:
+        self.store = store
+        self.digest = digest
+        # The body, or None once it has been moved to file.
+        self.data = data  # type: typing.Optional[bytes]
+        self.file = None  # type: typing.Optional[typing.IO]
+        self.offset = 0
+        self.size = len(data)
+        self.refs = 1
+
+    def load(self) -> bytes:
+        return self.store.load(self)
+
+
+class BodyStore:
+    """
+        A reference-counted store of message bodies.
+
+        Messages hold the StoredBody returned by add() in place of their content (see
+        mitmproxy.net.http.message.MessageData), which allows the store to
+
+        - keep equal bodies once, addressing them by the digest of their content, and
+        - move bodies to a temporary file: right away if they are larger than
+          spill_size, and least recently used first once the bodies in memory exceed
+          memory_limit. Moved bodies are read back from the file on every access.
+
+        Every add() must be matched by a release() of the returned body. Bodies smaller
+        than min_size are passed through unchanged, as storing them does not pay off.
+        Space in the temporary file is only reclaimed by clear().
+    """
+
+    def __init__(
+        self,
+        min_size: int = 1024,
+        dedup: bool = True,
+        spill_size: typing.Optional[int] = None,
+        memory_limit: typing.Optional[int] = None,
+    ) -> None:
+        self.min_size = min_size
+        self.dedup = dedup
+        self.spill_size = spill_size
+        self.memory_limit = memory_limit
+        self.lock = threading.RLock()
+        self._bodies = {}  # type: typing.Dict[bytes, StoredBody]
+        # Bodies in memory, least recently used first.
+        self._memory = collections.OrderedDict()  # type: typing.Dict[StoredBody, None]
+        self.file = None  # type: typing.Optional[typing.IO]
+        self.count = 0
+        # Bytes of bodies in memory and on disk, and bytes that did not have to be
+        # stored thanks to deduplication.
+        self.size = 0
+        self.spilled = 0
+        self.saved = 0
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def active(self) -> bool:
+        """
+            Whether adding bodies to the store has any effect.
+        """
+        return self.dedup or self.spill_size is not None or self.memory_limit is not None
+
+    def add(self, body: typing.Optional[bytes]) -> typing.Union[None, bytes, StoredBody]:
+        if body is None or len(body) < self.min_size:
+            return body
+        digest = hashlib.sha256(body).digest() if self.dedup else None
+        with self.lock:
+            if digest in self._bodies:
+                sb = self._bodies[digest]
+                sb.refs += 1
+                self.saved += sb.size
+                return sb
+            sb = StoredBody(self, digest, body)
+            self.count += 1
+            if digest:
+                self._bodies[digest] = sb
+            if self.spill_size is not None and sb.size > self.spill_size:
+                self._spill(sb)
+            else:
+                self._memory[sb] = None
+                self.size += sb.size
+                self.trim()
+            return sb
+
+    def release(self, sb: typing.Union[None, bytes, StoredBody]) -> None:
+        if not isinstance(sb, StoredBody):
+            return
+        with self.lock:
+            if sb.refs <= 0:
+                raise KeyError("Body is not in the store.")
+            sb.refs -= 1
+            if sb.refs:
+                self.saved -= sb.size
+                return
+            if self._bodies.get(sb.digest) is sb:
+                del self._bodies[sb.digest]
+            self.count -= 1
+            if sb in self._memory:
+                del self._memory[sb]
+                self.size -= sb.size
+            else:
+                self.spilled -= sb.size
+
+    def load(self, sb: StoredBody) -> bytes:
+        data = sb.data
+        if data is not None:
+            with self.lock:
+                if sb in self._memory:
+                    self._memory.move_to_end(sb)  # type: ignore
+            return data
+        with self.lock:
+            sb.file.seek(sb.offset)
+            return sb.file.read(sb.size)
+
+    def _spill(self, sb: StoredBody) -> None:
+        if not self.file:
+            self.file = tempfile.TemporaryFile()
+        self.file.seek(0, 2)
+        sb.offset = self.file.tell()
+        self.file.write(sb.data)
+        sb.file = self.file
+        sb.data = None
+        self.spilled += sb.size
+
+    def trim(self) -> None:
+        """
+            Move the least recently used bodies to disk until memory_limit is met.
+        """
+        with self.lock:
+            while self.memory_limit is not None and self.size > self.memory_limit and self._memory:
+                sb, _ = self._memory.popitem(last=False)  # type: ignore
+                self.size -= sb.size
+                self._spill(sb)
+
+    def clear(self) -> None:
+        """
+            Forget all bodies. Bodies that are still held elsewhere remain readable.
+        """
+        with self.lock:
+            self._bodies.clear()
+            self._memory.clear()
+            self.file = None
+            self.count = 0
+            self.size = 0
+            self.spilled = 0
+            self.saved = 0
@@ -1,4 +1,5 @@
 import abc
+import typing  # noqa
 import uuid
 
 
@@ -6,6 +7,7 @@ class Serializable(metaclass=abc.ABCMeta):
     """
     Abstract Base Class that defines an API to save an object's state and restore it later on.
     """
+    __slots__ = ()  # type: typing.Tuple[str, ...]
 
     @classmethod
     @abc.abstractmethod
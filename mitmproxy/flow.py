@@ -57,7 +57,14 @@ class Flow(stateobject.StateObject):
     """
     A Flow is a collection of objects representing a single transaction.
     This class is usually subclassed for each protocol, e.g. HTTPFlow.
+
+    Flows keep their attributes in slots. Addons can keep data of their own in
+    metadata.
     """
+    __slots__ = (
+        "type", "id", "client_conn", "server_conn", "live", "error", "intercepted",
+        "_backup", "reply", "marked", "metadata", "__weakref__",
+    )
 
     def __init__(
             self,
@@ -74,7 +81,7 @@ class Flow(stateobject.StateObject):
 
         self.error = None  # type: typing.Optional[Error]
         self.intercepted = False  # type: bool
-        self._backup = None  # type: typing.Optional[Flow]
+        self._backup = None  # type: typing.Optional[typing.Dict[str, typing.Any]]
         self.reply = None  # type: typing.Optional[controller.Reply]
         self.marked = False  # type: bool
         self.metadata = dict()  # type: typing.Dict[str, typing.Any]
@@ -93,15 +100,17 @@ class Flow(stateobject.StateObject):
     def get_state(self):
         d = super().get_state()
         d.update(version=version.FLOW_FORMAT_VERSION)
-        if self._backup and self._backup != d:
-            d.update(backup=self._backup)
+        if self.modified():
+            d.update(backup=self._backup_state())
         return d
 
     def set_state(self, state):
         state = state.copy()
         state.pop("version")
         if "backup" in state:
-            self._backup = state.pop("backup")
+            backup = state.pop("backup").copy()
+            backup.pop("version", None)
+            self._backup = backup
         super().set_state(state)
 
     @classmethod
@@ -117,12 +126,49 @@ class Flow(stateobject.StateObject):
             f.reply = controller.DummyReply()
         return f
 
+    def _snapshot(self, attr: str, cls: typing.Any) -> typing.Any:
+        """
+            The backup of a state attribute: a snapshot of connections and errors,
+            the state of containers and other serializable values, and any other
+            value as it is.
+        """
+        val = getattr(self, attr)
+        if isinstance(val, stateobject.StateObject):
+            return stateobject.Snapshot(val)
+        elif isinstance(val, (list, dict)) or hasattr(val, "get_state"):
+            return stateobject.get_state(cls, val)
+        return val
+
+    def _unchanged(self, attr: str, cls: typing.Any, snapshot: typing.Any) -> bool:
+        """
+            Does a state attribute still match its backup?
+        """
+        val = getattr(self, attr)
+        if isinstance(snapshot, stateobject.Snapshot):
+            return snapshot.matches(val)
+        elif isinstance(val, (list, dict)) or hasattr(val, "get_state"):
+            return snapshot == stateobject.get_state(cls, val)
+        return snapshot == val
+
+    def _backup_state(self):
+        state = {
+            attr: snapshot.get_state() if hasattr(snapshot, "get_state") else snapshot
+            for attr, snapshot in self._backup.items()
+        }
+        state.update(version=version.FLOW_FORMAT_VERSION)
+        return state
+
     def modified(self):
         """
             Has this Flow been modified?
         """
         if self._backup:
-            return self._backup != self.get_state()
+            # Backups loaded from older dumps may lack attributes, which counts
+            # as a modification.
+            return not all(
+                attr in self._backup and self._unchanged(attr, cls, self._backup[attr])
+                for attr, cls in self._stateobject_attributes.items()
+            )
         else:
             return False
 
@@ -132,14 +178,17 @@ class Flow(stateobject.StateObject):
             call to .revert().
         """
         if not self._backup:
-            self._backup = self.get_state()
+            self._backup = {
+                attr: self._snapshot(attr, cls)
+                for attr, cls in self._stateobject_attributes.items()
+            }
 
     def revert(self):
         """
             Revert to the last backed up state.
         """
         if self._backup:
-            self.set_state(self._backup)
+            self.set_state(self._backup_state())
             self._backup = None
 
     @property
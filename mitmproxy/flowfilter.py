@@ -30,11 +30,26 @@
         ~u rex      URL
         ~c CODE     Response code.
         rex         Equivalent to ~u rex
+
+    Expressions are compiled into closures when they are first evaluated. The
+    flow type checks of the operands of & are done once, and the operands of
+    & and | are evaluated cheapest first, so that e.g. body expressions only
+    run when the header and URL expressions did not decide the result yet.
+    Body expressions of the same kind that are operands of the same & or | are
+    searched together, decoding every body only once.
+
+    Every filter declares the facets of a flow it looks at (see facet_key), so
+    that results can be reused for as long as these facets do not change.
+    Filters on the properties in INDEXES can also find matching flows in an
+    index of these properties, see _Token.candidates.
 """
 
+import collections
 import re
+import string
 import sys
 import functools
+import itertools
 
 from mitmproxy import http
 from mitmproxy import websocket
@@ -43,8 +58,7 @@ from mitmproxy import flow
 
 from mitmproxy.utils import strutils
 
-import pyparsing as pp
-from typing import Callable, Sequence, Type  # noqa
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Sequence, Set, Tuple, Type  # noqa
 
 
 def only(*types):
@@ -54,11 +68,197 @@ def only(*types):
             if isinstance(flow, types):
                 return fn(self, flow)
             return False
+        # Allows compile() to hoist the check.
+        filter_types.types = types  # type: ignore
         return filter_types
     return decorator
 
 
+def _guard(types, fn):
+    types = tuple(types)
+    return lambda f: isinstance(f, types) and fn(f)
+
+
+def _all(fns):
+    if len(fns) == 1:
+        return fns[0]
+    if len(fns) == 2:
+        a, b = fns
+        return lambda f: bool(a(f) and b(f))
+
+    def match_all(f):
+        for fn in fns:
+            if not fn(f):
+                return False
+        return True
+    return match_all
+
+
+def _any(fns):
+    if len(fns) == 1:
+        return fns[0]
+    if len(fns) == 2:
+        a, b = fns
+        return lambda f: bool(a(f) or b(f))
+
+    def match_any(f):
+        for fn in fns:
+            if fn(f):
+                return True
+        return False
+    return match_any
+
+
+REQUEST_HEAD = "request_head"
+REQUEST_BODY = "request_body"
+RESPONSE_HEAD = "response_head"
+RESPONSE_BODY = "response_body"
+MESSAGES = "messages"
+CONNECTIONS = "connections"
+ERROR = "error"
+MARKED = "marked"
+
+
+def _request(f):
+    if isinstance(f, websocket.WebSocketFlow):
+        f = f.handshake_flow
+    return getattr(f, "request", None)
+
+
+def _head(m):
+    if not m:
+        return None
+    d = m.data
+    if isinstance(m, http.HTTPRequest):
+        return d.first_line_format, d.method, d.scheme, d.host, d.port, d.path, d.headers.fields
+    return d.status_code, d.headers.fields
+
+
+def _body(m):
+    if not m:
+        return None
+    # The content-encoding header determines the decoded body.
+    return m.data.stored_content, m.data.headers.fields
+
+
+def _messages(f):
+    messages = getattr(f, "messages", None)
+    spilled = len(getattr(f, "spill", None) or ())
+    if not messages and not spilled:
+        return None
+    # Messages can be edited in place, so their contents are part of the key. Comparing
+    # the key is cheap as long as the contents are the same objects.
+    return spilled, tuple((m.from_client, m.content) for m in messages)
+
+
+def _address(conn):
+    return conn.address if conn else None
+
+
+_FACETS = {
+    REQUEST_HEAD: lambda f: _head(_request(f)),
+    REQUEST_BODY: lambda f: _body(_request(f)),
+    RESPONSE_HEAD: lambda f: _head(getattr(f, "response", None)),
+    RESPONSE_BODY: lambda f: _body(getattr(f, "response", None)),
+    MESSAGES: _messages,
+    CONNECTIONS: lambda f: (_address(f.client_conn), _address(f.server_conn)),
+    ERROR: lambda f: f.error,
+    MARKED: lambda f: f.marked,
+}
+ALL_FACETS = frozenset(_FACETS)
+BODY_FACETS = frozenset([REQUEST_BODY, RESPONSE_BODY, MESSAGES])
+
+
+def facet_key(facets: Sequence[str], f: flow.Flow) -> tuple:
+    """
+        Describe the given facets of a flow. Filters give the same result for
+        flows with equal keys for the facets they look at.
+    """
+    return tuple(_FACETS[i](f) for i in facets)
+
+
+def _header_values(m, *names):
+    """
+        The values of the headers with the given lowercase names, one tuple per name.
+    """
+    values = [()] * len(names)  # type: List[tuple]
+    for k, v in m.headers.fields:
+        k = k.lower()
+        if k in names:
+            i = names.index(k)
+            values[i] += (v,)
+    return values
+
+
+def _host(r):
+    # Everything that host and pretty_host are derived from.
+    if not r:
+        return None
+    return (r.data.host, r.data.scheme, r.data.port) + tuple(_header_values(r, b"host", b":authority"))
+
+
+# Flow properties to index flows by. A filter with an index gives the same result
+# for all flows with the same key in its index.
+INDEXES = ("type", "host", "method", "status_code", "content_type", "marked")
+
+
+def index_keys(f: flow.Flow) -> tuple:
+    """
+        The keys of a flow for INDEXES, in order.
+    """
+    if not isinstance(f, http.HTTPFlow):
+        return type(f), _host(_request(f)), None, None, None, f.marked
+    req = f.request.data  # type: Any
+    hosts, authorities, content_types = _header_values(f.request, b"host", b":authority", b"content-type")
+    return (
+        http.HTTPFlow,
+        (req.host, req.scheme, req.port, hosts, authorities),
+        req.method,
+        f.response.status_code if f.response else 0,
+        (content_types, _header_values(f.response, b"content-type")[0] if f.response else None),
+        f.marked,
+    )
+
+
 class _Token:
+    # Relative cost of evaluating the filter, used to order the operands of & and |.
+    cost = 1
+    # The facets of a flow the filter looks at.
+    facets = ALL_FACETS  # type: FrozenSet[str]
+    # The name of the index in INDEXES the filter can be answered from.
+    index = None  # type: Optional[str]
+
+    @property
+    def reads_body(self) -> bool:
+        return bool(self.facets & BODY_FACETS)
+
+    def candidates(self, indexes: Dict[str, Dict[Any, Dict[str, flow.Flow]]]) -> Optional[Set[str]]:
+        """
+            Find the flows that may match the filter. indexes maps the names in
+            INDEXES to {key: {flow id: flow}}.
+
+            Returns the ids of the flows, or None if the indexes do not help.
+        """
+        if self.index is None:
+            return None
+        ids = set()  # type: Set[str]
+        for flows in indexes[self.index].values():
+            # Evaluating a single flow decides for all flows with this key.
+            if flows and self(next(iter(flows.values()))):  # type: ignore
+                ids.update(flows)
+        return ids
+
+    def compile(self):
+        """
+            Returns a (types, cost, fn) tuple: the flow types the filter can match,
+            or None for all types, the estimated cost of evaluating the filter, and
+            a function that evaluates it for flows of these types.
+        """
+        call = type(self).__call__
+        types = getattr(call, "types", None)
+        if types is None:
+            return None, self.cost, self
+        return frozenset(types), self.cost, call.__wrapped__.__get__(self, type(self))
 
     def dump(self, indent=0, fp=sys.stdout):
         print("{spacing}{name}{expr}".format(
@@ -72,14 +272,11 @@ class _Action(_Token):
     code = None  # type: str
     help = None  # type: str
 
-    @classmethod
-    def make(klass, s, loc, toks):
-        return klass(*toks[1:])
-
 
 class FErr(_Action):
     code = "e"
     help = "Match error"
+    facets = frozenset([ERROR])
 
     def __call__(self, f):
         return True if f.error else False
@@ -88,6 +285,8 @@ class FErr(_Action):
 class FMarked(_Action):
     code = "marked"
     help = "Match marked flows"
+    facets = frozenset([MARKED])
+    index = "marked"
 
     def __call__(self, f):
         return f.marked
@@ -96,6 +295,8 @@ class FMarked(_Action):
 class FHTTP(_Action):
     code = "http"
     help = "Match HTTP flows"
+    facets = frozenset()  # type: FrozenSet[str]
+    index = "type"
 
     @only(http.HTTPFlow)
     def __call__(self, f):
@@ -105,6 +306,8 @@ class FHTTP(_Action):
 class FWebSocket(_Action):
     code = "websocket"
     help = "Match WebSocket flows"
+    facets = frozenset()  # type: FrozenSet[str]
+    index = "type"
 
     @only(websocket.WebSocketFlow)
     def __call__(self, f):
@@ -114,6 +317,8 @@ class FWebSocket(_Action):
 class FTCP(_Action):
     code = "tcp"
     help = "Match TCP flows"
+    facets = frozenset()  # type: FrozenSet[str]
+    index = "type"
 
     @only(tcp.TCPFlow)
     def __call__(self, f):
@@ -123,6 +328,8 @@ class FTCP(_Action):
 class FReq(_Action):
     code = "q"
     help = "Match request with no response"
+    facets = frozenset([RESPONSE_HEAD])
+    index = "status_code"
 
     @only(http.HTTPFlow)
     def __call__(self, f):
@@ -133,6 +340,8 @@ class FReq(_Action):
 class FResp(_Action):
     code = "s"
     help = "Match response"
+    facets = frozenset([RESPONSE_HEAD])
+    index = "status_code"
 
     @only(http.HTTPFlow)
     def __call__(self, f):
@@ -142,6 +351,7 @@ class FResp(_Action):
 class _Rex(_Action):
     flags = 0
     is_binary = True
+    cost = 2
 
     def __init__(self, expr):
         self.expr = expr
@@ -164,6 +374,9 @@ def _check_content_type(rex, message):
 class FAsset(_Action):
     code = "a"
     help = "Match asset in response: CSS, Javascript, Flash, images."
+    cost = 3
+    facets = frozenset([RESPONSE_HEAD])
+    index = "content_type"
     ASSET_TYPES = [re.compile(x) for x in [
         b"text/javascript",
         b"application/x-javascript",
@@ -185,6 +398,9 @@ class FAsset(_Action):
 class FContentType(_Rex):
     code = "t"
     help = "Content-type header"
+    cost = 3
+    facets = frozenset([REQUEST_HEAD, RESPONSE_HEAD])
+    index = "content_type"
 
     @only(http.HTTPFlow)
     def __call__(self, f):
@@ -198,6 +414,9 @@ class FContentType(_Rex):
 class FContentTypeRequest(_Rex):
     code = "tq"
     help = "Request Content-Type header"
+    cost = 3
+    facets = frozenset([REQUEST_HEAD])
+    index = "content_type"
 
     @only(http.HTTPFlow)
     def __call__(self, f):
@@ -207,6 +426,9 @@ class FContentTypeRequest(_Rex):
 class FContentTypeResponse(_Rex):
     code = "ts"
     help = "Response Content-Type header"
+    cost = 3
+    facets = frozenset([RESPONSE_HEAD])
+    index = "content_type"
 
     @only(http.HTTPFlow)
     def __call__(self, f):
@@ -218,6 +440,8 @@ class FContentTypeResponse(_Rex):
 class FHead(_Rex):
     code = "h"
     help = "Header"
+    cost = 4
+    facets = frozenset([REQUEST_HEAD, RESPONSE_HEAD])
     flags = re.MULTILINE
 
     @only(http.HTTPFlow)
@@ -232,6 +456,8 @@ class FHead(_Rex):
 class FHeadRequest(_Rex):
     code = "hq"
     help = "Request header"
+    cost = 4
+    facets = frozenset([REQUEST_HEAD])
     flags = re.MULTILINE
 
     @only(http.HTTPFlow)
@@ -243,6 +469,8 @@ class FHeadRequest(_Rex):
 class FHeadResponse(_Rex):
     code = "hs"
     help = "Response header"
+    cost = 4
+    facets = frozenset([RESPONSE_HEAD])
     flags = re.MULTILINE
 
     @only(http.HTTPFlow)
@@ -251,65 +479,89 @@ class FHeadResponse(_Rex):
             return True
 
 
-class FBod(_Rex):
-    code = "b"
-    help = "Body"
+def _bodies(f, client, server):
+    """
+        Yields the decoded bodies of the messages of a flow that were sent by the
+        client, by the server, or both.
+    """
+    if isinstance(f, http.HTTPFlow):
+        if client and f.request and f.request.raw_content:
+            yield f.request.get_content(strict=False)
+        if server and f.response and f.response.raw_content:
+            yield f.response.get_content(strict=False)
+    else:
+        messages = f.messages
+        if getattr(f, "spill", None):
+            messages = itertools.chain(f.spill, messages)
+        for msg in messages:
+            if client if msg.from_client else server:
+                yield msg.content
+
+
+class _BodyRex(_Rex):
+    cost = 10
+    facets = frozenset([REQUEST_BODY, RESPONSE_BODY, MESSAGES])
     flags = re.DOTALL
+    from_client = True
+    from_server = True
 
     @only(http.HTTPFlow, websocket.WebSocketFlow, tcp.TCPFlow)
     def __call__(self, f):
-        if isinstance(f, http.HTTPFlow):
-            if f.request and f.request.raw_content:
-                if self.re.search(f.request.get_content(strict=False)):
-                    return True
-            if f.response and f.response.raw_content:
-                if self.re.search(f.response.get_content(strict=False)):
-                    return True
-        elif isinstance(f, websocket.WebSocketFlow) or isinstance(f, tcp.TCPFlow):
-            for msg in f.messages:
-                if self.re.search(msg.content):
-                    return True
+        for body in _bodies(f, self.from_client, self.from_server):
+            if self.re.search(body):
+                return True
         return False
 
+    @classmethod
+    def compile_group(cls, lst, match_all):
+        """
+            Compile several expressions of this class that are operands of the
+            same & (match_all) or |, so that every body is decoded once for all
+            of them rather than once per expression.
+        """
+        types = frozenset(cls.__call__.types)
+        cost = cls.cost + len(lst) - 1
+        rexes = [i.re for i in lst]
+        combine = all if match_all else any
+
+        def search(f):
+            bodies = _bodies(f, cls.from_client, cls.from_server)
+            decoded = []
+
+            def each():
+                yield from decoded
+                for body in bodies:
+                    decoded.append(body)
+                    yield body
+            return combine(any(r.search(b) for b in each()) for r in rexes)
+        return types, cost, search
+
+
+class FBod(_BodyRex):
+    code = "b"
+    help = "Body"
+
 
-class FBodRequest(_Rex):
+class FBodRequest(_BodyRex):
     code = "bq"
     help = "Request body"
-    flags = re.DOTALL
-
-    @only(http.HTTPFlow, websocket.WebSocketFlow, tcp.TCPFlow)
-    def __call__(self, f):
-        if isinstance(f, http.HTTPFlow):
-            if f.request and f.request.raw_content:
-                if self.re.search(f.request.get_content(strict=False)):
-                    return True
-        elif isinstance(f, websocket.WebSocketFlow) or isinstance(f, tcp.TCPFlow):
-            for msg in f.messages:
-                if msg.from_client and self.re.search(msg.content):
-                    return True
+    facets = frozenset([REQUEST_BODY, MESSAGES])
+    from_server = False
 
 
-class FBodResponse(_Rex):
+class FBodResponse(_BodyRex):
     code = "bs"
     help = "Response body"
-    flags = re.DOTALL
-
-    @only(http.HTTPFlow, websocket.WebSocketFlow, tcp.TCPFlow)
-    def __call__(self, f):
-        if isinstance(f, http.HTTPFlow):
-            if f.response and f.response.raw_content:
-                if self.re.search(f.response.get_content(strict=False)):
-                    return True
-        elif isinstance(f, websocket.WebSocketFlow) or isinstance(f, tcp.TCPFlow):
-            for msg in f.messages:
-                if not msg.from_client and self.re.search(msg.content):
-                    return True
+    facets = frozenset([RESPONSE_BODY, MESSAGES])
+    from_client = False
 
 
 class FMethod(_Rex):
     code = "m"
     help = "Method"
     flags = re.IGNORECASE
+    facets = frozenset([REQUEST_HEAD])
+    index = "method"
 
     @only(http.HTTPFlow)
     def __call__(self, f):
@@ -320,6 +572,8 @@ class FDomain(_Rex):
     code = "d"
     help = "Domain"
     flags = re.IGNORECASE
+    facets = frozenset([REQUEST_HEAD])
+    index = "host"
     is_binary = False
 
     @only(http.HTTPFlow, websocket.WebSocketFlow)
@@ -336,14 +590,9 @@ class FUrl(_Rex):
     code = "u"
     help = "URL"
     is_binary = False
+    facets = frozenset([REQUEST_HEAD])
     # FUrl is special, because it can be "naked".
 
-    @classmethod
-    def make(klass, s, loc, toks):
-        if len(toks) > 1:
-            toks = toks[1:]
-        return klass(*toks)
-
     @only(http.HTTPFlow, websocket.WebSocketFlow)
     def __call__(self, f):
         if isinstance(f, websocket.WebSocketFlow):
@@ -357,6 +606,7 @@ class FSrc(_Rex):
     code = "src"
     help = "Match source address"
     is_binary = False
+    facets = frozenset([CONNECTIONS])
 
     def __call__(self, f):
         if not f.client_conn or not f.client_conn.address:
@@ -369,6 +619,7 @@ class FDst(_Rex):
     code = "dst"
     help = "Match destination address"
     is_binary = False
+    facets = frozenset([CONNECTIONS])
 
     def __call__(self, f):
         if not f.server_conn or not f.server_conn.address:
@@ -386,6 +637,8 @@ class _Int(_Action):
 class FCode(_Int):
     code = "c"
     help = "HTTP response code"
+    facets = frozenset([RESPONSE_HEAD])
+    index = "status_code"
 
     @only(http.HTTPFlow)
     def __call__(self, f):
@@ -393,45 +646,122 @@ class FCode(_Int):
             return True
 
 
-class FAnd(_Token):
+def _compile_operands(lst, match_all):
+    """
+        Compile the operands of & (match_all) or |, cheapest first. Body
+        expressions of the same kind are compiled into a single operand.
+    """
+    parts = []
+    groups = collections.OrderedDict()  # type: Dict[type, List[_BodyRex]]
+    for i in lst:
+        if isinstance(i, _BodyRex):
+            groups.setdefault(type(i), []).append(i)
+        else:
+            parts.append(i.compile())
+    for cls, group in groups.items():
+        if len(group) == 1:
+            parts.append(group[0].compile())
+        else:
+            parts.append(cls.compile_group(group, match_all))
+    return sorted(parts, key=lambda p: p[1])
+
+
+class _Compound(_Token):
+    _fn = None
+
+    def __call__(self, f):
+        if self._fn is None:
+            types, _, fn = self.compile()
+            self._fn = fn if types is None else _guard(types, fn)
+        return self._fn(f)
+
+
+class FAnd(_Compound):
 
     def __init__(self, lst):
         self.lst = lst
 
+    @property
+    def facets(self):
+        return frozenset().union(*(i.facets for i in self.lst))
+
     def dump(self, indent=0, fp=sys.stdout):
         super().dump(indent, fp)
         for i in self.lst:
             i.dump(indent + 1, fp)
 
-    def __call__(self, f):
-        return all(i(f) for i in self.lst)
+    def candidates(self, indexes):
+        ids = None
+        for i in self.lst:
+            c = i.candidates(indexes)
+            if c is not None:
+                ids = c if ids is None else ids & c
+        return ids
 
+    def compile(self):
+        parts = _compile_operands(self.lst, True)
+        types = None
+        for t, _, _ in parts:
+            if t is not None:
+                types = t if types is None else types & t
+        # All operands are only evaluated for flows of the common types, so
+        # their own type checks can be skipped.
+        return types, sum(p[1] for p in parts), _all([p[2] for p in parts])
 
-class FOr(_Token):
+
+class FOr(_Compound):
 
     def __init__(self, lst):
         self.lst = lst
 
+    @property
+    def facets(self):
+        return frozenset().union(*(i.facets for i in self.lst))
+
     def dump(self, indent=0, fp=sys.stdout):
         super().dump(indent, fp)
         for i in self.lst:
             i.dump(indent + 1, fp)
 
-    def __call__(self, f):
-        return any(i(f) for i in self.lst)
-
-
-class FNot(_Token):
+    def candidates(self, indexes):
+        ids = set()  # type: Set[str]
+        for i in self.lst:
+            c = i.candidates(indexes)
+            if c is None:
+                return None
+            ids |= c
+        return ids
+
+    def compile(self):
+        parts = _compile_operands(self.lst, False)
+        types = None  # type: Optional[FrozenSet[type]]
+        if all(t is not None for t, _, _ in parts):
+            types = frozenset().union(*(t for t, _, _ in parts))
+        fns = [
+            fn if t is None or t == types else _guard(t, fn)
+            for t, _, fn in parts
+        ]
+        return types, sum(p[1] for p in parts), _any(fns)
+
+
+class FNot(_Compound):
 
     def __init__(self, itm):
         self.itm = itm[0]
 
+    @property
+    def facets(self):
+        return self.itm.facets
+
     def dump(self, indent=0, fp=sys.stdout):
         super().dump(indent, fp)
         self.itm.dump(indent + 1, fp)
 
-    def __call__(self, f):
-        return not self.itm(f)
+    def compile(self):
+        types, cost, fn = self.itm.compile()
+        if types is not None:
+            fn = _guard(types, fn)
+        return None, cost, lambda f: not fn(f)
 
 
 filter_unary = [
@@ -465,66 +795,182 @@ filter_int = [
 ]
 
 
-def _make():
-    # Order is important - multi-char expressions need to come before narrow
-    # ones.
-    parts = []
-    for klass in filter_unary:
-        f = pp.Literal("~%s" % klass.code) + pp.WordEnd()
-        f.setParseAction(klass.make)
-        parts.append(f)
-
-    simplerex = "".join(c for c in pp.printables if c not in "()~'\"")
-    rex = pp.Word(simplerex) |\
-        pp.QuotedString("\"", escChar='\\') |\
-        pp.QuotedString("'", escChar='\\')
-    for klass in filter_rex:
-        f = pp.Literal("~%s" % klass.code) + pp.WordEnd() + rex.copy()
-        f.setParseAction(klass.make)
-        parts.append(f)
-
-    for klass in filter_int:
-        f = pp.Literal("~%s" % klass.code) + pp.WordEnd() + pp.Word(pp.nums)
-        f.setParseAction(klass.make)
-        parts.append(f)
-
-    # A naked rex is a URL rex:
-    f = rex.copy()
-    f.setParseAction(FUrl.make)
-    parts.append(f)
-
-    atom = pp.MatchFirst(parts)
-    expr = pp.operatorPrecedence(atom,
-                                 [(pp.Literal("!").suppress(),
-                                   1,
-                                   pp.opAssoc.RIGHT,
-                                   lambda x: FNot(*x)),
-                                     (pp.Literal("&").suppress(),
-                                      2,
-                                      pp.opAssoc.LEFT,
-                                      lambda x: FAnd(*x)),
-                                     (pp.Literal("|").suppress(),
-                                      2,
-                                      pp.opAssoc.LEFT,
-                                      lambda x: FOr(*x)),
-                                  ])
-    expr = pp.OneOrMore(expr)
-    return expr.setParseAction(lambda x: FAnd(x) if len(x) != 1 else x)
-
-
-bnf = _make()
+_WHITESPACE = " \t\n\r"
+_PRINTABLES = frozenset(string.printable) - frozenset(string.whitespace)
+_SIMPLEREX = _PRINTABLES - frozenset("()~'\"")
+_QUOTED = {
+    q: re.compile(r'{q}(?:[^{q}\n\r\\]|(?:\\.))*{q}'.format(q=q))
+    for q in "'\""
+}
+_FILTERS = {
+    klass.code: klass
+    for klass in list(filter_unary) + list(filter_rex) + list(filter_int)
+}
+
+
+def _unquote(s: str) -> str:
+    s = s[1:-1]
+    if "\\" in s:
+        for escaped, char in ((r"\t", "\t"), (r"\n", "\n"), (r"\f", "\f"), (r"\r", "\r")):
+            s = s.replace(escaped, char)
+        s = re.sub(r"\\(.)", r"\g<1>", s)
+    return s
+
+
+class _Parser:
+    """
+        A recursive-descent parser for filter expressions. In order of precedence:
+
+            expr    := or+
+            or      := and ("|" and)*
+            and     := not ("&" not)*
+            not     := "!" not | primary
+            primary := filter | rex | "(" or ")"
+            filter  := "~" code [rex | int]
+            rex     := word | "quoted" | 'quoted'
+
+        Whitespace between tokens is ignored, but filter codes must be followed
+        by whitespace or the end of the expression. A sequence of expressions
+        without operators is combined with &. All methods take the position to
+        parse at and return a (filter, end position) tuple, or None.
+    """
+    def __init__(self, s: str) -> None:
+        # Tabs are expanded like the pyparsing grammar that this parser replaced did.
+        self.s = s.expandtabs()
+
+    def skip(self, pos):
+        s = self.s
+        while pos < len(s) and s[pos] in _WHITESPACE:
+            pos += 1
+        return pos
+
+    def literal(self, pos, lit):
+        pos = self.skip(pos)
+        if self.s.startswith(lit, pos):
+            return pos + len(lit)
+        return -1
+
+    def word(self, pos, chars):
+        s = self.s
+        end = pos
+        while end < len(s) and s[end] in chars:
+            end += 1
+        return end
+
+    def rex(self, pos):
+        pos = self.skip(pos)
+        end = self.word(pos, _SIMPLEREX)
+        if end > pos:
+            return self.s[pos:end], end
+        if pos < len(self.s) and self.s[pos] in _QUOTED:
+            m = _QUOTED[self.s[pos]].match(self.s, pos)
+            if m:
+                return _unquote(m.group()), m.end()
+        return None
+
+    def filter(self, pos):
+        end = self.word(pos + 1, _PRINTABLES)
+        klass = _FILTERS.get(self.s[pos + 1:end])
+        if klass is None:
+            return None
+        if klass in filter_unary:
+            return klass(), end
+        if klass in filter_int:
+            start = self.skip(end)
+            end = self.word(start, string.digits)
+            if end == start:
+                return None
+            return klass(self.s[start:end]), end
+        r = self.rex(end)
+        if r is None:
+            return None
+        return klass(r[0]), r[1]
+
+    def primary(self, pos):
+        pos = self.skip(pos)
+        if self.s.startswith("~", pos):
+            return self.filter(pos)
+        r = self.rex(pos)
+        if r is not None:
+            return FUrl(r[0]), r[1]
+        pos = self.literal(pos, "(")
+        if pos < 0:
+            return None
+        r = self.or_(pos)
+        if r is None:
+            return None
+        pos = self.literal(r[1], ")")
+        if pos < 0:
+            return None
+        return r[0], pos
+
+    def not_(self, pos):
+        end = self.literal(pos, "!")
+        if end >= 0:
+            r = self.not_(end)
+            if r is not None:
+                return FNot([r[0]]), r[1]
+        # A lone "!" is a URL expression.
+        return self.primary(pos)
+
+    def binary(self, pos, operand, op, klass):
+        r = operand(pos)
+        if r is None:
+            return None
+        lst, pos = [r[0]], r[1]
+        while True:
+            end = self.literal(pos, op)
+            if end < 0:
+                break
+            r = operand(end)
+            if r is None:
+                break
+            lst.append(r[0])
+            pos = r[1]
+        if len(lst) == 1:
+            return lst[0], pos
+        return klass(lst), pos
+
+    def and_(self, pos):
+        return self.binary(pos, self.not_, "&", FAnd)
+
+    def or_(self, pos):
+        return self.binary(pos, self.and_, "|", FOr)
+
+    def parse(self):
+        lst, pos = [], 0
+        while True:
+            r = self.or_(pos)
+            if r is None:
+                break
+            lst.append(r[0])
+            pos = r[1]
+        pos = self.skip(pos)
+        if not lst or pos != len(self.s):
+            raise ValueError("Invalid filter expression at position {}.".format(pos))
+        if len(lst) == 1:
+            return lst[0]
+        return FAnd(lst)
+
+
 TFilter = Callable[[flow.Flow], bool]
 
 
+@functools.lru_cache(maxsize=256)
 def parse(s: str) -> TFilter:
+    """
+        Parse a filter expression. Returns None if the expression is invalid.
+
+        Results are cached, so filters must not be modified.
+    """
     try:
-        flt = bnf.parseString(s, parseAll=True)[0]
-        flt.pattern = s
-        return flt
-    except pp.ParseException:
-        return None
+        flt = _Parser(s).parse()
     except ValueError:
         return None
+    except RecursionError:
+        return None
+    flt.pattern = s
+    return flt
 
 
 def match(flt, flow):
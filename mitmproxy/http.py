@@ -17,6 +17,8 @@ class HTTPRequest(http.Request):
     # This is a very thin wrapper on top of :py:class:`mitmproxy.net.http.Request` and
     # may be removed in the future.
 
+    __slots__ = ("is_replay", "stream")
+
     def __init__(
             self,
             first_line_format,
@@ -92,6 +94,8 @@ class HTTPResponse(http.Response):
     # This is a very thin wrapper on top of :py:class:`mitmproxy.net.http.Response` and
     # may be removed in the future.
 
+    __slots__ = ("is_replay", "stream")
+
     def __init__(
             self,
             http_version,
@@ -141,6 +145,7 @@ class HTTPFlow(flow.Flow):
     An HTTPFlow is a collection of objects representing a single HTTP
     transaction.
     """
+    __slots__ = ("request", "response", "mode")
 
     def __init__(self, client_conn, server_conn, live=None, mode="regular"):
         super().__init__("http", client_conn, server_conn, live)
@@ -173,6 +178,24 @@ class HTTPFlow(flow.Flow):
         mode=str
     ))
 
+    def _snapshot(self, attr, cls):
+        # Messages are backed up by a shallow copy, which keeps their content
+        # from being serialized on every backup and comparison.
+        if attr in ("request", "response"):
+            m = getattr(self, attr)
+            return None if m is None else m.snapshot()
+        return super()._snapshot(attr, cls)
+
+    def _unchanged(self, attr, cls, snapshot):
+        if attr in ("request", "response") and isinstance(snapshot, http.Message):
+            m = getattr(self, attr)
+            return (
+                m is not None and
+                m == snapshot and
+                getattr(m, "is_replay", None) == getattr(snapshot, "is_replay", None)
+            )
+        return super()._unchanged(attr, cls, snapshot)
+
     def __repr__(self):
         s = "<HTTPFlow"
         for a in ("request", "response", "error", "client_conn", "server_conn"):
@@ -1,7 +1,11 @@
 
-from .io import FlowWriter, FlowReader, FilteredFlowWriter, read_flows_from_paths
+from .io import (
+    AsyncFlowWriter, FlowWriter, FlowReader, FilteredFlowWriter, LazyFlows,
+    read_flows_from_paths, read_flows_parallel, dump_flow, upgrade_dump
+)
 
 
 __all__ = [
-    "FlowWriter", "FlowReader", "FilteredFlowWriter", "read_flows_from_paths"
+    "AsyncFlowWriter", "FlowWriter", "FlowReader", "FilteredFlowWriter", "LazyFlows",
+    "read_flows_from_paths", "read_flows_parallel", "dump_flow", "upgrade_dump"
 ]
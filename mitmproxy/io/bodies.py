@@ -0,0 +1,102 @@
+"""
+Body stores for flow dumps.
+
+Dumps can be written with their large HTTP bodies moved to a store next to the dump
+(<dump>.bodies). Every distinct body is written to the store once, and the content of
+a message in the dump is replaced by the [offset, size] of its body in the store. The
+store is plain concatenated data, so references are resolved with a single read and
+do not depend on any other flow of the dump.
+"""
+import hashlib
+import typing
+
+from mitmproxy import exceptions
+
+BODIES_SUFFIX = ".bodies"
+MIN_SIZE = 1024
+
+_MESSAGES = ("request", "response")
+
+
+def bodies_path(path: str) -> str:
+    return path + BODIES_SUFFIX
+
+
+class BodyWriter:
+    """
+        Writes bodies to a store. Only the digests of the stored bodies are kept in
+        memory. If fo is opened for appending, bodies already in the store are not
+        reused, but remain readable.
+    """
+    def __init__(self, fo: typing.BinaryIO, min_size: int = MIN_SIZE) -> None:
+        self.fo = fo
+        self.min_size = min_size
+        self.refs = {}  # type: typing.Dict[bytes, typing.List[int]]
+        # Bytes that were not written thanks to deduplication.
+        self.saved = 0
+
+    def add(self, body: bytes) -> typing.List[int]:
+        """
+            Store a body and return its reference.
+        """
+        digest = hashlib.sha256(body).digest()
+        ref = self.refs.get(digest)
+        if ref is not None:
+            self.saved += len(body)
+            return ref
+        self.fo.seek(0, 2)
+        ref = [self.fo.tell(), len(body)]
+        self.fo.write(body)
+        self.refs[digest] = ref
+        return ref
+
+    def externalize(self, state: dict) -> dict:
+        """
+            Returns a copy of the state of an HTTP flow with its large bodies replaced
+            by references. Other flows are returned unchanged.
+        """
+        if state.get("type") != "http":
+            return state
+        state = state.copy()
+        for k in _MESSAGES:
+            m = state.get(k)
+            if m and isinstance(m.get("content"), bytes) and len(m["content"]) >= self.min_size:
+                state[k] = dict(m, content=self.add(m["content"]))
+        return state
+
+
+class BodyReader:
+    """
+        Resolves the body references of flows from the store at path.
+    """
+    def __init__(self, path: typing.Optional[str]) -> None:
+        self.path = path
+
+    def read(self, ref: list) -> bytes:
+        if not self.path:
+            raise exceptions.FlowReadException("Flow refers to a body store, but there is none.")
+        try:
+            offset, size = ref
+            with open(self.path, "rb") as fo:
+                fo.seek(offset)
+                body = fo.read(size)
+        except (TypeError, ValueError):
+            raise exceptions.FlowReadException("Invalid body reference.")
+        except IOError as e:
+            raise exceptions.FlowReadException("Can not read body store: {}".format(e.strerror))
+        if len(body) != size:
+            raise exceptions.FlowReadException("Body store is truncated.")
+        return body
+
+    def internalize(self, state: dict) -> dict:
+        """
+            Replace body references in the state of a flow with the bodies. The state is
+            modified in place.
+        """
+        if state.get("type") != "http":
+            return state
+        for k in _MESSAGES:
+            m = state.get(k)
+            if m and isinstance(m.get("content"), list):
+                m["content"] = self.read(m["content"])
+        return state
@@ -172,6 +172,15 @@ def convert_6_7(data):
     return data
 
 
+def convert_7_8(data):
+    data["version"] = 8
+    if data["type"] == "websocket":
+        data["dropped_messages"] = 0
+        if data.get("backup"):
+            data["backup"]["dropped_messages"] = 0
+    return data
+
+
 def _convert_dict_keys(o: Any) -> Any:
     if isinstance(o, dict):
         return {strutils.always_str(k): _convert_dict_keys(v) for k, v in o.items()}
@@ -226,10 +235,15 @@ converters = {
     4: convert_4_5,
     5: convert_5_6,
     6: convert_6_7,
+    7: convert_7_8,
 }
 
 
 def migrate_flow(flow_data: Dict[Union[bytes, str], Any]) -> Dict[Union[bytes, str], Any]:
+    # Flows in the current format have str keys. Checking for them first spares
+    # the lookups below for the vast majority of flows.
+    if flow_data.get("version") == version.FLOW_FORMAT_VERSION:
+        return flow_data
     while True:
         flow_version = flow_data.get(b"version", flow_data.get("version"))
 
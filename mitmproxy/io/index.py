@@ -0,0 +1,109 @@
+"""
+Sidecar indexes for flow dumps.
+
+An index is stored next to a dump as <dump>.idx. It consists of one tnetstring list per
+flow, recording where the flow is stored in the dump and a few fields that are useful for
+seeking and filtering without deserializing the flow itself.
+
+An index is only used if it covers the dump exactly: entries must be contiguous, start at
+the beginning of the dump and end at its last byte. Anything else - e.g. a dump that was
+appended to by a writer that did not maintain the index - is treated as if there were no
+index at all.
+"""
+import os
+import typing
+
+from mitmproxy import flow
+from mitmproxy.io import tnetstring
+
+INDEX_SUFFIX = ".idx"
+
+IndexEntry = typing.NamedTuple(
+    "IndexEntry", [
+        ("offset", int),
+        ("size", int),
+        ("timestamp", float),
+        ("type", str),
+        ("method", str),
+        ("host", str),
+        ("status", int),
+    ]
+)
+
+
+def index_path(path: str) -> str:
+    return path + INDEX_SUFFIX
+
+
+def make_entry(f: flow.Flow, offset: int, size: int) -> IndexEntry:
+    """
+        Describe a flow that has been written to size bytes at offset.
+    """
+    timestamp = f.client_conn.timestamp_start or 0.0
+    method = ""
+    host = f.server_conn.address[0] if f.server_conn.address else ""
+    status = 0
+    if f.type == "http":
+        timestamp = f.request.timestamp_start or timestamp  # type: ignore
+        method = f.request.method  # type: ignore
+        host = f.request.host  # type: ignore
+        if f.response:  # type: ignore
+            status = f.response.status_code  # type: ignore
+    return IndexEntry(offset, size, timestamp, f.type, method, host, status)
+
+
+class IndexWriter:
+    def __init__(self, fo: typing.BinaryIO) -> None:
+        self.fo = fo
+
+    def add(self, entry: IndexEntry) -> None:
+        tnetstring.dump(list(entry), self.fo)
+
+
+def read_index(fo: typing.BinaryIO) -> typing.List[IndexEntry]:
+    """
+        Read all entries of an index.
+
+        Raises:
+            ValueError, if the index is malformed.
+    """
+    entries = []  # type: typing.List[IndexEntry]
+    while True:
+        try:
+            entry = tnetstring.load(fo)
+        except ValueError as e:
+            if str(e) == "not a tnetstring: empty file":
+                return entries
+            raise
+        if not isinstance(entry, list) or len(entry) != len(IndexEntry._fields):
+            raise ValueError("Invalid index entry.")
+        entries.append(IndexEntry(*entry))
+
+
+def is_valid(entries: typing.Sequence[IndexEntry], dump_size: int) -> bool:
+    """
+        Check that the entries cover a dump of dump_size bytes exactly.
+    """
+    end = 0
+    for e in entries:
+        if e.offset != end:
+            return False
+        end += e.size
+    return end == dump_size
+
+
+def load_index(path: str) -> typing.Optional[typing.List[IndexEntry]]:
+    """
+        Load the index of the dump at path.
+
+        Returns None if there is no index, or if it can not be used for the dump.
+    """
+    try:
+        dump_size = os.path.getsize(path)
+        with open(index_path(path), "rb") as fo:
+            entries = read_index(fo)
+    except (IOError, ValueError, IndexError):
+        return None
+    if not is_valid(entries, dump_size):
+        return None
+    return entries
@@ -1,5 +1,16 @@
+import array
+import collections
+import collections.abc
+import concurrent.futures
+import functools
+import io
+import mmap
 import os
-from typing import Type, Iterable, Dict, Union, Any, cast  # noqa
+import queue
+import threading
+import time
+import zlib
+from typing import Type, Iterable, Iterator, Dict, Union, Any, List, Optional, Tuple, Callable, BinaryIO, cast  # noqa
 
 from mitmproxy import exceptions
 from mitmproxy import flow
@@ -8,7 +19,9 @@ from mitmproxy import http
 from mitmproxy import tcp
 from mitmproxy import websocket
 
+from mitmproxy.io import bodies
 from mitmproxy.io import compat
+from mitmproxy.io import index
 from mitmproxy.io import tnetstring
 
 FLOW_TYPES = dict(
@@ -18,18 +31,265 @@ FLOW_TYPES = dict(
 )  # type: Dict[str, Type[flow.Flow]]
 
 
+# Dumps may contain compressed blocks of flows. A block is stored as the tnetstring list
+# [codec, number of flows, compressed data], where the data is a concatenation of flow
+# tnetstrings. Flows themselves are always dicts, which tells them apart from blocks.
+BLOCK_SIZE = 1024 * 1024
+BLOCK_CODEC = "zlib"
+
+
+def _decode_block(block: list) -> Tuple[int, bytes]:
+    """
+        Returns the number of flows in a block and their tnetstrings.
+    """
+    try:
+        codec, count, data = block
+        if codec != BLOCK_CODEC:
+            raise exceptions.FlowReadException("Unknown block compression: {}".format(codec))
+        return count, zlib.decompress(data)
+    except (ValueError, TypeError, zlib.error):
+        raise exceptions.FlowReadException("Invalid compressed block.")
+
+
+def _skip_record(fo) -> Optional[int]:
+    """
+        Moves a seekable file past the next flow or block without decoding it.
+        Returns the number of flows for blocks, and None for a single flow.
+    """
+    start = fo.tell()
+    end = start + tnetstring.skip(fo)
+    fo.seek(end - 1)
+    if fo.read(1) != b"]":
+        return None
+    fo.seek(start)
+    head = fo.read(64)
+    codec, rest = tnetstring.pop(head[head.index(b":") + 1:])
+    count, _ = tnetstring.pop(rest)
+    if not isinstance(count, int):
+        raise ValueError("Invalid compressed block.")
+    fo.seek(end)
+    return count
+
+
+def _write_data(data: bytes, fo) -> None:
+    fo.write(data)
+
+
+def _body(data: bytes) -> bytes:
+    """
+    Strips length prefix and type tag from a tnetstring.
+    """
+    return data[data.index(b":") + 1:-1]
+
+
+def dump_flow(f: flow.Flow, fo) -> None:
+    """
+        Writes a flow to fo.
+
+        Spilled WebSocket messages are not loaded back into memory. The spill file already
+        consists of their tnetstrings, so it is copied into the messages list verbatim.
+    """
+    if not isinstance(f, websocket.WebSocketFlow) or not f.spill:
+        tnetstring.dump(f.get_state(), fo)
+        return
+
+    d = f.get_memory_state()
+    spill_size = f.spill.size
+    memory_messages = _body(tnetstring.dumps(d.pop("messages")))
+    rest = _body(tnetstring.dumps(d))
+    key = tnetstring.dumps("messages")
+    messages_length = spill_size + len(memory_messages)
+    messages_prefix = b"%d:" % messages_length
+    length = len(rest) + len(key) + len(messages_prefix) + messages_length + 1
+
+    fo.write(b"%d:" % length)
+    fo.write(rest)
+    fo.write(key)
+    fo.write(messages_prefix)
+    f.spill.copy_to(fo, spill_size)
+    fo.write(memory_messages)
+    fo.write(b"]}")
+
+
 class FlowWriter:
-    def __init__(self, fo):
+    """
+        Writes flows to fo. If index_fo is given, an index entry for every flow is
+        written to it (see mitmproxy.io.index). This requires fo to be seekable.
+
+        With compress, flows are collected into blocks of about BLOCK_SIZE bytes, which
+        are compressed and written in a background thread. Compressed dumps can not be
+        indexed, and the writer must be flushed before fo is closed.
+
+        If bodies_fo is given, large HTTP bodies are deduplicated into it (see
+        mitmproxy.io.bodies).
+    """
+    # Number of blocks that may wait to be compressed before add() blocks.
+    max_pending_blocks = 4
+
+    def __init__(self, fo, index_fo=None, compress: bool = False, bodies_fo=None) -> None:
+        if compress and index_fo:
+            raise ValueError("Compressed dumps can not be indexed.")
         self.fo = fo
+        self.index = index.IndexWriter(index_fo) if index_fo else None
+        self.bodies = bodies.BodyWriter(bodies_fo) if bodies_fo else None
+        self.block = io.BytesIO() if compress else None
+        self.block_count = 0
+        self.executor = None  # type: Optional[concurrent.futures.ThreadPoolExecutor]
+        self.pending = collections.deque()  # type: collections.deque
 
     def add(self, flow):
-        d = flow.get_state()
-        tnetstring.dump(d, self.fo)
+        entry = index.make_entry(flow, 0, 0) if self.index else None
+        self.write(functools.partial(self._dump_flow, flow), entry)
+
+    def _dump_flow(self, f: flow.Flow, fo) -> None:
+        if self.bodies and isinstance(f, http.HTTPFlow):
+            self._dump_state(f.get_state(), fo)
+        else:
+            dump_flow(f, fo)
+
+    def _dump_state(self, state: dict, fo) -> None:
+        if self.bodies:
+            state = self.bodies.externalize(state)
+        tnetstring.dump(state, fo)
+
+    def prepare(self, f: flow.Flow) -> Optional[Tuple[Callable[[BinaryIO], None], Optional[index.IndexEntry]]]:
+        """
+            Take a snapshot of a flow that can be passed to write() later, possibly from
+            another thread. Returns None if the flow should not be written.
+        """
+        entry = index.make_entry(f, 0, 0) if self.index else None
+        if isinstance(f, websocket.WebSocketFlow) and f.spill:
+            buf = io.BytesIO()
+            dump_flow(f, buf)
+            return functools.partial(_write_data, buf.getvalue()), entry
+        return functools.partial(self._dump_state, f.get_state()), entry
+
+    def write(self, dump: Callable[[BinaryIO], None], entry: Optional[index.IndexEntry] = None) -> None:
+        """
+            Write a flow with the dump callable, which writes its tnetstring to a file.
+            entry is the index entry for the flow, without offset and size.
+        """
+        if self.block is not None:
+            dump(self.block)
+            self.block_count += 1
+            if self.block.tell() >= BLOCK_SIZE:
+                self._end_block()
+            return
+        if not self.index or not entry:
+            dump(self.fo)
+            return
+        offset = self.fo.tell()
+        dump(self.fo)
+        self.index.add(entry._replace(offset=offset, size=self.fo.tell() - offset))
+
+    def _end_block(self):
+        data, count = self.block.getvalue(), self.block_count
+        self.block = io.BytesIO()
+        self.block_count = 0
+        if not self.executor:
+            self.executor = concurrent.futures.ThreadPoolExecutor(1)
+        # Collect finished writes to surface their errors, and wait if too many are queued.
+        while self.pending and (self.pending[0].done() or len(self.pending) >= self.max_pending_blocks):
+            self.pending.popleft().result()
+        self.pending.append(self.executor.submit(self._write_block, data, count))
+
+    def _write_block(self, data: bytes, count: int) -> None:
+        tnetstring.dump([BLOCK_CODEC, count, zlib.compress(data)], self.fo)
+
+    def flush(self) -> None:
+        """
+            Write out all buffered flows.
+        """
+        if self.block_count:
+            self._end_block()
+        while self.pending:
+            self.pending.popleft().result()
+        if self.executor:
+            self.executor.shutdown()
+            self.executor = None
+        if self.bodies:
+            self.bodies.fo.flush()
+
+    def close(self) -> None:
+        """
+            Flush the writer and close its files.
+        """
+        try:
+            self.flush()
+        finally:
+            self.fo.close()
+            if self.index:
+                self.index.fo.close()
+            if self.bodies:
+                self.bodies.fo.close()
 
 
 class FlowReader:
-    def __init__(self, fo):
+    """
+        Reads flows from fo.
+
+        stream() reads flows sequentially from the current position. The random access
+        methods get(), count() and timerange() require fo to be seekable. They use the
+        index of the dump if one is given or found next to the file, and fall back to
+        scanning the dump otherwise.
+
+        Body references are resolved with the given body store, or the one next to
+        the file.
+    """
+    def __init__(
+        self,
+        fo,
+        entries: Optional[List[index.IndexEntry]] = None,
+        body_reader: Optional[bodies.BodyReader] = None
+    ) -> None:
         self.fo = fo
+        self._entries = entries
+        self._index_loaded = entries is not None
+        self._body_reader = body_reader
+
+    @property
+    def body_reader(self) -> bodies.BodyReader:
+        if self._body_reader is None:
+            name = getattr(self.fo, "name", None)
+            path = bodies.bodies_path(name) if isinstance(name, str) else None
+            self._body_reader = bodies.BodyReader(path)
+        return self._body_reader
+
+    @property
+    def entries(self) -> Optional[List[index.IndexEntry]]:
+        """
+            The index entries of the dump, or None if there is no usable index.
+        """
+        if not self._index_loaded:
+            self._index_loaded = True
+            name = getattr(self.fo, "name", None)
+            if isinstance(name, str):
+                self._entries = index.load_index(name)
+        return self._entries
+
+    def _load_record(self) -> List[flow.Flow]:
+        """
+            Load the next flow, or all flows of the next block.
+        """
+        loaded = tnetstring.load(self.fo)
+        if isinstance(loaded, list):
+            _, data = _decode_block(loaded)
+            return list(FlowReader(io.BytesIO(data), body_reader=self.body_reader).stream())
+        return [self._load_flow(loaded)]
+
+    def _load_flow(self, loaded) -> flow.Flow:
+        if not isinstance(loaded, dict):
+            raise exceptions.FlowReadException("Invalid data format.")
+        # FIXME: This cast hides a lack of dynamic type checking
+        loaded = cast(Dict[Union[bytes, str], Any], loaded)
+        try:
+            mdata = compat.migrate_flow(loaded)
+        except ValueError as e:
+            raise exceptions.FlowReadException(str(e))
+        if mdata["type"] not in FLOW_TYPES:
+            raise exceptions.FlowReadException("Unknown flow type: {}".format(mdata["type"]))
+        self.body_reader.internalize(mdata)
+        return FLOW_TYPES[mdata["type"]].from_state(mdata)
 
     def stream(self) -> Iterable[flow.Flow]:
         """
@@ -37,34 +297,228 @@ class FlowReader:
         """
         try:
             while True:
-                # FIXME: This cast hides a lack of dynamic type checking
-                loaded = cast(
-                    Dict[Union[bytes, str], Any],
-                    tnetstring.load(self.fo),
-                )
-                try:
-                    mdata = compat.migrate_flow(loaded)
-                except ValueError as e:
-                    raise exceptions.FlowReadException(str(e))
-                if mdata["type"] not in FLOW_TYPES:
-                    raise exceptions.FlowReadException("Unknown flow type: {}".format(mdata["type"]))
-                yield FLOW_TYPES[mdata["type"]].from_state(mdata)
+                yield from self._load_record()
         except ValueError as e:
             if str(e) == "not a tnetstring: empty file":
                 return  # Error is due to EOF
             raise exceptions.FlowReadException("Invalid data format.")
 
+    def count(self) -> int:
+        """
+            Returns the number of flows in the dump without deserializing them.
+        """
+        entries = self.entries
+        if entries is not None:
+            return len(entries)
+        self.fo.seek(0)
+        n = 0
+        try:
+            while True:
+                count = _skip_record(self.fo)
+                n += 1 if count is None else count
+        except ValueError as e:
+            if str(e) == "not a tnetstring: empty file":
+                return n
+            raise exceptions.FlowReadException("Invalid data format.")
+
+    def get(self, n: int) -> flow.Flow:
+        """
+            Returns the n-th flow of the dump.
 
-class FilteredFlowWriter:
-    def __init__(self, fo, flt):
-        self.fo = fo
+            Raises:
+                IndexError, if there is no such flow.
+        """
+        if n < 0:
+            n += self.count()
+        if n < 0:
+            raise IndexError("Flow index out of range.")
+        entries = self.entries
+        try:
+            if entries is not None:
+                if n >= len(entries):
+                    raise IndexError("Flow index out of range.")
+                self.fo.seek(entries[n].offset)
+                return self._load_record()[0]
+            self.fo.seek(0)
+            while True:
+                start = self.fo.tell()
+                count = _skip_record(self.fo)
+                if count is None:
+                    count = 1
+                if n < count:
+                    break
+                n -= count
+            self.fo.seek(start)
+            loaded = tnetstring.load(self.fo)
+            if not isinstance(loaded, list):
+                return self._load_flow(loaded)
+            _, data = _decode_block(loaded)
+            return FlowReader(io.BytesIO(data), body_reader=self.body_reader).get(n)
+        except ValueError as e:
+            if str(e) == "not a tnetstring: empty file":
+                raise IndexError("Flow index out of range.")
+            raise exceptions.FlowReadException("Invalid data format.")
+
+    def timerange(
+        self,
+        start: Optional[float] = None,
+        end: Optional[float] = None
+    ) -> Iterable[flow.Flow]:
+        """
+            Yields the flows with start <= timestamp < end, in the order of the dump.
+            See mitmproxy.io.index.make_entry for the timestamp of a flow.
+        """
+        def matches(ts):
+            return (start is None or ts >= start) and (end is None or ts < end)
+
+        entries = self.entries
+        if entries is None:
+            self.fo.seek(0)
+            for f in self.stream():
+                if matches(index.make_entry(f, 0, 0).timestamp):
+                    yield f
+            return
+        for e in entries:
+            if matches(e.timestamp):
+                self.fo.seek(e.offset)
+                try:
+                    yield from self._load_record()
+                except ValueError:
+                    raise exceptions.FlowReadException("Invalid data format.")
+
+
+class FilteredFlowWriter(FlowWriter):
+    def __init__(self, fo, flt, index_fo=None, compress: bool = False, bodies_fo=None) -> None:
+        super().__init__(fo, index_fo, compress, bodies_fo)
         self.flt = flt
 
     def add(self, f: flow.Flow):
         if self.flt and not flowfilter.match(self.flt, f):
             return
-        d = f.get_state()
-        tnetstring.dump(d, self.fo)
+        super().add(f)
+
+    def prepare(self, f: flow.Flow):
+        if self.flt and not flowfilter.match(self.flt, f):
+            return None
+        return super().prepare(f)
+
+
+class AsyncFlowWriter:
+    """
+        Writes flows with a FlowWriter in a background thread.
+
+        add() takes a snapshot of the flow in the calling thread and queues it. The
+        background thread writes queued flows in batches, flushing the file after each
+        batch. If the queue is full, add() either waits or drops the flow, depending on
+        overflow. fsync is one of "never", "batch" (after every batch) and "close".
+
+        Errors in the background thread are raised as IOError from the next call to
+        add() or close().
+    """
+    batch_size = 100
+
+    def __init__(
+        self,
+        writer: FlowWriter,
+        queue_size: int = 1000,
+        fsync: str = "never",
+        overflow: str = "block",
+    ) -> None:
+        self.writer = writer
+        self.fsync = fsync
+        self.overflow = overflow
+        self.queue = queue.Queue(queue_size)  # type: queue.Queue
+        self.written = 0
+        self.dropped = 0
+        # Duration of the most recent and the slowest batch write, in seconds.
+        self.write_latency = 0.0
+        self.max_write_latency = 0.0
+        self.error = None  # type: Optional[Exception]
+        self.thread = threading.Thread(target=self.run, name="AsyncFlowWriter", daemon=True)
+        self.thread.start()
+
+    @property
+    def queue_depth(self) -> int:
+        return self.queue.qsize()
+
+    def add(self, f: flow.Flow) -> None:
+        self._check()
+        item = self.writer.prepare(f)
+        if item is None:
+            return
+        if self.overflow == "drop":
+            try:
+                self.queue.put_nowait(item)
+            except queue.Full:
+                self.dropped += 1
+        else:
+            self.queue.put(item)
+
+    def run(self):
+        done = False
+        while not done:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1] is None:
+                batch.pop()
+                done = True
+            if self.error:
+                continue
+            start = time.time()
+            try:
+                for item in batch:
+                    self.writer.write(*item)
+                # Bodies first, so that flows never refer to data that is not written yet.
+                if self.writer.bodies:
+                    self.writer.bodies.fo.flush()
+                self.writer.fo.flush()
+                if self.fsync == "batch":
+                    os.fsync(self.writer.fo.fileno())
+            except Exception as e:
+                self.error = e
+                continue
+            self.written += len(batch)
+            self.write_latency = time.time() - start
+            self.max_write_latency = max(self.max_write_latency, self.write_latency)
+
+    def _check(self):
+        if self.error:
+            raise IOError("Error writing flows: {}".format(self.error)) from self.error
+
+    def close(self) -> None:
+        """
+            Write all queued flows and close the writer.
+        """
+        self.queue.put(None)
+        self.thread.join()
+        try:
+            self._check()
+            self.writer.flush()
+            if self.fsync != "never":
+                self.writer.fo.flush()
+                os.fsync(self.writer.fo.fileno())
+        finally:
+            self.writer.close()
+
+
+def upgrade_dump(fi, fo) -> int:
+    """
+        Rewrite the dump in fi to fo in the current flow format, one flow at a time.
+        Returns the number of flows written.
+
+        Raises:
+            FlowReadException, if fi can not be read.
+    """
+    w = FlowWriter(fo)
+    n = 0
+    for f in FlowReader(fi).stream():
+        w.add(f)
+        n += 1
+    return n
 
 
 def read_flows_from_paths(paths):
@@ -72,6 +526,7 @@ def read_flows_from_paths(paths):
     Given a list of filepaths, read all flows and return a list of them.
     From a performance perspective, streaming would be advisable -
     however, if there's an error with one of the files, we want it to be raised immediately.
+    See LazyFlows for a sequence that does not keep all flows in memory.
 
     Raises:
         FlowReadException, if any error occurs.
@@ -85,3 +540,166 @@ def read_flows_from_paths(paths):
     except IOError as e:
         raise exceptions.FlowReadException(e.strerror)
     return flows
+
+
+class LazyFlows(collections.abc.Sequence):
+    """
+        A sequence of the flows in one or more dumps, which are deserialized on access.
+
+        The dumps are memory-mapped and only the offsets of their flows are kept in memory,
+        so that large dumps can be used without loading all flows. Every access returns a
+        new flow object. Offsets are taken from the index of a dump if it has one (see
+        mitmproxy.io.index), and found by skipping over the flows otherwise.
+        Flows in compressed blocks are read by decompressing their block, and the last
+        decompressed block is kept together with the offsets of its flows.
+
+        Raises:
+            FlowReadException, if a dump can not be read or is not framed correctly.
+    """
+    def __init__(self, paths: Iterable[str] = ()) -> None:
+        self._maps = []  # type: List[mmap.mmap]
+        # The body store of every dump, by the id of its map.
+        self._body_readers = {}  # type: Dict[int, bodies.BodyReader]
+        self._offsets = array.array("q")
+        # The position of a flow in its block, or -1 if it is not in a block.
+        self._positions = array.array("l")
+        self._block = None  # type: Optional[Tuple[mmap.mmap, int, bytes, List[int]]]
+        for path in paths:
+            path = os.path.expanduser(path)
+            try:
+                with open(path, "rb") as f:
+                    if os.fstat(f.fileno()).st_size == 0:
+                        continue
+                    m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except IOError as e:
+                raise exceptions.FlowReadException(e.strerror)
+            entries = index.load_index(path)
+            if entries is not None:
+                offsets = array.array("q", (e.offset for e in entries))
+                positions = array.array("l", [-1]) * len(entries)
+            else:
+                offsets = array.array("q")
+                positions = array.array("l")
+                try:
+                    while m.tell() < len(m):
+                        offset = m.tell()
+                        count = _skip_record(m)
+                        if count is None:
+                            offsets.append(offset)
+                            positions.append(-1)
+                        else:
+                            offsets.extend([offset] * count)
+                            positions.extend(range(count))
+                except ValueError:
+                    raise exceptions.FlowReadException("Invalid data format.")
+            self._maps.extend([m] * len(offsets))
+            self._body_readers[id(m)] = bodies.BodyReader(bodies.bodies_path(path))
+            self._offsets.extend(offsets)
+            self._positions.extend(positions)
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            ret = LazyFlows()
+            ret._maps = self._maps[i]
+            ret._body_readers = self._body_readers
+            ret._offsets = self._offsets[i]
+            ret._positions = self._positions[i]
+            return ret
+        m, offset, position = self._maps[i], self._offsets[i], self._positions[i]
+        body_reader = self._body_readers[id(m)]
+        try:
+            if position < 0:
+                m.seek(offset)
+                return FlowReader(m, body_reader=body_reader)._load_record()[0]
+            if not self._block or self._block[:2] != (m, offset):
+                m.seek(offset)
+                _, data = _decode_block(tnetstring.load(m))  # type: ignore
+                ends = list(_scan(io.BytesIO(data)))
+                self._block = (m, offset, data, [0] + ends[:-1])
+            fo = io.BytesIO(self._block[2])
+            fo.seek(self._block[3][position])
+            return FlowReader(fo, body_reader=body_reader)._load_record()[0]
+        except (ValueError, IndexError):
+            raise exceptions.FlowReadException("Invalid data format.")
+
+
+def _chunks(paths: Iterable[str], chunk_size: int) -> Iterator[Tuple[str, int, int]]:
+    """
+        Split dumps into (path, start, end) ranges of whole flows of about chunk_size bytes.
+    """
+    for path in paths:
+        path = os.path.expanduser(path)
+        entries = index.load_index(path)
+        with open(path, "rb") as fo:
+            if entries is not None:
+                ends = [e.offset + e.size for e in entries]  # type: Iterable[int]
+            else:
+                ends = _scan(fo)
+            start = end = 0
+            for end in ends:
+                if end - start >= chunk_size:
+                    yield path, start, end
+                    start = end
+            if end > start:
+                yield path, start, end
+
+
+def _scan(fo) -> Iterator[int]:
+    end = 0
+    try:
+        while True:
+            end += tnetstring.skip(fo)
+            yield end
+    except ValueError as e:
+        if str(e) == "not a tnetstring: empty file":
+            return
+        raise exceptions.FlowReadException("Invalid data format.")
+
+
+def _read_chunk(path: str, start: int, end: int) -> List[flow.Flow]:
+    with open(path, "rb") as fo:
+        fo.seek(start)
+        data = fo.read(end - start)
+    reader = bodies.BodyReader(bodies.bodies_path(path))
+    return list(FlowReader(io.BytesIO(data), body_reader=reader).stream())
+
+
+def read_flows_parallel(
+    paths: Iterable[str],
+    workers: Optional[int] = None,
+    chunk_size: int = 4 * 1024 * 1024
+) -> Iterator[flow.Flow]:
+    """
+        Yields the flows of the given dumps in order, decoding them in a pool of
+        worker processes.
+
+        The dumps are split into chunks of whole flows of about chunk_size bytes,
+        using the index of a dump if it has one. Workers decode chunks and send the
+        flows back, which is considerably cheaper than decoding them.
+        If workers is None, one worker per CPU is used. With a single worker,
+        flows are read in this process.
+
+        Raises:
+            FlowReadException, if a dump is corrupted.
+            IOError, if a dump can not be read.
+    """
+    if not workers:
+        workers = os.cpu_count() or 1
+    if workers == 1:
+        for path in paths:
+            with open(os.path.expanduser(path), "rb") as fo:
+                yield from FlowReader(fo).stream()
+        return
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        # Only keep a few chunks in flight, so that a slow consumer does not make
+        # decoded flows pile up in memory.
+        pending = collections.deque()  # type: collections.deque
+        for chunk in _chunks(paths, chunk_size):
+            pending.append(pool.submit(_read_chunk, *chunk))
+            if len(pending) > 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
@@ -0,0 +1,72 @@
+"""
+An append-only temporary file for serializable objects that are moved out of
+memory, e.g. old messages of long-lived WebSocket connections.
+
+Objects are stored as consecutive tnetstrings of their state, which is
+exactly the body of a tnetstring list. This allows writers to copy the file
+into a dump without deserializing it.
+"""
+import shutil
+import tempfile
+import threading
+import typing
+
+from mitmproxy.coretypes import serializable
+from mitmproxy.io import tnetstring
+
+
+class Spill:
+    def __init__(self, cls: typing.Type[serializable.Serializable]) -> None:
+        self.cls = cls
+        self.file = tempfile.TemporaryFile()
+        self.count = 0
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.count
+
+    def extend(self, items: typing.Sequence[serializable.Serializable]) -> None:
+        data = b"".join(tnetstring.dumps(i.get_state()) for i in items)
+        with self.lock:
+            self.file.seek(0, 2)
+            self.file.write(data)
+            self.count += len(items)
+            self.size += len(data)
+
+    def _load(self) -> list:
+        with self.lock:
+            self.file.flush()
+            self.file.seek(0)
+            return [tnetstring.load(self.file) for _ in range(self.count)]  # type: ignore
+
+    def __iter__(self):
+        for state in self._load():
+            yield self.cls.from_state(state)
+
+    def get_state(self) -> list:
+        """
+        Read back the state of all spilled objects.
+        """
+        # Round-trip through the class, so that the state has the same types (e.g. tuples)
+        # as the state of objects that were never spilled.
+        return [i.get_state() for i in self]
+
+    def copy_to(self, fo: typing.BinaryIO, size: typing.Optional[int] = None) -> None:
+        """
+        Write the spilled objects to fo as a concatenation of tnetstrings.
+        If size is given, only the first size bytes are copied.
+        """
+        with self.lock:
+            self.file.flush()
+            self.file.seek(0)
+            if size is None:
+                shutil.copyfileobj(self.file, fo)
+                return
+            while size > 0:
+                chunk = self.file.read(min(size, 1024 * 1024))
+                fo.write(chunk)
+                size -= len(chunk)
+
+    def close(self):
+        self.file.close()
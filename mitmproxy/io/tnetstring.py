@@ -22,6 +22,7 @@ This module gives you the following functions:
     :dumps:   dump an object as a tnetstring to a string
     :load:    load a tnetstring-encoded object from a file
     :loads:   load a tnetstring-encoded object from a string
+    :skip:    skip over a tnetstring in a file without parsing it
 
 Note that since parsing a tnetstring requires reading all the data into memory
 at once, there's no efficiency gain from using the file-based versions of these
@@ -153,17 +154,22 @@ def loads(string: bytes) -> TSerializable:
     """
     This function parses a tnetstring into a python object.
     """
-    return pop(string)[0]
+    return _parse_at(string, 0, len(string))[0]
 
 
-def load(file_handle: typing.BinaryIO) -> TSerializable:
-    """load(file) -> object
-
-    This function reads a tnetstring from a file and parses it into a
-    python object.  The file must support the read() method, and this
-    function promises not to read more data than necessary.
+def _read_length(file_handle: typing.BinaryIO) -> int:
     """
-    #  Read the length prefix one char at a time.
+    Read the length prefix of a tnetstring, including the colon.
+    """
+    #  Buffered files let us look at the whole prefix at once without consuming
+    #  anything beyond it. Otherwise, read the prefix one char at a time.
+    peek = getattr(file_handle, "peek", None)
+    if peek:
+        prefix = peek(10)[:10]
+        i = prefix.find(b":")
+        if i > 0 and prefix[:i].isdigit():
+            file_handle.read(i + 1)
+            return int(prefix[:i])
     #  Note that the netstring spec explicitly forbids padding zeros.
     c = file_handle.read(1)
     if c == b"":  # we want to detect this special case.
@@ -176,75 +182,123 @@ def load(file_handle: typing.BinaryIO) -> TSerializable:
         c = file_handle.read(1)
     if c != b":":
         raise ValueError("not a tnetstring: missing or invalid length prefix")
+    return int(data_length)
+
+
+def load(file_handle: typing.BinaryIO) -> TSerializable:
+    """load(file) -> object
+
+    This function reads a tnetstring from a file and parses it into a
+    python object.  The file must support the read() method, and this
+    function promises not to read more data than necessary.
+    """
+    data_length = _read_length(file_handle)
+    data = file_handle.read(data_length + 1)
+    if len(data) != data_length + 1:
+        raise ValueError("not a tnetstring: truncated data")
+    return _parse(data[data_length], data, 0, data_length)
 
-    data = file_handle.read(int(data_length))
-    data_type = file_handle.read(1)[0]
 
-    return parse(data_type, data)
+def skip(file_handle: typing.BinaryIO) -> int:
+    """skip(file) -> length
+
+    This function moves a seekable file past the next tnetstring without
+    reading its data, and returns the total length of the tnetstring.
+    """
+    start = file_handle.tell()
+    data_length = _read_length(file_handle)
+    file_handle.seek(data_length, 1)
+    if file_handle.read(1) == b"":
+        raise ValueError("not a tnetstring: truncated data")
+    return file_handle.tell() - start
 
 
 def parse(data_type: int, data: bytes) -> TSerializable:
-    if data_type == ord(b','):
-        return data
-    if data_type == ord(b';'):
-        return data.decode("utf8")
-    if data_type == ord(b'#'):
+    return _parse(data_type, data, 0, len(data))
+
+
+#  The parser below works on offsets into a single buffer, so that nested
+#  values are not copied once per nesting level.
+
+def _parse(data_type: int, data: bytes, start: int, end: int) -> TSerializable:
+    """
+    Parse data[start:end] as the body of a tnetstring with the given type tag.
+    """
+    if data_type == 125:  # }
+        d = {}
+        while start < end:
+            key, start = _parse_at(data, start, end)
+            val, start = _parse_at(data, start, end)
+            d[key] = val  # type: ignore
+        return d
+    if data_type == 44:  # ,
+        return data[start:end]
+    if data_type == 59:  # ;
+        return data[start:end].decode("utf8")
+    if data_type == 93:  # ]
+        l = []
+        while start < end:
+            item, start = _parse_at(data, start, end)
+            l.append(item)
+        return l
+    if data_type == 35:  # #
         try:
-            return int(data)
+            return int(data[start:end])
         except ValueError:
-            raise ValueError("not a tnetstring: invalid integer literal: {}".format(data))
-    if data_type == ord(b'^'):
+            raise ValueError("not a tnetstring: invalid integer literal: {}".format(data[start:end]))
+    if data_type == 94:  # ^
         try:
-            return float(data)
+            return float(data[start:end])
         except ValueError:
-            raise ValueError("not a tnetstring: invalid float literal: {}".format(data))
-    if data_type == ord(b'!'):
-        if data == b'true':
+            raise ValueError("not a tnetstring: invalid float literal: {}".format(data[start:end]))
+    if data_type == 33:  # !
+        literal = data[start:end]
+        if literal == b'true':
             return True
-        elif data == b'false':
+        elif literal == b'false':
             return False
         else:
-            raise ValueError("not a tnetstring: invalid boolean literal: {}".format(data))
-    if data_type == ord(b'~'):
-        if data:
+            raise ValueError("not a tnetstring: invalid boolean literal: {}".format(literal))
+    if data_type == 126:  # ~
+        if start != end:
             raise ValueError("not a tnetstring: invalid null literal")
         return None
-    if data_type == ord(b']'):
-        l = []
-        while data:
-            item, data = pop(data)
-            l.append(item)  # type: ignore
-        return l
-    if data_type == ord(b'}'):
-        d = {}
-        while data:
-            key, data = pop(data)
-            val, data = pop(data)
-            d[key] = val  # type: ignore
-        return d
     raise ValueError("unknown type tag: {}".format(data_type))
 
 
+def _parse_at(data: bytes, start: int, end: int) -> typing.Tuple[TSerializable, int]:
+    """
+    Parse the tnetstring at data[start:], which must not extend beyond end.
+    Returns the parsed object and the offset after the tnetstring.
+    """
+    colon = data.find(b":", start, start + 11)
+    try:
+        length = int(data[start:colon])
+    except ValueError:
+        raise ValueError("not a tnetstring: missing or invalid length prefix: {}".format(data[start:start + 11]))
+    start = colon + 1
+    body_end = start + length
+    if colon == -1 or length < 0 or body_end >= end:
+        #  This fires if the body or its type tag does not fit,
+        #  meaning we don't need to further validate that data is the right length.
+        raise ValueError("not a tnetstring: invalid length prefix: {}".format(length))
+    data_type = data[body_end]
+    #  Shortcut for the most common leaves.
+    if data_type == 44:  # ,
+        return data[start:body_end], body_end + 1
+    if data_type == 59:  # ;
+        return data[start:body_end].decode("utf8"), body_end + 1
+    return _parse(data_type, data, start, body_end), body_end + 1
+
+
 def pop(data: bytes) -> typing.Tuple[TSerializable, bytes]:
     """
     This function parses a tnetstring into a python object.
     It returns a tuple giving the parsed object and a string
     containing any unparsed data from the end of the string.
     """
-    #  Parse out data length, type and remaining string.
-    try:
-        blength, data = data.split(b':', 1)
-        length = int(blength)
-    except ValueError:
-        raise ValueError("not a tnetstring: missing or invalid length prefix: {}".format(data))
-    try:
-        data, data_type, remain = data[:length], data[length], data[length + 1:]
-    except IndexError:
-        #  This fires if len(data) < dlen, meaning we don't need
-        #  to further validate that data is the right length.
-        raise ValueError("not a tnetstring: invalid length prefix: {}".format(length))
-    # Parse the data based on the type tag.
-    return parse(data_type, data), remain
+    value, end = _parse_at(data, 0, len(data))
+    return value, data[end:]
 
 
 __all__ = ["dump", "dumps", "load", "loads", "pop"]
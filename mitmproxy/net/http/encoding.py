@@ -4,13 +4,11 @@ Utility functions for decoding response bodies.
 
 import codecs
 import collections
-from io import BytesIO
 
-import gzip
 import zlib
 import brotli
 
-from typing import Union, Optional, AnyStr  # noqa
+from typing import Union, Optional, AnyStr, Iterable, Iterator, Dict, Callable, Any  # noqa
 
 
 # We have a shared single-element cache for encoding and decoding.
@@ -107,6 +105,201 @@ def encode(decoded: Optional[str], encoding: str, errors: str='strict') -> Optio
         ))
 
 
+def decode_stream(chunks: Iterable[bytes], encoding: str) -> Iterator[bytes]:
+    """
+    Incrementally decode an iterable of encoded chunks, e.g. a streamed body.
+    Only one chunk is held in memory at a time.
+
+    Raises:
+        ValueError, if the encoding is not supported or decoding fails.
+    """
+    try:
+        decoder = stream_decoders[encoding]()
+    except KeyError:
+        raise ValueError("Unsupported stream encoding: {}".format(repr(encoding)))
+    try:
+        for chunk in chunks:
+            data = decoder.decompress(chunk)
+            if data:
+                yield data
+        data = decoder.flush()
+        if data:
+            yield data
+    except (zlib.error, brotli.Error, EOFError) as e:
+        raise ValueError("{} when decoding stream with {}: {}".format(
+            type(e).__name__,
+            repr(encoding),
+            repr(e),
+        ))
+
+
+def encode_stream(chunks: Iterable[bytes], encoding: str) -> Iterator[bytes]:
+    """
+    Incrementally encode an iterable of chunks, e.g. a streamed body.
+    Only one chunk is held in memory at a time.
+
+    Raises:
+        ValueError, if the encoding is not supported.
+    """
+    try:
+        encoder = stream_encoders[encoding]()
+    except KeyError:
+        raise ValueError("Unsupported stream encoding: {}".format(repr(encoding)))
+    for chunk in chunks:
+        data = encoder.compress(chunk)
+        if data:
+            yield data
+    data = encoder.flush()
+    if data:
+        yield data
+
+
+class _IdentityCoder:
+    def compress(self, data: bytes) -> bytes:
+        if not isinstance(data, bytes):
+            raise TypeError("Expected bytes, not {}".format(type(data).__name__))
+        return data
+
+    decompress = compress
+
+    def flush(self) -> bytes:
+        return b""
+
+
+class _GzipDecoder:
+    """
+        Decompresses gzip data, including files that consist of multiple members.
+    """
+
+    def __init__(self):
+        self.obj = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self.started = False
+
+    def decompress(self, data: bytes) -> bytes:
+        self.started = self.started or bool(data)
+        out = []
+        while data:
+            out.append(self.obj.decompress(data))
+            data = self.obj.unused_data.lstrip(b"\x00")
+            if not data:
+                break
+            self.obj = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        return b"".join(out)
+
+    def flush(self) -> bytes:
+        if self.started and not self.obj.eof:
+            raise EOFError("Compressed file ended before the end-of-stream marker was reached")
+        return self.obj.flush()
+
+
+class _DeflateDecoder:
+    """
+        Decompresses DEFLATE data. Some servers may respond with compressed data
+        without a zlib header or checksum. An undocumented feature of zlib permits
+        the lenient decompression of data missing both values.
+
+        http://bugs.python.org/issue5784
+    """
+
+    def __init__(self):
+        self.obj = zlib.decompressobj()
+        self.head = b""  # data seen before the zlib header has been verified
+
+    def decompress(self, data: bytes) -> bytes:
+        if self.head is None:
+            return self.obj.decompress(data)
+        self.head += data
+        try:
+            out = self.obj.decompress(data)
+        except zlib.error:
+            self.obj = zlib.decompressobj(-15)
+            out = self.obj.decompress(self.head)
+            self.head = None
+            return out
+        if len(self.head) >= 2:
+            self.head = None
+        return out
+
+    def flush(self) -> bytes:
+        if self.head != b"" and not self.obj.eof:
+            raise zlib.error("incomplete or truncated stream")
+        return self.obj.flush()
+
+
+class _BrotliDecoder:
+    def __init__(self):
+        self.obj = brotli.Decompressor()
+        self.started = False
+
+    def decompress(self, data: bytes) -> bytes:
+        self.started = self.started or bool(data)
+        return self.obj.decompress(data)
+
+    def flush(self) -> bytes:
+        if not self.started:
+            return b""
+        try:
+            return self.obj.finish()
+        except AssertionError:
+            # brotlipy asserts instead of raising on some truncated streams.
+            raise brotli.Error("Decompression error: incomplete compressed stream.")
+
+
+class _GzipEncoder:
+    def __init__(self):
+        self.obj = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.obj.compress(data)
+
+    def flush(self) -> bytes:
+        return self.obj.flush()
+
+
+class _DeflateEncoder:
+    """
+        Always includes zlib header and checksum.
+    """
+
+    def __init__(self):
+        self.obj = zlib.compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self.obj.compress(data)
+
+    def flush(self) -> bytes:
+        return self.obj.flush()
+
+
+class _BrotliEncoder:
+    def __init__(self):
+        self.obj = brotli.Compressor()
+
+    def compress(self, data: bytes) -> bytes:
+        if not isinstance(data, bytes):
+            raise TypeError("Expected bytes, not {}".format(type(data).__name__))
+        return self.obj.compress(data)
+
+    def flush(self) -> bytes:
+        return self.obj.finish()
+
+
+stream_decoders = {
+    "none": _IdentityCoder,
+    "identity": _IdentityCoder,
+    "gzip": _GzipDecoder,
+    "deflate": _DeflateDecoder,
+    "br": _BrotliDecoder,
+}  # type: Dict[str, Callable[[], Any]]
+stream_encoders = {
+    "none": _IdentityCoder,
+    "identity": _IdentityCoder,
+    "gzip": _GzipEncoder,
+    "deflate": _DeflateEncoder,
+    "br": _BrotliEncoder,
+}  # type: Dict[str, Callable[[], Any]]
+
+
 def identity(content):
     """
         Returns content unchanged. Identity is the default value of
@@ -115,19 +308,22 @@ def identity(content):
     return content
 
 
+def _decode_all(content: bytes, encoding: str) -> bytes:
+    decoder = stream_decoders[encoding]()
+    return decoder.decompress(content) + decoder.flush()
+
+
+def _encode_all(content: bytes, encoding: str) -> bytes:
+    encoder = stream_encoders[encoding]()
+    return encoder.compress(content) + encoder.flush()
+
+
 def decode_gzip(content: bytes) -> bytes:
-    if not content:
-        return b""
-    gfile = gzip.GzipFile(fileobj=BytesIO(content))
-    return gfile.read()
+    return _decode_all(content, "gzip")
 
 
 def encode_gzip(content: bytes) -> bytes:
-    s = BytesIO()
-    gf = gzip.GzipFile(fileobj=s, mode='wb')
-    gf.write(content)
-    gf.close()
-    return s.getvalue()
+    return _encode_all(content, "gzip")
 
 
 def decode_brotli(content: bytes) -> bytes:
@@ -141,20 +337,7 @@ def encode_brotli(content: bytes) -> bytes:
 
 
 def decode_deflate(content: bytes) -> bytes:
-    """
-        Returns decompressed data for DEFLATE. Some servers may respond with
-        compressed data without a zlib header or checksum. An undocumented
-        feature of zlib permits the lenient decompression of data missing both
-        values.
-
-        http://bugs.python.org/issue5784
-    """
-    if not content:
-        return b""
-    try:
-        return zlib.decompress(content)
-    except zlib.error:
-        return zlib.decompress(content, -15)
+    return _decode_all(content, "deflate")
 
 
 def encode_deflate(content: bytes) -> bytes:
@@ -179,4 +362,4 @@ custom_encode = {
     "br": encode_brotli,
 }
 
-__all__ = ["encode", "decode"]
+__all__ = ["encode", "decode", "encode_stream", "decode_stream"]
@@ -1,5 +1,6 @@
+import copy
 import re
-from typing import Optional, Union  # noqa
+from typing import Any, Optional, Union  # noqa
 
 from mitmproxy.utils import strutils
 from mitmproxy.net.http import encoding
@@ -8,12 +9,30 @@ from mitmproxy.net.http import headers
 
 
 class MessageData(serializable.Serializable):
-    content = None  # type: bytes
+    # The content as it is stored: bytes, None, or an object that loads the content
+    # when it is accessed (see mitmproxy.coretypes.bodystore). The slots of
+    # subclasses are their state, apart from the content.
+    __slots__ = ("stored_content",)
+
+    @property
+    def content(self) -> bytes:
+        c = self.stored_content
+        if c is None or isinstance(c, bytes):
+            return c
+        return c.load()
+
+    @content.setter
+    def content(self, content):
+        self.stored_content = content
 
     def __eq__(self, other):
-        if isinstance(other, MessageData):
-            return self.__dict__ == other.__dict__
-        return False
+        if not isinstance(other, MessageData) or self.__slots__ != other.__slots__:
+            return False
+        # The content is compared last and only if it is not shared, as it may
+        # have to be loaded.
+        return all(getattr(self, k) == getattr(other, k) for k in self.__slots__) and (
+            self.stored_content is other.stored_content or self.content == other.content
+        )
 
     def set_state(self, state):
         for k, v in state.items():
@@ -22,7 +41,8 @@ class MessageData(serializable.Serializable):
             setattr(self, k, v)
 
     def get_state(self):
-        state = vars(self).copy()
+        state = {k: getattr(self, k) for k in self.__slots__}
+        state["content"] = self.content
         state["headers"] = state["headers"].get_state()
         return state
 
@@ -33,7 +53,10 @@ class MessageData(serializable.Serializable):
 
 
 class Message(serializable.Serializable):
-    data = None  # type: MessageData
+    __slots__ = ("data",)
+
+    def __init__(self) -> None:
+        self.data = None  # type: MessageData
 
     def __eq__(self, other):
         if isinstance(other, Message):
@@ -46,6 +69,16 @@ class Message(serializable.Serializable):
     def set_state(self, state):
         self.data.set_state(state)
 
+    def snapshot(self) -> "Message":
+        """
+            A copy of the message that shares its content with the message. Unlike
+            copy(), this neither serializes the message nor loads its content.
+        """
+        m = copy.copy(self)
+        m.data = copy.copy(self.data)
+        m.headers = copy.copy(self.headers)
+        return m
+
     @classmethod
     def from_state(cls, state):
         state["headers"] = headers.Headers.from_state(state["headers"])
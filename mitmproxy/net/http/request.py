@@ -17,6 +17,11 @@ host_header_re = re.compile(r"^(?P<host>[^:]+|\[.+\])(?::(?P<port>\d+))?$")
 
 
 class RequestData(message.MessageData):
+    __slots__ = (
+        "first_line_format", "method", "scheme", "host", "port", "path", "http_version",
+        "headers", "timestamp_start", "timestamp_end",
+    )
+
     def __init__(
         self,
         first_line_format,
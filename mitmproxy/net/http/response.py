@@ -15,6 +15,10 @@ from typing import Union
 
 
 class ResponseData(message.MessageData):
+    __slots__ = (
+        "http_version", "status_code", "reason", "headers", "timestamp_start", "timestamp_end",
+    )
+
     def __init__(
         self,
         http_version,
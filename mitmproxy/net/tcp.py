@@ -6,7 +6,7 @@ import threading
 import time
 import traceback
 
-from typing import Optional  # noqa
+from typing import Optional, Tuple  # noqa
 
 from mitmproxy.net import tls
 
@@ -274,9 +274,10 @@ def close_socket(sock):
 
 
 class _Connection:
-
-    rbufsize = -1
-    wbufsize = -1
+    __slots__ = (
+        "connection", "ip_address", "rfile", "wfile", "rbufsize", "wbufsize",
+        "tls_established", "finished", "__weakref__",
+    )  # type: Tuple[str, ...]
 
     def _makefile(self):
         """
@@ -291,6 +292,8 @@ class _Connection:
         self.wfile = Writer(socket.SocketIO(self.connection, "wb"))
 
     def __init__(self, connection):
+        self.rbufsize = -1
+        self.wbufsize = -1
         if connection:
             self.connection = connection
             self.ip_address = connection.getpeername()
@@ -356,6 +359,9 @@ class ConnectionCloser:
 
 
 class TCPClient(_Connection):
+    __slots__ = (
+        "address", "source_address", "cert", "server_certs", "sni", "spoof_source_address",
+    )  # type: Tuple[str, ...]
 
     def __init__(self, address, source_address=None, spoof_source_address=None):
         super().__init__(None)
@@ -484,6 +490,7 @@ class BaseHandler(_Connection):
     """
         The instantiator is expected to call the handle() and finish() methods.
     """
+    __slots__ = ("address", "server", "clientcert")  # type: Tuple[str, ...]
 
     def __init__(self, connection, address, server):
         super().__init__(connection)
@@ -66,9 +66,19 @@ class Options(optmanager.OptManager):
         refresh_server_playback = None  # type: bool
         replacements = None  # type: Sequence[str]
         replay_kill_extra = None  # type: bool
+        read_workers = None  # type: int
         rfile = None  # type: Optional[str]
+        save_compress = None  # type: bool
+        save_dedup_bodies = None  # type: bool
+        save_index = None  # type: bool
         save_stream_file = None  # type: Optional[str]
         save_stream_filter = None  # type: Optional[str]
+        save_stream_fsync = None  # type: str
+        save_stream_max_files = None  # type: int
+        save_stream_overflow = None  # type: str
+        save_stream_queue = None  # type: int
+        save_stream_rotate_interval = None  # type: int
+        save_stream_rotate_size = None  # type: Optional[str]
         scripts = None  # type: Sequence[str]
         server = None  # type: bool
         server_replay = None  # type: Sequence[str]
@@ -90,7 +100,11 @@ class Options(optmanager.OptManager):
         stickycookie = None  # type: Optional[str]
         stream_large_bodies = None  # type: Optional[str]
         stream_websockets = None  # type: bool
+        tcp_chunk_size = None  # type: int
+        tcp_coalesce_size = None  # type: Optional[str]
+        tcp_coalesce_time = None  # type: int
         tcp_hosts = None  # type: Sequence[str]
+        tcp_max_messages = None  # type: int
         upstream_auth = None  # type: Optional[str]
         upstream_bind_address = None  # type: str
         upstream_cert = None  # type: bool
@@ -103,6 +117,9 @@ class Options(optmanager.OptManager):
         web_open_browser = None  # type: bool
         web_port = None  # type: int
         websocket = None  # type: bool
+        websocket_max_bytes = None  # type: Optional[str]
+        websocket_max_messages = None  # type: int
+        websocket_overflow = None  # type: str
 
     def __init__(self, **kwargs) -> None:
         super().__init__()
@@ -166,6 +183,12 @@ class Options(optmanager.OptManager):
             last-modified headers, as well as adjusting cookie expiration.
             """
         )
+        self.add_option(
+            "read_workers", int, 1,
+            """
+            Number of processes used to decode flow files. 0 means one per CPU.
+            """
+        )
         self.add_option(
             "rfile", Optional[str], None,
             "Read flows from file."
@@ -235,14 +258,85 @@ class Options(optmanager.OptManager):
             "The default content view mode.",
             choices = [i.name.lower() for i in contentviews.views]
         )
+        self.add_option(
+            "save_compress", bool, False,
+            """
+            Compress saved flow files in blocks of flows. Compression runs in a
+            background thread. Compressed files are not indexed.
+            """
+        )
+        self.add_option(
+            "save_dedup_bodies", bool, False,
+            """
+            Store every distinct large HTTP body of saved flows only once, in a
+            file next to the flow file (<file>.bodies). The flow file can not be
+            read without it.
+            """
+        )
+        self.add_option(
+            "save_index", bool, False,
+            """
+            Write an index next to saved flow files (<file>.idx), which allows
+            reading individual flows without loading the whole file.
+            """
+        )
         self.add_option(
             "save_stream_file", Optional[str], None,
-            "Stream flows to file as they arrive. Prefix path with + to append."
+            """
+            Stream flows to file as they arrive. Prefix path with + to append.
+            The path may contain strftime patterns, which are expanded
+            whenever a new file is started.
+            """
+        )
+        self.add_option(
+            "save_stream_rotate_size", Optional[str], None,
+            """
+            Start a new stream file when the current one reaches this size,
+            e.g. 512m. Each file is a complete flow dump.
+            """
+        )
+        self.add_option(
+            "save_stream_rotate_interval", int, 0,
+            """
+            Start a new stream file after this many seconds. 0 disables
+            time-based rotation.
+            """
+        )
+        self.add_option(
+            "save_stream_max_files", int, 0,
+            """
+            Delete the oldest stream files (and their indexes) once more than
+            this many have been written. 0 keeps all files.
+            """
         )
         self.add_option(
             "save_stream_filter", Optional[str], None,
             "Filter which flows are written to file."
         )
+        self.add_option(
+            "save_stream_queue", int, 0,
+            """
+            Write streamed flows in a background thread, queueing up to this
+            many flows. 0 writes flows synchronously. The background thread
+            reports its progress every minute.
+            """
+        )
+        self.add_option(
+            "save_stream_fsync", str, "never",
+            """
+            When to sync flows written in the background to disk: never, after
+            every batch of flows, or when the file is closed.
+            """,
+            choices=["never", "batch", "close"]
+        )
+        self.add_option(
+            "save_stream_overflow", str, "block",
+            """
+            What to do with streamed flows when the background queue is full:
+            block until there is room, or drop the flow.
+            """,
+            choices=["block", "drop"]
+        )
         self.add_option(
             "server_replay_ignore_content", bool, False,
             "Ignore request's content while searching for a saved flow to replay."
@@ -381,6 +475,30 @@ class Options(optmanager.OptManager):
             "Enable/disable WebSocket support. "
             "WebSocket support is enabled by default.",
         )
+        self.add_option(
+            "websocket_max_messages", int, 0,
+            """
+            Maximum number of messages kept in memory per WebSocket flow. 0
+            means unlimited.
+            """
+        )
+        self.add_option(
+            "websocket_max_bytes", Optional[str], None,
+            """
+            Maximum size of the messages kept in memory per WebSocket flow.
+            Understands k/m/g suffixes, i.e. 3m for 3 megabytes.
+            """
+        )
+        self.add_option(
+            "websocket_overflow", str, "drop",
+            """
+            What to do with the oldest WebSocket messages when a flow exceeds
+            websocket_max_messages or websocket_max_bytes: drop them and only
+            count them, or spill them to a temporary file from which they are
+            still saved with the flow.
+            """,
+            choices=["drop", "spill"]
+        )
         self.add_option(
             "rawtcp", bool, False,
             "Enable/disable experimental raw TCP support. TCP connections starting with non-ascii "
@@ -441,6 +559,33 @@ class Options(optmanager.OptManager):
             communication contents are printed to the log in verbose mode.
             """
         )
+        self.add_option(
+            "tcp_chunk_size", int, 4096,
+            "Number of bytes read at once from raw TCP connections."
+        )
+        self.add_option(
+            "tcp_coalesce_size", Optional[str], None,
+            """
+            Coalesce consecutive raw TCP chunks sent in the same direction into
+            a single message of up to this size before the tcp_message event
+            fires. Understands k/m/g suffixes, i.e. 64k for 64 kilobytes.
+            """
+        )
+        self.add_option(
+            "tcp_coalesce_time", int, 10,
+            """
+            Maximum time in milliseconds that raw TCP data is held back while
+            coalescing messages.
+            """
+        )
+        self.add_option(
+            "tcp_max_messages", int, 0,
+            """
+            Number of messages retained per TCP flow. Older messages are
+            discarded in batches once the flow holds twice as many, so a flow
+            keeps between one and two times this number. 0 means unlimited.
+            """
+        )
 
         self.add_option(
             "intercept_active", bool, False,
@@ -1,4 +1,6 @@
+import os
 import socket
+import time
 
 from OpenSSL import SSL
 
@@ -7,10 +9,152 @@ from mitmproxy import tcp
 from mitmproxy import flow
 from mitmproxy import exceptions
 from mitmproxy.proxy.protocol import base
+from mitmproxy.utils import human
+
+
+class _Forwarder:
+
+    """
+    Moves data from one connection to the other. Calling a forwarder receives data from src,
+    which must be ready for reading, and returns the number of bytes received (0 on EOF).
+    """
+
+    def __call__(self, src, dst) -> int:
+        raise NotImplementedError()
+
+    @property
+    def timeout(self) -> float:
+        """
+        Time until the forwarder wants to be flushed.
+        """
+        return 10
+
+    def flush(self):
+        """
+        Sends out any data held back by the forwarder.
+        """
+
+    def close(self):
+        pass
+
+
+class _BufferForwarder(_Forwarder):
+
+    """
+    Relays data through a single reusable buffer. No objects are created per chunk.
+    """
+
+    def __init__(self, chunk_size):
+        self.buf = memoryview(bytearray(chunk_size))
+
+    def __call__(self, src, dst):
+        size = src.recv_into(self.buf)
+        if size:
+            dst.sendall(self.buf[:size])
+        return size
+
+
+class _SpliceForwarder(_Forwarder):
+
+    """
+    Relays data between plain sockets with os.splice() through one pipe per direction,
+    so that the payload is never copied into Python. Only available on Linux.
+    """
+
+    def __init__(self, chunk_size):
+        self.chunk_size = chunk_size
+        self.pipes = {}
+
+    def __call__(self, src, dst):
+        if src not in self.pipes:
+            self.pipes[src] = os.pipe()
+        r, w = self.pipes[src]
+        size = os.splice(src.fileno(), w, self.chunk_size)
+        remaining = size
+        while remaining:
+            remaining -= os.splice(r, dst.fileno(), remaining)
+        return size
+
+    def close(self):
+        for r, w in self.pipes.values():
+            os.close(r)
+            os.close(w)
+        self.pipes.clear()
+
+
+class _MessageForwarder(_Forwarder):
+
+    """
+    Records received data as TCPMessages on the flow and forwards them after the
+    tcp_message event. Consecutive chunks in the same direction are coalesced into a single
+    message until coalesce_size bytes are held back or coalesce_time seconds have passed.
+    """
+
+    def __init__(self, layer, f, chunk_size, coalesce_size=0, coalesce_time=0, max_messages=0):
+        self.layer = layer
+        self.flow = f
+        self.buf = memoryview(bytearray(chunk_size))
+        self.coalesce_size = coalesce_size
+        self.coalesce_time = coalesce_time
+        self.max_messages = max_messages
+
+        self.pending = []
+        self.pending_size = 0
+        self.pending_dst = None
+        self.deadline = None
+
+    def __call__(self, src, dst):
+        size = src.recv_into(self.buf)
+        if not size:
+            return 0
+        if dst is not self.pending_dst:
+            self.flush()
+            self.pending_dst = dst
+            self.deadline = time.time() + self.coalesce_time
+        self.pending.append(self.buf[:size].tobytes())
+        self.pending_size += size
+        if self.pending_size >= self.coalesce_size or time.time() >= self.deadline:
+            self.flush()
+        return size
+
+    @property
+    def timeout(self):
+        if self.deadline is None:
+            return 10
+        return max(0, self.deadline - time.time())
+
+    def flush(self):
+        if not self.pending:
+            return
+        dst = self.pending_dst
+        if len(self.pending) == 1:
+            content = self.pending[0]
+        else:
+            content = b"".join(self.pending)
+        self.pending = []
+        self.pending_size = 0
+        self.pending_dst = None
+        self.deadline = None
+
+        tcp_message = tcp.TCPMessage(dst == self.layer.server_conn.connection, content)
+        self.flow.messages.append(tcp_message)
+        # Trimming in batches keeps the cost per message constant.
+        if self.max_messages and len(self.flow.messages) >= 2 * self.max_messages:
+            del self.flow.messages[:-self.max_messages]
+        self.layer.channel.ask("tcp_message", self.flow)
+        dst.sendall(tcp_message.content)
+
+
+def _passthrough_forwarder(conns, chunk_size):
+    if hasattr(os, "splice") and not any(isinstance(c, SSL.Connection) for c in conns):
+        return _SpliceForwarder(chunk_size)
+    return _BufferForwarder(chunk_size)
 
 
 class RawTCPLayer(base.Layer):
-    chunk_size = 4096
+    # Ignored connections create no TCPMessages, so we can afford much larger reads.
+    # This matches the default pipe capacity on Linux.
+    passthrough_chunk_size = 65536
 
     def __init__(self, ctx, ignore=False):
         self.ignore = ignore
@@ -23,20 +167,34 @@ class RawTCPLayer(base.Layer):
             f = tcp.TCPFlow(self.client_conn, self.server_conn, self)
             self.channel.ask("tcp_start", f)
 
-        buf = memoryview(bytearray(self.chunk_size))
-
         client = self.client_conn.connection
         server = self.server_conn.connection
         conns = [client, server]
 
+        if self.ignore:
+            forward = _passthrough_forwarder(conns, self.passthrough_chunk_size)
+        else:
+            options = self.config.options
+            forward = _MessageForwarder(
+                self,
+                f,
+                options.tcp_chunk_size,
+                human.parse_size(options.tcp_coalesce_size) or 0,
+                options.tcp_coalesce_time / 1000,
+                options.tcp_max_messages,
+            )
+
         try:
             while not self.channel.should_exit.is_set():
-                r = mitmproxy.net.tcp.ssl_read_select(conns, 10)
+                r = mitmproxy.net.tcp.ssl_read_select(conns, forward.timeout)
+                if not r:
+                    forward.flush()
                 for conn in r:
                     dst = server if conn == client else client
 
-                    size = conn.recv_into(buf, self.chunk_size)
+                    size = forward(conn, dst)
                     if not size:
+                        forward.flush()
                         conns.remove(conn)
                         # Shutdown connection to the other peer
                         if isinstance(conn, SSL.Connection):
@@ -48,18 +206,12 @@ class RawTCPLayer(base.Layer):
 
                         if len(conns) == 0:
                             return
-                        continue
-
-                    tcp_message = tcp.TCPMessage(dst == server, buf[:size].tobytes())
-                    if not self.ignore:
-                        f.messages.append(tcp_message)
-                        self.channel.ask("tcp_message", f)
-                    dst.sendall(tcp_message.content)
 
         except (socket.error, exceptions.TcpException, SSL.Error) as e:
             if not self.ignore:
                 f.error = flow.Error("TCP connection closed unexpectedly: {}".format(repr(e)))
                 self.channel.tell("tcp_error", f)
         finally:
+            forward.close()
             if not self.ignore:
                 self.channel.tell("tcp_end", f)
@@ -1,4 +1,7 @@
+import collections
 import socket
+import struct
+from typing import Dict, List  # noqa
 from OpenSSL import SSL
 
 
@@ -9,13 +12,70 @@ from wsproto.extensions import PerMessageDeflate
 
 from mitmproxy import exceptions
 from mitmproxy import flow
+from mitmproxy.io import spill
 from mitmproxy.proxy.protocol import base
 from mitmproxy.net import tcp
-from mitmproxy.net import websockets
 from mitmproxy.websocket import WebSocketFlow, WebSocketMessage
+from mitmproxy.utils import human
 from mitmproxy.utils import strutils
 
 
+class _FrameSplitter:
+
+    """
+        Tracks frame boundaries in the raw byte stream of one direction, so that the
+        original frames of a message can be forwarded without re-encoding them.
+
+        Only lengths are parsed - payloads are neither unmasked nor decompressed.
+        Control frames are skipped, they are handled by wsproto.
+    """
+
+    def __init__(self):
+        self.buf = bytearray()
+        self.frames = []  # type: List[bytes]
+        self.messages = collections.deque()
+
+    def _frame_length(self):
+        if len(self.buf) < 2:
+            return None
+        header_length = 2
+        payload_length = self.buf[1] & 0x7f
+        if payload_length == 126:
+            if len(self.buf) < 4:
+                return None
+            header_length = 4
+            payload_length, = struct.unpack_from("!H", self.buf, 2)
+        elif payload_length == 127:
+            if len(self.buf) < 10:
+                return None
+            header_length = 10
+            payload_length, = struct.unpack_from("!Q", self.buf, 2)
+        if self.buf[1] & 0x80:
+            header_length += 4  # masking key
+        return header_length + payload_length
+
+    def receive_bytes(self, data):
+        self.buf += data
+        while True:
+            length = self._frame_length()
+            if length is None or len(self.buf) < length:
+                return
+            frame = bytes(self.buf[:length])
+            del self.buf[:length]
+            if frame[0] & 0x08:
+                continue  # control frame
+            self.frames.append(frame)
+            if frame[0] & 0x80:
+                self.messages.append(self.frames)
+                self.frames = []
+
+    def pop_message(self):
+        """
+            Returns the raw frames of the oldest complete message.
+        """
+        return self.messages.popleft()
+
+
 class WebSocketLayer(base.Layer):
     """
         WebSocket layer to intercept, modify, and forward WebSocket messages.
@@ -38,9 +98,15 @@ class WebSocketLayer(base.Layer):
         This layer is transparent to any negotiated subprotocols.
         Only raw frames are forwarded to the other endpoint.
 
+        Messages that are not modified by an addon are forwarded as the original frames,
+        unless permessage-deflate with context takeover makes re-compression necessary.
+
         WebSocket messages are stored in a WebSocketFlow.
     """
 
+    # Maximum number of bytes read from a connection at once.
+    chunk_size = 65536
+
     def __init__(self, ctx, handshake_flow):
         super().__init__(ctx)
         self.handshake_flow = handshake_flow
@@ -48,13 +114,26 @@ class WebSocketLayer(base.Layer):
 
         self.client_frame_buffer = []
         self.server_frame_buffer = []
+        self.splitters = {
+            self.client_conn: _FrameSplitter(),
+            self.server_conn: _FrameSplitter(),
+        }
+        self.retained_bytes = 0
 
         self.connections = {}  # type: Dict[object, WSConnection]
 
         extensions = []
+        # Original frames can only be forwarded if every message is compressed independently,
+        # otherwise the compression contexts of both endpoints would go out of sync.
+        self.forward_original_frames = True
         if 'Sec-WebSocket-Extensions' in handshake_flow.response.headers:
-            if PerMessageDeflate.name in handshake_flow.response.headers['Sec-WebSocket-Extensions']:
+            extension_header = handshake_flow.response.headers['Sec-WebSocket-Extensions']
+            if PerMessageDeflate.name in extension_header:
                 extensions = [PerMessageDeflate()]
+                self.forward_original_frames = (
+                    "client_no_context_takeover" in extension_header and
+                    "server_no_context_takeover" in extension_header
+                )
         self.connections[self.client_conn] = WSConnection(ConnectionType.SERVER,
                                                           extensions=extensions)
         self.connections[self.server_conn] = WSConnection(ConnectionType.CLIENT,
@@ -103,13 +182,21 @@ class WebSocketLayer(base.Layer):
                 payload = b''.join(fb)
 
             fb.clear()
+            original_frames = self.splitters[source_conn].pop_message()
 
             websocket_message = WebSocketMessage(message_type, not is_server, payload)
             length = len(websocket_message.content)
             self.flow.messages.append(websocket_message)
             self.channel.ask("websocket_message", self.flow)
 
-            if not self.flow.stream and not websocket_message.killed:
+            if (
+                not self.flow.stream and
+                not websocket_message.killed and
+                self.forward_original_frames and
+                websocket_message.content == payload
+            ):
+                other_conn.send(b"".join(original_frames))
+            elif not self.flow.stream and not websocket_message.killed:
                 def get_chunk(payload):
                     if len(payload) == length:
                         # message has the same length, we can reuse the same sizes
@@ -129,11 +216,41 @@ class WebSocketLayer(base.Layer):
                     self.connections[other_conn].send_data(chunk, final)
                     other_conn.send(self.connections[other_conn].bytes_to_send())
 
+            self.retained_bytes += len(websocket_message.content)
+            self._limit_messages()
+
         if self.flow.stream:
             self.connections[other_conn].send_data(event.data, event.message_finished)
             other_conn.send(self.connections[other_conn].bytes_to_send())
         return True
 
+    def _limit_messages(self):
+        """
+            Moves the oldest messages out of memory once the flow exceeds
+            websocket_max_messages or websocket_max_bytes.
+        """
+        max_messages = self.config.options.websocket_max_messages
+        max_bytes = human.parse_size(self.config.options.websocket_max_bytes)
+        messages = self.flow.messages
+
+        count = max(len(messages) - max_messages, 0) if max_messages else 0
+        evicted_bytes = sum(len(m.content) for m in messages[:count])
+        if max_bytes is not None:
+            while count < len(messages) and self.retained_bytes - evicted_bytes > max_bytes:
+                evicted_bytes += len(messages[count].content)
+                count += 1
+        if not count:
+            return
+
+        if self.config.options.websocket_overflow == "spill":
+            if self.flow.spill is None:
+                self.flow.spill = spill.Spill(WebSocketMessage)
+            self.flow.spill.extend(messages[:count])
+        else:
+            self.flow.dropped_messages += count
+        del messages[:count]
+        self.retained_bytes -= evicted_bytes
+
     def _handle_ping_received(self, event, source_conn, other_conn, is_server):
         # PING is automatically answered with a PONG by wsproto
         self.connections[other_conn].ping()
@@ -182,8 +299,11 @@ class WebSocketLayer(base.Layer):
                     other_conn = self.server_conn if conn == self.client_conn.connection else self.client_conn
                     is_server = (source_conn == self.server_conn)
 
-                    frame = websockets.Frame.from_file(source_conn.rfile)
-                    self.connections[source_conn].receive_bytes(bytes(frame))
+                    data = conn.recv(self.chunk_size)
+                    if not data:
+                        raise exceptions.TcpDisconnect()
+                    self.splitters[source_conn].receive_bytes(data)
+                    self.connections[source_conn].receive_bytes(data)
                     source_conn.send(self.connections[source_conn].bytes_to_send())
 
                     if close_received:
@@ -1,3 +1,4 @@
+import functools
 import typing
 from typing import Any  # noqa
 from typing import MutableMapping  # noqa
@@ -13,6 +14,7 @@ class StateObject(serializable.Serializable):
     State attributes can either be serializable types(str, tuple, bool, ...)
     or StateObject instances themselves.
     """
+    __slots__ = ()  # type: typing.Tuple[str, ...]
 
     _stateobject_attributes = None  # type: MutableMapping[str, Any]
     """
@@ -50,6 +52,55 @@ class StateObject(serializable.Serializable):
             raise RuntimeWarning("Unexpected State in __setstate__: {}".format(state))
 
 
+class Snapshot:
+    """
+    The state attributes of a StateObject as they are, with nested StateObjects
+    taken likewise and lists and dicts copied. Unlike get_state(), this does not
+    serialize anything, so that it is cheap to take and to match against the
+    object later on. Other attribute values are expected to be replaced rather
+    than changed in place.
+    """
+    __slots__ = ("cls", "values")
+
+    def __init__(self, obj: StateObject) -> None:
+        self.cls = type(obj)
+        self.values = {
+            attr: _snapshot(getattr(obj, attr))
+            for attr in obj._stateobject_attributes
+        }
+
+    def matches(self, obj: typing.Any) -> bool:
+        return type(obj) is self.cls and all(
+            _matches(v, getattr(obj, attr)) for attr, v in self.values.items()
+        )
+
+    def get_state(self):
+        return {
+            attr: get_state(cls, self.values[attr])
+            for attr, cls in self.cls._stateobject_attributes.items()
+        }
+
+
+def _snapshot(val: typing.Any) -> typing.Any:
+    if isinstance(val, StateObject):
+        return Snapshot(val)
+    elif isinstance(val, (list, dict)):
+        return val.copy()
+    return val
+
+
+def _matches(snapshot: typing.Any, val: typing.Any) -> bool:
+    if isinstance(snapshot, Snapshot):
+        return snapshot.matches(val)
+    return snapshot is val or (snapshot is not None and val is not None and snapshot == val)
+
+
+@functools.lru_cache(maxsize=None)
+def _typename(typeinfo: typecheck.Type) -> str:
+    # The names of typing types are expensive to build, and needed for every value.
+    return str(typeinfo)
+
+
 def _process(typeinfo: typecheck.Type, val: typing.Any, make: bool) -> typing.Any:
     if val is None:
         return None
@@ -58,7 +109,7 @@ def _process(typeinfo: typecheck.Type, val: typing.Any, make: bool) -> typing.An
     elif not make and hasattr(val, "get_state"):
         return val.get_state()
 
-    typename = str(typeinfo)
+    typename = _typename(typeinfo)
 
     if typename.startswith("typing.List"):
         T = typecheck.sequence_type(typeinfo)
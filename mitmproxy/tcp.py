@@ -7,6 +7,7 @@ from mitmproxy.coretypes import serializable
 
 
 class TCPMessage(serializable.Serializable):
+    __slots__ = ("from_client", "content", "timestamp")
 
     def __init__(self, from_client, content, timestamp=None):
         self.from_client = from_client
@@ -35,6 +36,7 @@ class TCPFlow(flow.Flow):
     """
     A TCPFlow is a simplified representation of a TCP session.
     """
+    __slots__ = ("messages",)
 
     def __init__(self, client_conn, server_conn, live=None):
         super().__init__("tcp", client_conn, server_conn, live)
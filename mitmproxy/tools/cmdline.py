@@ -119,6 +119,15 @@ def mitmdump(opts):
 
     common_options(parser, opts)
     opts.make_parser(parser, "flow_detail", metavar = "LEVEL")
+    parser.add_argument(
+        "--upgrade-dump",
+        nargs=2, metavar=("IN", "OUT"), dest="upgrade_dump",
+        help="""
+            Rewrite a flow file written by an older version of mitmproxy in the
+            current format and exit. Reading the new file skips the migration
+            of every flow.
+        """
+    )
     parser.add_argument(
         'filter_args',
         nargs="...",
@@ -16,6 +16,7 @@ import typing  # noqa
 
 from mitmproxy.tools import cmdline  # noqa
 from mitmproxy import exceptions, master  # noqa
+from mitmproxy import io  # noqa
 from mitmproxy import options  # noqa
 from mitmproxy import optmanager  # noqa
 from mitmproxy import proxy  # noqa
@@ -39,10 +40,27 @@ def assert_utf8_env():
         sys.exit(1)
 
 
+def upgrade_dump(src, dst):
+    src, dst = os.path.expanduser(src), os.path.expanduser(dst)
+    try:
+        # Opening dst for writing would truncate src before it is read.
+        if os.path.exists(dst) and os.path.samefile(src, dst):
+            raise IOError("source and destination are the same file")
+        with open(src, "rb") as fi, open(dst, "wb") as fo:
+            n = io.upgrade_dump(fi, fo)
+    except (IOError, exceptions.FlowReadException) as e:
+        print("Cannot upgrade {}: {}".format(src, e), file=sys.stderr)
+        sys.exit(1)
+    print("Upgraded {} flows.".format(n))
+    sys.exit(0)
+
+
 def process_options(parser, opts, args):
     if args.version:
         print(debug.dump_system_info())
         sys.exit(0)
+    if getattr(args, "upgrade_dump", None):
+        upgrade_dump(*args.upgrade_dump)
     if args.quiet or args.options or args.commands:
         args.verbosity = 'error'
         args.flow_detail = 0
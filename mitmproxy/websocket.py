@@ -14,6 +14,7 @@ class WebSocketMessage(serializable.Serializable):
     """
     A WebSocket message sent from one endpoint to the other.
     """
+    __slots__ = ("type", "from_client", "content", "timestamp", "killed")
 
     def __init__(
         self, type: int, from_client: bool, content: bytes, timestamp: Optional[int]=None, killed: bool=False
@@ -64,7 +65,14 @@ class WebSocketFlow(flow.Flow):
         super().__init__("websocket", client_conn, server_conn, live)
 
         self.messages = []  # type: List[WebSocketMessage]
-        """A list containing all WebSocketMessage's."""
+        """A list containing all WebSocketMessage's kept in memory."""
+        self.spill = None
+        """
+        A mitmproxy.io.spill.Spill holding older messages that were moved out of memory,
+        or None. Spilled messages are part of the flow's state.
+        """
+        self.dropped_messages = 0
+        """The number of messages that were discarded to limit memory usage."""
         self.close_sender = 'client'
         """'client' if the client initiated connection closing."""
         self.close_code = CloseReason.NORMAL_CLOSURE
@@ -97,6 +105,7 @@ class WebSocketFlow(flow.Flow):
     # mypy doesn't support update with kwargs
     _stateobject_attributes.update(dict(
         messages=List[WebSocketMessage],
+        dropped_messages=int,
         close_sender=str,
         close_code=int,
         close_message=str,
@@ -113,10 +122,24 @@ class WebSocketFlow(flow.Flow):
     ))
 
     def get_state(self):
+        d = self.get_memory_state()
+        if self.spill:
+            d['messages'] = self.spill.get_state() + d['messages']
+        return d
+
+    def get_memory_state(self):
+        """
+        Like get_state(), but without the messages that were spilled to disk.
+        """
         d = super().get_state()
         d['close_code'] = int(d['close_code'])  # replace enum with bare int
         return d
 
+    def set_state(self, state):
+        # The state includes all spilled messages.
+        self.spill = None
+        super().set_state(state)
+
     @classmethod
     def from_state(cls, state):
         f = cls(None, None, None)
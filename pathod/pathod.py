@@ -68,7 +68,6 @@ class SSLOptions:
 
 
 class PathodHandler(tcp.BaseHandler):
-    wbufsize = 0
     sni = None  # type: typing.Union[str, None, bool]
 
     def __init__(
@@ -81,6 +80,7 @@ class PathodHandler(tcp.BaseHandler):
         http2_framedump=False
     ):
         tcp.BaseHandler.__init__(self, connection, address, server)
+        self.wbufsize = 0
         self.logfp = logfp
         self.settings = copy.copy(settings)
         self.protocol = None
@@ -0,0 +1,50 @@
+# Measure how long it takes to parse typical filter expressions.
+#
+# Parsing is timed with the parse cache cleared before every run, and once
+# more with the cache in place.
+
+import time
+
+import click
+
+from mitmproxy import flowfilter
+
+EXPRESSIONS = [
+    "~q",
+    "example.com",
+    "~d example.com & ~c 200",
+    "~h 'content-type: text/html' & !~a",
+    "~m POST & (~bq password | ~bq token) & !~d localhost",
+    "(~u /api/ | ~u /v2/) & ~s & !(~c 200 | ~c 304 )",
+    "~websocket | ~tcp | ~t \"application/(json|xml)\"",
+]
+
+
+def timed(n, cached):
+    total = 0.0
+    for _ in range(n):
+        if not cached:
+            flowfilter.parse.cache_clear()
+        start = time.perf_counter()
+        for e in EXPRESSIONS:
+            assert flowfilter.parse(e)
+        total += time.perf_counter() - start
+    return total / (n * len(EXPRESSIONS))
+
+
+@click.command()
+@click.option('--runs', default=1000, type=click.INT)
+def main(runs):
+    for e in EXPRESSIONS:
+        flowfilter.parse.cache_clear()
+        start = time.perf_counter()
+        for _ in range(runs):
+            flowfilter.parse.cache_clear()
+            flowfilter.parse(e)
+        print("{:>8.1f}us  {}".format((time.perf_counter() - start) / runs * 1e6, e))
+    print("{:>8.1f}us  average".format(timed(runs, False) * 1e6))
+    print("{:>8.2f}us  average, cached".format(timed(runs, True) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+# Measure how long it takes to back up a flow and to check whether it was
+# modified, for growing message bodies.
+#
+# The console checks every flow it displays for modifications, so modified() is
+# timed both right after the backup and after an edit. The response body is
+# moved to disk by a body store, as large bodies are in the view.
+
+import time
+
+import click
+
+from mitmproxy.coretypes import bodystore
+from mitmproxy.test import tflow
+
+
+def timed(fn, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n
+
+
+@click.command()
+@click.option('--runs', default=1000, type=click.INT)
+def main(runs):
+    store = bodystore.BodyStore(min_size=0, spill_size=0)
+    for size in (0, 10 ** 4, 10 ** 6):
+        f = tflow.tflow(resp=True)
+        f.request.content = b"x" * size
+        f.response.content = b"y" * size
+        f.response.data.content = store.add(f.response.content)
+
+        def backup():
+            f._backup = None
+            f.backup()
+
+        b = timed(backup, runs)
+        unmodified = timed(f.modified, runs)
+        f.response.headers["x-edited"] = "1"
+        modified = timed(f.modified, runs)
+        print("{:>8}b  backup {:>7.1f}us  modified() {:>5.1f}us / {:>5.1f}us".format(
+            size, b * 1e6, unmodified * 1e6, modified * 1e6
+        ))
+
+
+if __name__ == '__main__':
+    main()
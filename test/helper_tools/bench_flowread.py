@@ -0,0 +1,73 @@
+# Measure how fast flow dumps are loaded.
+#
+# Without a path, a dump of the given size is generated from test flows
+# with random bodies. The time for parsing the tnetstrings alone and for
+# reading complete flows is reported separately.
+
+import os
+import tempfile
+import time
+
+import click
+
+from mitmproxy import io
+from mitmproxy.io import tnetstring
+from mitmproxy.test import tflow
+
+
+def generate(path, megabytes, body):
+    total = megabytes * 1024 ** 2
+    with open(path, "wb") as fo:
+        w = io.FlowWriter(fo)
+        while fo.tell() < total:
+            f = tflow.tflow(resp=True)
+            f.request.content = os.urandom(body // 4)
+            f.response.content = os.urandom(body)
+            w.add(f)
+
+
+def timed(path, fn):
+    with open(path, "rb") as fo:
+        start = time.time()
+        n = fn(fo)
+        duration = time.time() - start
+    size = os.path.getsize(path) / 1024 ** 2
+    return n, duration, size / duration
+
+
+def parse(fo):
+    n = 0
+    try:
+        while True:
+            tnetstring.load(fo)
+            n += 1
+    except ValueError:
+        return n
+
+
+def read(fo):
+    return sum(1 for _ in io.FlowReader(fo).stream())
+
+
+@click.command()
+@click.argument("path", required=False)
+@click.option('--megabytes', default=1024, type=click.INT)
+@click.option('--body', default=4096, type=click.INT, help="Response body size of generated flows.")
+def main(path, megabytes, body):
+    tmp = None
+    if not path:
+        tmp = tempfile.NamedTemporaryFile(delete=False)
+        tmp.close()
+        path = tmp.name
+        generate(path, megabytes, body)
+    try:
+        for name, fn in (("tnetstring", parse), ("flows", read)):
+            n, duration, speed = timed(path, fn)
+            print("{:<10} {} records in {:.2f}s ({:.1f} MB/s)".format(name, n, duration, speed))
+    finally:
+        if tmp:
+            os.unlink(tmp.name)
+
+
+if __name__ == '__main__':
+    main()
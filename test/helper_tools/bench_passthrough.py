@@ -0,0 +1,68 @@
+# Measure the throughput of ignored (pass-through) connections relative
+# to a direct connection.
+#
+# Start mitmdump with all hosts ignored first:
+#
+#   mitmdump -q --ignore-hosts '.*'
+#
+# and then run this script, which sends data to a local sink server both
+# directly and through the proxy using HTTP CONNECT.
+
+import socket
+import threading
+import time
+
+import click
+
+
+def sink(server):
+    while True:
+        conn, _ = server.accept()
+        with conn:
+            buf = bytearray(1024 * 1024)
+            while conn.recv_into(buf):
+                pass
+            conn.sendall(b"done")
+
+
+def transfer(sock, total, chunk):
+    data = b"x" * chunk
+    start = time.time()
+    sent = 0
+    while sent < total:
+        sock.sendall(data)
+        sent += chunk
+    sock.shutdown(socket.SHUT_WR)
+    assert sock.recv(4) == b"done"
+    return total / (time.time() - start) / 1024 ** 2
+
+
+@click.command()
+@click.option('--proxy', default="127.0.0.1:8080")
+@click.option('--megabytes', default=1024, type=click.INT)
+@click.option('--chunk', default=65536, type=click.INT)
+def main(proxy, megabytes, chunk):
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen(5)
+    port = server.getsockname()[1]
+    threading.Thread(target=sink, args=(server,), daemon=True).start()
+    total = megabytes * 1024 ** 2
+
+    with socket.create_connection(("127.0.0.1", port)) as s:
+        direct = transfer(s, total, chunk)
+    print("Direct:       {:.1f} MB/s".format(direct))
+
+    host, proxy_port = proxy.rsplit(":", 1)
+    with socket.create_connection((host, int(proxy_port))) as s:
+        s.sendall("CONNECT 127.0.0.1:{0} HTTP/1.1\r\nHost: 127.0.0.1:{0}\r\n\r\n".format(port).encode())
+        resp = b""
+        while not resp.endswith(b"\r\n\r\n"):
+            resp += s.recv(1)
+        assert b" 200 " in resp, resp
+        proxied = transfer(s, total, chunk)
+    print("Pass-through: {:.1f} MB/s ({:.0%} of direct)".format(proxied, proxied / direct))
+
+
+if __name__ == '__main__':
+    main()
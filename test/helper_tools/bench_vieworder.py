@@ -0,0 +1,36 @@
+# Measure how long it takes to switch the order of a large view.
+#
+# Every order is switched to twice: the first switch generates the keys
+# of all flows, the second one reuses them.
+
+import time
+
+import click
+
+from mitmproxy.addons import view
+from mitmproxy.test import taddons
+from mitmproxy.test import tflow
+
+
+@click.command()
+@click.option('--flows', default=100000, type=click.INT)
+def main(flows):
+    base = tflow.tflow(resp=True)
+    lst = []
+    for i in range(flows):
+        f = base.copy()
+        f.request.timestamp_start = (i * 7919) % flows
+        f.request.path = "/%d" % ((i * 31) % flows)
+        lst.append(f)
+    v = view.View()
+    with taddons.context():
+        v.add(lst)
+        for rnd in ("new", "cached"):
+            for name in ("url", "size", "method", "time"):
+                start = time.perf_counter()
+                v.set_order(v.orders[name])
+                print("{:>8.3f}s  {} ({})".format(time.perf_counter() - start, name, rnd))
+
+
+if __name__ == '__main__':
+    main()
@@ -37,6 +37,7 @@ class TestClientPlayback:
                 assert cp.current_thread
 
             cp.flows = []
+            cp.position = 0
             cp.current_thread.is_alive.return_value = False
             assert cp.count() == 1
             cp.tick()
@@ -56,6 +57,33 @@ class TestClientPlayback:
             with pytest.raises(exceptions.CommandError, match="Can't replay live flow."):
                 cp.start_replay([df])
 
+    def test_playback_dump(self, tmpdir):
+        cp = clientplayback.ClientPlayback()
+        with taddons.context() as tctx:
+            path = str(tmpdir.join("flows"))
+            flows = [tflow.tflow(), tflow.tflow()]
+            with open(path, "wb") as f:
+                f.write(b"3:foo,")
+                w = io.FlowWriter(f)
+                for i in flows:
+                    w.add(i)
+            cp.load_paths([path])
+            assert cp.count() == 3
+            RP = "mitmproxy.proxy.protocol.http_replay.RequestReplayThread"
+            with mock.patch(RP) as rp:
+                cp.tick()
+                assert tctx.master.has_log("Cannot replay flow 1", "error")
+                assert rp.call_args[0][1].id == flows[0].id
+                assert cp.count() == 2
+                cp.current_thread.is_alive.return_value = False
+                cp.tick()
+                assert rp.call_args[0][1].id == flows[1].id
+                assert cp.count() == 1
+                cp.current_thread.is_alive.return_value = False
+                cp.tick()
+                assert cp.count() == 0
+                assert tctx.master.has_event("processing_complete")
+
     def test_load_file(self, tmpdir):
         cp = clientplayback.ClientPlayback()
         with taddons.context():
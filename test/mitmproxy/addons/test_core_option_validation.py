@@ -11,6 +11,21 @@ def test_simple():
         with pytest.raises(exceptions.OptionsError):
             tctx.configure(sa, body_size_limit = "invalid")
         tctx.configure(sa, body_size_limit = "1m")
+        with pytest.raises(exceptions.OptionsError):
+            tctx.configure(sa, tcp_coalesce_size = "invalid")
+        tctx.configure(sa, tcp_coalesce_size = "64k")
+        with pytest.raises(exceptions.OptionsError, match="chunk size"):
+            tctx.configure(sa, tcp_chunk_size = 0)
+        tctx.configure(sa, tcp_chunk_size = 1)
+        with pytest.raises(exceptions.OptionsError, match="message limit"):
+            tctx.configure(sa, tcp_max_messages = -1)
+        tctx.configure(sa, tcp_max_messages = 0)
+        with pytest.raises(exceptions.OptionsError, match="read workers"):
+            tctx.configure(sa, read_workers = -1)
+        tctx.configure(sa, read_workers = 0)
+        with pytest.raises(exceptions.OptionsError):
+            tctx.configure(sa, websocket_max_bytes = "invalid")
+        tctx.configure(sa, websocket_max_bytes = "1m")
 
         with pytest.raises(exceptions.OptionsError, match="mutually exclusive"):
             tctx.configure(
@@ -69,6 +69,16 @@ class TestReadFile:
             assert mck.called
             assert len(tctx.master.logs) == 2
 
+    @mock.patch('mitmproxy.master.Master.load_flow')
+    def test_workers(self, mck, tmpdir, data):
+        rf = readfile.ReadFile()
+        with taddons.context() as tctx:
+            tf = tmpdir.join("tfile")
+            tf.write(data.getvalue())
+            tctx.configure(rf, read_workers=2)
+            assert rf.load_flows_from_path(str(tf)) == 4
+            assert mck.call_count == 4
+
     def test_nonexisting_file(self):
         rf = readfile.ReadFile()
         with taddons.context() as tctx:
@@ -1,6 +1,8 @@
 import pytest
+from unittest import mock
 
 from mitmproxy.addons import replace
+from mitmproxy.net.http import encoding
 from mitmproxy.test import taddons
 from mitmproxy.test import tflow
 
@@ -63,6 +65,40 @@ class TestReplace:
             r.request(f)
             assert f.request.content == b"baz"
 
+    def test_encoded(self):
+        r = replace.Replace()
+        with taddons.context() as tctx:
+            tctx.configure(
+                r,
+                replacements=[
+                    "/~s/foo/bar",
+                    "/~s/one/two",
+                    "/~s/three/four",
+                    "/~s & ~bs bar/two/three",
+                    "/~s & !~bs three/bar/oh noes!",
+                    "/~s/[0-9]+/\\x00",
+                ]
+            )
+            f = tflow.tflow(resp=True)
+            f.response.headers["content-encoding"] = "gzip"
+            f.response.headers["x-num"] = "one"
+            f.response.content = b"foo one 42 three"
+            with mock.patch.object(encoding, "encode", wraps=encoding.encode) as encode:
+                r.response(f)
+            assert encode.call_count == 3
+            assert f.response.content == b"bar three \x00 four"
+            assert f.response.headers["x-num"] == "three"
+            assert f.response.headers["content-length"] == str(len(f.response.raw_content))
+
+    def test_path(self):
+        r = replace.Replace()
+        with taddons.context() as tctx:
+            tctx.configure(r, replacements=["/~q/path/other"])
+            f = tflow.tflow()
+            f.request.content = b""
+            r.request(f)
+            assert f.request.path == "/other"
+
 
 class TestReplaceFile:
     def test_simple(self, tmpdir):
@@ -1,3 +1,7 @@
+import threading
+import time
+from unittest import mock
+
 import pytest
 
 from mitmproxy.test import taddons
@@ -95,3 +99,200 @@ def test_simple(tmpdir):
         sa.request(f)
         tctx.configure(sa, save_stream_file=None)
         assert not rd(p)[1].response
+
+
+def test_index(tmpdir):
+    sa = save.Save()
+    with taddons.context() as tctx:
+        p = str(tmpdir.join("foo"))
+        tctx.configure(sa, save_index=True, save_stream_file=p)
+        f = tflow.tflow(resp=True)
+        sa.request(f)
+        sa.response(f)
+        tctx.configure(sa, save_stream_file=None)
+
+        tctx.configure(sa, save_stream_file="+" + p)
+        sa.request(tflow.tflow())
+        tctx.configure(sa, save_stream_file=None)
+        assert len(io.index.load_index(p)) == 2
+
+        sa.save([tflow.tflow(resp=True)] * 3, p)
+        with open(p, "rb") as f:
+            r = io.FlowReader(f)
+            assert len(r.entries) == 3
+            assert r.get(2).response
+
+
+def test_compress(tmpdir):
+    sa = save.Save()
+    with taddons.context() as tctx:
+        p = str(tmpdir.join("foo"))
+        tctx.configure(sa, save_compress=True, save_index=True, save_stream_file=p)
+        f = tflow.tflow(resp=True)
+        sa.request(f)
+        sa.response(f)
+        tctx.configure(sa, save_stream_file=None)
+        assert rd(p)[0].response
+        assert not tmpdir.join("foo.idx").exists()
+
+        sa.save([tflow.tflow(resp=True)] * 3, "+" + p)
+        assert len(rd(p)) == 4
+
+
+def test_queue(tmpdir):
+    sa = save.Save()
+    with taddons.context() as tctx:
+        p = str(tmpdir.join("foo"))
+        tctx.configure(sa, save_stream_queue=10, save_stream_fsync="close", save_stream_file=p)
+        assert isinstance(sa.stream, io.AsyncFlowWriter)
+        f = tflow.tflow(resp=True)
+        sa.request(f)
+        sa.response(f)
+        sa.request(tflow.tflow())
+        tctx.configure(sa, save_stream_file=None)
+        assert len(rd(p)) == 2
+        assert tctx.master.has_log("Saved 2 flows, dropped 0")
+
+
+def test_queue_report(tmpdir):
+    sa = save.Save()
+    with taddons.context() as tctx:
+        p = str(tmpdir.join("foo"))
+        tctx.configure(sa, save_stream_queue=1, save_stream_overflow="drop", save_stream_file=p)
+        block = threading.Event()
+        with mock.patch.object(sa.stream.writer, "write", side_effect=lambda *args: block.wait()):
+            for _ in range(4):
+                f = tflow.tflow(resp=True)
+                sa.request(f)
+                sa.response(f)
+            assert tctx.master.has_log("flows are being dropped", "warn")
+            sa.tick()
+            assert not tctx.master.has_log("queued")
+            sa.last_report = 0
+            sa.tick()
+            assert tctx.master.has_log("queued. Slowest write")
+            block.set()
+        tctx.configure(sa, save_stream_file=None)
+        assert tctx.master.has_log("0 queued")
+
+
+def test_write_error(tmpdir):
+    sa = save.Save()
+    with taddons.context() as tctx:
+        p = str(tmpdir.join("foo"))
+        tctx.configure(sa, save_stream_queue=10, save_stream_file=p)
+        sa.stream.error = ValueError("oops")
+        sa.response(tflow.tflow(resp=True))
+        assert sa.stream is None
+        assert tctx.master.has_log("Stopped saving flows")
+
+
+def test_rotate_size(tmpdir):
+    sa = save.Save()
+    with taddons.context() as tctx:
+        p = str(tmpdir.join("foo"))
+        tctx.configure(sa, save_index=True, save_stream_rotate_size="1", save_stream_file=p)
+        for _ in range(3):
+            sa.response(tflow.tflow(resp=True))
+        tctx.configure(sa, save_stream_file=None)
+        for path in (p, p + ".1", p + ".2"):
+            assert len(rd(path)) == 1
+            assert len(io.index.load_index(path)) == 1
+
+        with pytest.raises(exceptions.OptionsError, match="Invalid rotation size"):
+            tctx.configure(sa, save_stream_rotate_size="foo")
+
+
+def test_rotate_interval(tmpdir):
+    sa = save.Save()
+    with taddons.context() as tctx:
+        p = str(tmpdir.join("foo-%Y"))
+        tctx.configure(sa, save_stream_rotate_interval=60, save_stream_file=p)
+        sa.response(tflow.tflow(resp=True))
+        sa.response(tflow.tflow(resp=True))
+        assert len(sa.segments) == 1
+        sa.stream_started -= 60
+        sa.response(tflow.tflow(resp=True))
+        tctx.configure(sa, save_stream_file=None)
+        first, second = sa.segments
+        assert "%" not in first
+        assert second == first + ".1"
+        assert len(rd(first)) == 2
+        assert len(rd(second)) == 1
+
+
+def test_rotate_max_files(tmpdir):
+    sa = save.Save()
+    with taddons.context() as tctx:
+        p = str(tmpdir.join("foo"))
+        tctx.configure(
+            sa,
+            save_index=True,
+            save_stream_queue=10,
+            save_stream_rotate_size="1",
+            save_stream_max_files=2,
+            save_stream_file=p
+        )
+        for _ in range(4):
+            sa.response(tflow.tflow(resp=True))
+            # The size of queued streams is only known once flows are written.
+            while not sa.stream.written:
+                time.sleep(0.01)
+        tctx.configure(sa, save_stream_file=None)
+        assert sorted(x.basename for x in tmpdir.listdir()) == [
+            "foo.2", "foo.2.idx", "foo.3", "foo.3.idx"
+        ]
+        assert len(rd(p + ".2")) == 1
+        assert len(rd(p + ".3")) == 1
+        assert tctx.master.has_log("Saved 1 flows, dropped 0")
+
+
+def test_rotate_errors(tmpdir):
+    sa = save.Save()
+    with taddons.context() as tctx:
+        p = str(tmpdir.join("foo"))
+        tctx.configure(
+            sa,
+            save_stream_queue=10,
+            save_stream_rotate_size="1",
+            save_stream_file=p
+        )
+
+        def close_stream(stream):
+            stream.close()
+            raise IOError("disk full")
+
+        with mock.patch.object(sa, "close_stream", side_effect=close_stream):
+            for _ in range(2):
+                sa.response(tflow.tflow(resp=True))
+                while not sa.stream.written:
+                    time.sleep(0.01)
+            assert sa.closer
+            tctx.configure(sa, save_stream_file=None)
+        assert tctx.master.has_log("Error saving flows: disk full")
+        assert not sa.closer
+
+        tctx.configure(sa, save_stream_max_files=1)
+        sa.segments.extend([p, p + ".1"])
+        with mock.patch("os.remove", side_effect=PermissionError("denied")):
+            sa.prune()
+        assert tctx.master.has_log("Could not remove old flow file: denied")
+        assert list(sa.segments) == [p + ".1"]
+
+
+def test_dedup_bodies(tmpdir):
+    sa = save.Save()
+    with taddons.context() as tctx:
+        p = str(tmpdir.join("foo"))
+        tctx.configure(sa, save_dedup_bodies=True, save_stream_file=p)
+        for _ in range(3):
+            f = tflow.tflow(resp=True)
+            f.response.content = b"x" * 4096
+            sa.response(f)
+        tctx.configure(sa, save_stream_file=None)
+        assert tmpdir.join("foo.bodies").size() == 4096
+        assert all(f.response.content == b"x" * 4096 for f in rd(p))
+
+        sa.save([f, f], p)
+        assert len(rd(p)) == 2
+        assert tmpdir.join("foo.bodies").size() == 4096
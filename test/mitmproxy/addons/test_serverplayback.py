@@ -1,5 +1,6 @@
 import urllib
 import pytest
+from unittest import mock
 
 from mitmproxy.test import taddons
 from mitmproxy.test import tflow
@@ -28,6 +29,31 @@ def test_load_file(tmpdir):
             s.load_file("/nonexistent")
 
 
+def test_load_file_workers(tmpdir):
+    s = serverplayback.ServerPlayback()
+    with taddons.context() as tctx:
+        tctx.configure(s, read_workers=2)
+        fpath = str(tmpdir.join("flows"))
+        flows = [tflow.tflow(resp=True), tflow.tflow(), tflow.tflow(resp=True)]
+        flows[2].request.path = "/other"
+        tdump(fpath, flows)
+        s.load_file(fpath)
+        assert s.count() == 2
+        assert s.next_flow(flows[2]).id == flows[2].id
+
+
+def test_load_file_read_error(tmpdir):
+    s = serverplayback.ServerPlayback()
+    with taddons.context():
+        fpath = str(tmpdir.join("flows"))
+        tdump(fpath, [tflow.tflow(resp=True)])
+        # The dump can vanish between mapping and reading it.
+        err = IOError(2, "No such file or directory")
+        with mock.patch("mitmproxy.io.read_flows_parallel", side_effect=err):
+            with pytest.raises(exceptions.CommandError, match="No such file"):
+                s.load_file(fpath)
+
+
 def test_config(tmpdir):
     s = serverplayback.ServerPlayback()
     with taddons.context() as tctx:
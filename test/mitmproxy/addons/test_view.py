@@ -6,6 +6,8 @@ from mitmproxy.addons import view
 from mitmproxy import flowfilter
 from mitmproxy import exceptions
 from mitmproxy import io
+from mitmproxy import websocket
+from mitmproxy.io import spill
 from mitmproxy.test import taddons
 from mitmproxy.tools.console import consoleaddons
 
@@ -42,6 +44,7 @@ def test_order_generators():
 
     rs = view.OrderRequestStart(v)
     assert rs.generate(tf) == 946681200
+    assert rs(tf) == 946681200
 
     rm = view.OrderRequestMethod(v)
     assert rm.generate(tf) == tf.request.method
@@ -132,6 +135,218 @@ def test_filter():
     assert len(v) == 4
 
 
+def test_filter_facets():
+    v = view.View()
+    calls = []
+
+    def flt(f):
+        calls.append(f)
+        return b"foo" in f.response.get_content(strict=False)
+    v.set_filter(flowfilter.parse("~s & ~bs foo"))
+    v.filter._fn = flt
+
+    f = tflow.tflow(resp=True)
+    v.add([f])
+    assert len(calls) == 1
+    assert len(v) == 0
+    v.update([f])
+    f.marked = True
+    f.request.headers["foo"] = "bar"
+    v.update([f])
+    assert len(calls) == 1
+
+    f.response.content = b"foo"
+    v.update([f])
+    assert len(calls) == 2
+    assert len(v) == 1
+    f.response.headers["content-encoding"] = "gzip"
+    v.update([f])
+    assert len(calls) == 3
+
+    v.set_filter(v.filter)
+    assert len(calls) == 3
+    v.set_filter(lambda f: calls.append(f) or True)
+    v.update([f])
+    v.update([f])
+    assert len(calls) == 4
+    f.marked = False
+    v.update([f])
+    assert len(calls) == 5
+
+
+def test_indexes():
+    v = view.View()
+    a, b, c = tft(method="get"), tft(method="put"), tflow.ttcpflow()
+    v.add([a, b, c])
+    assert v._indexes["method"] == {b"get": {a.id: a}, b"put": {b.id: b}, None: {c.id: c}}
+
+    b.request.method = "get"
+    b.response = tflow.tflow(resp=True).response
+    v.update([b])
+    assert v._indexes["method"] == {b"get": {a.id: a, b.id: b}, None: {c.id: c}}
+    assert v._indexes["status_code"][200] == {b.id: b}
+
+    v.set_filter(flowfilter.parse("~s & ~m get"))
+    assert list(v) == [b]
+    # Only the candidate from the indexes is evaluated.
+    assert v._records[a.id].match[0] is not v.filter
+    assert v._records[b.id].match[0] is v.filter
+
+    v.remove([b])
+    assert v._indexes["method"] == {b"get": {a.id: a}, None: {c.id: c}}
+    assert b.id not in v._index_keys
+    v.clear_not_marked()
+    assert not v._index_keys
+    assert not any(v._indexes.values())
+    v.add([a])
+    v.clear()
+    assert not v._index_keys
+    assert not any(v._indexes.values())
+
+
+def test_indexes_http2():
+    v = view.View()
+    a, b = tft(), tft()
+    for f, authority in ((a, "foo.com:22"), (b, "bar.com:22")):
+        f.request.http_version = "HTTP/2.0"
+        f.request.headers[":authority"] = authority
+    v.add([a, b])
+    v.set_filter(flowfilter.parse("~d bar.com"))
+    assert list(v) == [b]
+    v.set_filter(flowfilter.parse("~d foo.com"))
+    assert list(v) == [a]
+
+
+def test_refilter_chunks():
+    v = view.View()
+    v.refilter_chunk = 2
+    flows = [tft(method="get", start=i) for i in range(3)] + [tft(method="put", start=i) for i in range(3, 6)]
+    v.add(flows)
+    added = []
+
+    def rec_add(view, flow):
+        added.append(flow)
+    v.sig_view_add.connect(rec_add)
+
+    v.set_filter(flowfilter.parse("~m get"))
+    assert v.refiltering
+    assert list(v) == flows[:2]
+    v.tick()
+    assert list(v) == flows[:3]
+    assert added == flows[2:3]
+    v.tick()
+    assert not v.refiltering
+    assert list(v) == flows[:3]
+
+    # A new filter cancels the refilter in progress.
+    v.set_filter(flowfilter.parse("~m put"))
+    assert v.refiltering
+    assert list(v) == flows[3:5]
+    v.set_filter(flowfilter.parse("~m get"))
+    # Flows updated or removed in the meantime are not added twice.
+    v.update([flows[2]])
+    v.remove([flows[1]])
+    v.tick()
+    assert not v.refiltering
+    assert list(v) == [flows[0], flows[2]]
+
+    v.set_filter(None)
+    v.clear()
+    assert not v.refiltering
+    v.tick()
+
+    v.refilter_chunk = 0
+    v.add(flows)
+    v.set_filter(flowfilter.parse("~m put"))
+    assert not v.refiltering
+    assert list(v) == flows[3:]
+
+
+def test_evict():
+    v = view.View()
+    with taddons.context() as tctx:
+        tctx.configure(v, view_max_flows=3)
+        removed = Record()
+        v.sig_store_remove.connect(removed)
+        flows = [tft(start=i) for i in range(5)]
+        flows[0].marked = True
+        flows[1].intercept()
+        v.add(flows[:3])
+        assert v.store_count() == 3
+        v.add(flows[3:])
+        # The marked and the intercepted flow are kept.
+        assert list(v) == [flows[0], flows[1], flows[4]]
+        assert [c[1]["flow"] for c in removed.calls] == flows[2:4]
+        assert not {flows[2].id, flows[3].id} & set(v.settings)
+
+        flows[0].marked = False
+        v.update([flows[0]])
+        assert v.store_count() == 3
+        tctx.configure(v, view_max_flows=2)
+        assert list(v) == [flows[1], flows[4]]
+        assert flows[1].intercepted
+
+        tctx.configure(v, view_keep_intercepted=False, view_max_flows=1)
+        assert list(v) == flows[4:]
+        assert flows[1].reply.value == exceptions.Kill
+        assert not v._evictable.keys() - v._store.keys()
+        assert not v._kept
+
+        tctx.configure(v, view_max_flows=0)
+        v.add(flows[:4])
+        assert v.store_count() == 5
+        with pytest.raises(Exception, match="must not be negative"):
+            tctx.configure(v, view_max_flows=-1)
+
+
+def test_evict_bytes():
+    v = view.View()
+    with taddons.context() as tctx:
+        tctx.configure(v, view_max_bytes="2k")
+        flows = [tflow.tflow(resp=True) for _ in range(3)]
+        for f in flows:
+            f.response.content = b"x" * 1000
+        v.add(flows)
+        assert v.store_size == 2 * (1000 + len(flows[0].request.content))
+        assert list(v._store.values()) == flows[1:]
+
+        flows[1].response.content = b"x" * 2000
+        v.update([flows[1]])
+        assert list(v._store.values()) == flows[2:]
+        v.remove(flows[2:])
+        assert v.store_size == 0
+        with pytest.raises(Exception, match="Invalid view size"):
+            tctx.configure(v, view_max_bytes="foo")
+
+        f = tflow.ttcpflow()
+        v.add([f])
+        assert v.store_size == view.flow_size(f) > 0
+        assert view.flow_size(tflow.twebsocketflow()) > 0
+        v.clear()
+        assert v.store_size == 0
+        assert not v._records
+
+
+def test_archive(tmpdir):
+    path = str(tmpdir.join("archive"))
+    v = view.View()
+    with taddons.context() as tctx:
+        tctx.configure(v, view_max_flows=1, view_archive=path)
+        flows = [tft(start=i) for i in range(3)]
+        v.add(flows)
+        assert list(v) == flows[2:]
+        tctx.configure(v, view_archive="+" + path)
+        v.add([tft(start=3)])
+        v.done()
+        assert v.archive is None
+        with open(path, "rb") as fo:
+            archived = list(io.FlowReader(fo).stream())
+        assert [f.id for f in archived] == [f.id for f in flows]
+
+        with pytest.raises(Exception, match="Can not open archive"):
+            tctx.configure(v, view_archive=str(tmpdir.join("nope", "archive")))
+
+
 def tdump(path, flows):
     with open(path, "wb") as f:
         w = io.FlowWriter(f)
@@ -281,6 +496,28 @@ def test_remove():
         assert len(v) == 0
 
 
+def test_close_spills():
+    v = view.View()
+    with taddons.context():
+        # WebSocket flows can only be stored, they have no place in the order of the view.
+        v.set_filter(flowfilter.parse("~http"))
+        flows = [tflow.twebsocketflow() for _ in range(3)]
+        for f in flows:
+            f.spill = spill.Spill(websocket.WebSocketMessage)
+        flows[1].live = True
+        flows[2].marked = True
+        v.add(flows)
+        files = [f.spill.file for f in flows]
+        v.remove(flows[:1])
+        assert flows[0].spill is None
+        assert files[0].closed
+        v.clear_not_marked()
+        assert not files[1].closed
+        v.clear()
+        assert flows[2].spill is None
+        assert files[2].closed
+
+
 def test_setgetval():
     v = view.View()
     with taddons.context():
@@ -317,6 +554,43 @@ def test_order():
         assert [i.request.timestamp_start for i in v] == [1, 2, 3, 4]
 
 
+def test_order_keys():
+    v = view.View()
+    a, b = tft(method="get", start=1), tft(method="put", start=2)
+    v.add([a, b])
+    v.set_order(v.orders["method"])
+    assert list(v) == [a, b]
+    assert v._order_keys[v.orders["method"]] == {a: "GET", b: "PUT"}
+
+    # Keys in other orders are dropped on update, and generated again.
+    v.set_order(v.orders["time"])
+    a.request.method = "zzz"
+    v.update([a])
+    assert a not in v._order_keys[v.orders["method"]]
+    v.set_order(v.orders["method"])
+    assert list(v) == [b, a]
+
+    v.set_order(v.orders["size"])
+    b.request.content = b"x" * 100
+    v.update([b])
+    assert list(v) == [a, b]
+
+    # Flows that are updated while filtered out get a new key as well.
+    v.set_order(v.orders["time"])
+    v.set_filter(flowfilter.parse("~m zzz"))
+    assert list(v) == [a]
+    b.request.method = "POST"
+    b.request.timestamp_start = 0
+    v.update([b])
+    v.set_filter(None)
+    assert list(v) == [b, a]
+
+    v.remove([a])
+    assert not any(a in keys for keys in v._order_keys.values())
+    v.clear()
+    assert not any(v._order_keys.values())
+
+
 def test_reversed():
     v = view.View()
     v.request(tft(start=1))
@@ -561,3 +835,78 @@ def test_configure():
 
         tctx.configure(v, console_focus_follow=True)
         assert v.focus_follow
+
+        tctx.configure(v, view_refilter_chunk=10)
+        assert v.refilter_chunk == 10
+        with pytest.raises(Exception, match="must not be negative"):
+            tctx.configure(v, view_refilter_chunk=-1)
+
+
+def test_dedup_bodies():
+    v = view.View()
+    with taddons.context() as tctx:
+        f1, f2 = tflow.tflow(resp=True), tflow.tflow(resp=True)
+        f1.response.content = b"x" * 2048
+        f2.response.content = b"x" * 2048
+        v.add([f1, f2])
+        assert not v.bodies
+
+        v.clear()
+        tctx.configure(v, view_dedup_bodies=True)
+        v.add([f1, f2])
+        assert f1.response.raw_content is f2.response.raw_content
+        assert len(v.bodies) == 1
+        assert v.bodies.saved == 2048
+        # Bodies that are already stored are kept.
+        stored = f1.response.data.stored_content
+        v.update([f1])
+        assert f1.response.data.stored_content is stored
+        assert v.bodies.saved == 2048
+        v.add([tflow.tflow()])
+        assert len(v.bodies) == 1
+
+        f2.response.content = b"y" * 2048
+        v.update([f2])
+        assert len(v.bodies) == 2
+        assert v.bodies.saved == 0
+
+        v.remove([f1])
+        assert len(v.bodies) == 1
+        v.clear()
+        assert not v.bodies
+
+        tctx.configure(v, view_dedup_bodies=False)
+        f1.response.content = b"x" * 2048
+        v.add([f1, f2])
+        assert not v.bodies
+
+
+def test_spill_bodies():
+    v = view.View()
+    with taddons.context() as tctx:
+        tctx.configure(v, view_body_spill_size="2k", view_body_memory="4k")
+        f = tflow.tflow(resp=True)
+        f.request.content = b"x" * 4096
+        v.add([f])
+        assert v.bodies.spilled == 4096
+        assert f.request.content == b"x" * 4096
+
+        for i in range(3):
+            f = tflow.tflow(resp=True)
+            f.response.content = bytes([i]) * 2048
+            v.add([f])
+        assert v.bodies.size == 4096
+        assert f.response.content == b"\x02" * 2048
+        assert v.bodies.spilled == 4096 + 2048
+        assert f.copy().response.content == b"\x02" * 2048
+
+        tctx.configure(v, view_body_memory="0")
+        assert v.bodies.size == 0
+        f.response.content = b"foo"
+        v.update([f])
+        assert v.bodies.spilled == 4096 + 2048 * 2
+
+        with pytest.raises(exceptions.OptionsError):
+            tctx.configure(v, view_body_spill_size="foo")
+        with pytest.raises(exceptions.OptionsError):
+            tctx.configure(v, view_body_memory="foo")
@@ -0,0 +1,80 @@
+import pytest
+
+from mitmproxy.coretypes import bodystore
+
+
+def test_bodystore():
+    s = bodystore.BodyStore(min_size=4)
+    assert s.add(None) is None
+    small = b"foo"
+    assert s.add(small) is small
+    s.release(small)
+    assert not s
+
+    a = b"foobar"
+    b = bytes(bytearray(b"foobar"))
+    assert a is not b
+    sa = s.add(a)
+    assert sa.load() is a
+    assert s.add(b) is sa
+    assert len(s) == 1
+    assert s.size == 6
+    assert s.saved == 6
+
+    s.release(sa)
+    assert s
+    assert s.saved == 0
+    s.release(sa)
+    assert not s
+    assert s.size == 0
+    with pytest.raises(KeyError):
+        s.release(sa)
+
+    s.add(a)
+    s.clear()
+    assert not s
+
+
+def test_no_dedup():
+    s = bodystore.BodyStore(min_size=4, dedup=False)
+    assert s.add(b"foobar") is not s.add(b"foobar")
+    assert len(s) == 2
+    assert s.size == 12
+
+
+def test_spill_size():
+    s = bodystore.BodyStore(min_size=4, spill_size=6)
+    small = s.add(b"foobar")
+    large = s.add(b"foobarbaz")
+    assert small.data == b"foobar"
+    assert large.data is None
+    assert large.load() == b"foobarbaz"
+    assert s.size == 6
+    assert s.spilled == 9
+    assert s.add(b"foobarbaz") is large
+    s.release(large)
+    s.release(large)
+    assert s.spilled == 0
+
+
+def test_memory_limit():
+    s = bodystore.BodyStore(min_size=1, memory_limit=6)
+    a, b, c = s.add(b"aaa"), s.add(b"bbb"), s.add(b"ccc")
+    assert a.data is None
+    assert s.size == 6
+    assert s.spilled == 3
+
+    # Loading b makes c the least recently used body.
+    assert b.load() == b"bbb"
+    d = s.add(b"ddd")
+    assert c.data is None
+    assert b.data and d.data
+    assert [x.load() for x in (a, b, c, d)] == [b"aaa", b"bbb", b"ccc", b"ddd"]
+
+    s.memory_limit = 0
+    s.trim()
+    assert s.size == 0
+    assert s.spilled == 12
+
+    s.clear()
+    assert a.load() == b"aaa"
@@ -0,0 +1,49 @@
+import io
+
+import pytest
+
+from mitmproxy import exceptions
+from mitmproxy.io import bodies
+from mitmproxy.test import tflow
+
+
+def test_externalize():
+    fo = io.BytesIO()
+    w = bodies.BodyWriter(fo, min_size=4)
+    f = tflow.tflow(resp=True)
+    f.request.content = b"small"
+    f.response.content = b"foobar"
+    state = f.get_state()
+    state["request"]["content"] = b"foo"
+
+    s1 = w.externalize(state)
+    s2 = w.externalize(f.get_state())
+    assert s1["request"]["content"] == b"foo"
+    assert s1["response"]["content"] == [0, 6]
+    assert s2["request"]["content"] == [6, 5]
+    assert s2["response"]["content"] == [0, 6]
+    assert fo.getvalue() == b"foobarsmall"
+    assert w.saved == 6
+    assert f.get_state()["response"]["content"] == b"foobar"
+
+    tcp = tflow.ttcpflow().get_state()
+    assert w.externalize(tcp) is tcp
+
+
+def test_internalize(tmpdir):
+    p = str(tmpdir.join("foo.bodies"))
+    with open(p, "wb") as fo:
+        fo.write(b"foobar")
+    r = bodies.BodyReader(p)
+    state = tflow.tflow(resp=True).get_state()
+    state["response"]["content"] = [3, 3]
+    assert r.internalize(state)["response"]["content"] == b"bar"
+    assert r.internalize(state)["response"]["content"] == b"bar"
+
+    for ref in ([5, 3], [1], "foo"):
+        with pytest.raises(exceptions.FlowReadException):
+            r.read(ref)
+    with pytest.raises(exceptions.FlowReadException, match="no"):
+        bodies.BodyReader(None).read([0, 1])
+    with pytest.raises(exceptions.FlowReadException, match="Can not read"):
+        bodies.BodyReader(str(tmpdir.join("missing"))).read([0, 1])
@@ -1,7 +1,13 @@
+import io as pyio
+
 import pytest
 
 from mitmproxy import io
 from mitmproxy import exceptions
+from mitmproxy import version
+from mitmproxy.io import compat
+from mitmproxy.io import tnetstring
+from mitmproxy.test import tflow
 from mitmproxy.test import tutils
 
 
@@ -26,3 +32,35 @@ def test_cannot_convert():
         flow_reader = io.FlowReader(f)
         with pytest.raises(exceptions.FlowReadException):
             list(flow_reader.stream())
+
+
+def test_load_websocket_7():
+    state = tflow.twebsocketflow().get_state()
+    state["backup"] = state.copy()
+    state["version"] = 7
+    del state["dropped_messages"]
+    del state["backup"]["dropped_messages"]
+    fo = pyio.BytesIO()
+    tnetstring.dump(state, fo)
+    fo.seek(0)
+    f, = io.FlowReader(fo).stream()
+    assert f.dropped_messages == 0
+    assert f.get_state()["backup"]["dropped_messages"] == 0
+    f.revert()
+    assert f.dropped_messages == 0
+
+
+def test_current_version():
+    state = tflow.tflow().get_state()
+    assert compat.migrate_flow(state) is state
+
+
+def test_upgrade_dump():
+    fo = pyio.BytesIO()
+    with open(tutils.test_data.path("mitmproxy/data/dumpfile-011"), "rb") as f:
+        assert io.upgrade_dump(f, fo) == 1
+    fo.seek(0)
+    assert tnetstring.load(fo)["version"] == version.FLOW_FORMAT_VERSION
+    fo.seek(0)
+    f, = io.FlowReader(fo).stream()
+    assert f.request.url == "https://example.com/"
@@ -0,0 +1,72 @@
+import io
+
+import pytest
+
+from mitmproxy.io import index
+from mitmproxy.test import tflow
+
+
+def test_make_entry():
+    f = tflow.tflow(resp=True)
+    e = index.make_entry(f, 10, 20)
+    assert e.offset == 10
+    assert e.size == 20
+    assert e.timestamp == f.request.timestamp_start
+    assert e.type == "http"
+    assert e.method == "GET"
+    assert e.host == "address"
+    assert e.status == 200
+
+    assert index.make_entry(tflow.tflow(), 0, 0).status == 0
+
+    f = tflow.ttcpflow()
+    e = index.make_entry(f, 0, 0)
+    assert e.type == "tcp"
+    assert e.method == ""
+    assert e.host == "address"
+    assert e.timestamp == f.client_conn.timestamp_start
+
+
+def test_read_write():
+    fo = io.BytesIO()
+    w = index.IndexWriter(fo)
+    entries = [
+        index.make_entry(tflow.tflow(resp=True), 0, 100),
+        index.make_entry(tflow.twebsocketflow(), 100, 50),
+    ]
+    for e in entries:
+        w.add(e)
+    fo.seek(0)
+    assert index.read_index(fo) == entries
+    assert index.is_valid(entries, 150)
+    assert not index.is_valid(entries, 151)
+    assert not index.is_valid(entries[1:], 150)
+    assert index.is_valid([], 0)
+
+
+def test_read_invalid():
+    with pytest.raises(ValueError, match="Invalid index entry"):
+        index.read_index(io.BytesIO(b"3:foo,"))
+    with pytest.raises(ValueError):
+        index.read_index(io.BytesIO(b"3:foo"))
+
+
+def test_load_index(tmpdir):
+    p = str(tmpdir.join("foo"))
+    assert index.load_index(p) is None
+
+    with open(p, "wb") as f:
+        f.write(b"x" * 10)
+    assert index.load_index(p) is None
+
+    with open(index.index_path(p), "wb") as f:
+        index.IndexWriter(f).add(index.make_entry(tflow.tflow(), 0, 10))
+    assert len(index.load_index(p)) == 1
+
+    with open(p, "ab") as f:
+        f.write(b"x")
+    assert index.load_index(p) is None
+
+    with open(index.index_path(p), "wb") as f:
+        f.write(b"3:foo,")
+    assert index.load_index(p) is None
@@ -1 +1,326 @@
-# TODO: write tests
+import io
+import threading
+from unittest import mock
+
+import pytest
+
+import mitmproxy.io.io
+from mitmproxy import exceptions
+from mitmproxy import flowfilter
+from mitmproxy import websocket
+from mitmproxy.io import AsyncFlowWriter
+from mitmproxy.io import FilteredFlowWriter
+from mitmproxy.io import FlowReader
+from mitmproxy.io import FlowWriter
+from mitmproxy.io import LazyFlows
+from mitmproxy.io import dump_flow
+from mitmproxy.io import read_flows_parallel
+from mitmproxy.io import bodies
+from mitmproxy.io import index
+from mitmproxy.io import spill
+from mitmproxy.io import tnetstring
+from mitmproxy.test import tflow
+
+
+def test_dump_flow():
+    f = tflow.tflow(resp=True)
+    fo = io.BytesIO()
+    dump_flow(f, fo)
+    assert fo.getvalue() == tnetstring.dumps(f.get_state())
+
+
+def test_dump_spilled_flow():
+    f = tflow.twebsocketflow()
+    f.spill = spill.Spill(websocket.WebSocketMessage)
+    f.spill.extend(f.messages[:2])
+    del f.messages[:2]
+
+    fo = io.BytesIO()
+    dump_flow(f, fo)
+    assert tnetstring.loads(fo.getvalue()) == tnetstring.loads(tnetstring.dumps(f.get_state()))
+
+    fo.seek(0)
+    w = FlowWriter(fo)
+    w.add(f)
+    fo.seek(0)
+    f2, = FlowReader(fo).stream()
+    assert f2.spill is None
+    assert f2.get_state()["messages"] == f.get_state()["messages"]
+
+
+def _dump(fo, flows, index_fo=None):
+    w = FlowWriter(fo, index_fo)
+    for f in flows:
+        w.add(f)
+    fo.seek(0)
+
+
+@pytest.mark.parametrize("indexed", [True, False])
+def test_random_access(indexed):
+    flows = [tflow.tflow(resp=True), tflow.ttcpflow(), tflow.tflow()]
+    for i, f in enumerate(flows):
+        f.client_conn.timestamp_start = i
+        if f.type == "http":
+            f.request.timestamp_start = i
+    fo, index_fo = io.BytesIO(), io.BytesIO()
+    _dump(fo, flows, index_fo)
+    index_fo.seek(0)
+    entries = index.read_index(index_fo) if indexed else None
+    r = FlowReader(fo, entries)
+    assert (r.entries is not None) == indexed
+
+    assert r.count() == 3
+    assert r.get(1).id == flows[1].id
+    assert r.get(-1).id == flows[2].id
+    assert r.get(0).id == flows[0].id
+    with pytest.raises(IndexError):
+        r.get(3)
+    with pytest.raises(IndexError):
+        r.get(-4)
+
+    assert [f.id for f in r.timerange(1)] == [flows[1].id, flows[2].id]
+    assert [f.id for f in r.timerange(end=2)] == [flows[0].id, flows[1].id]
+    assert [f.id for f in r.timerange(1, 2)] == [flows[1].id]
+
+
+def test_find_index(tmpdir):
+    p = str(tmpdir.join("foo"))
+    with open(p, "wb") as fo, open(index.index_path(p), "wb") as index_fo:
+        _dump(fo, [tflow.tflow(), tflow.tflow()], index_fo)
+    with open(p, "rb") as fo:
+        r = FlowReader(fo)
+        assert len(r.entries) == 2
+        assert len(list(r.stream())) == 2
+
+    with open(p, "rb") as fo:
+        assert FlowReader(io.BytesIO(fo.read())).entries is None
+
+
+def test_invalid_data():
+    r = FlowReader(io.BytesIO(b"3:foo,x"))
+    with pytest.raises(exceptions.FlowReadException):
+        r.count()
+    with pytest.raises(exceptions.FlowReadException):
+        r.get(1)
+
+
+@pytest.mark.parametrize("indexed", [True, False])
+def test_lazy_flows(tmpdir, indexed):
+    paths = [str(tmpdir.join("a")), str(tmpdir.join("b")), str(tmpdir.join("empty"))]
+    flows = [tflow.tflow(resp=True), tflow.ttcpflow(), tflow.twebsocketflow()]
+    with open(paths[0], "wb") as fo, open(index.index_path(paths[0]), "wb") as index_fo:
+        _dump(fo, flows[:2], index_fo if indexed else None)
+    with open(paths[1], "wb") as fo:
+        _dump(fo, flows[2:])
+    open(paths[2], "wb").close()
+
+    lazy = LazyFlows(paths)
+    assert len(lazy) == 3
+    assert [f.id for f in lazy] == [f.id for f in flows]
+    assert lazy[-1].type == "websocket"
+    assert lazy[0] is not lazy[0]
+    assert [f.id for f in lazy[1:]] == [f.id for f in flows[1:]]
+    assert not LazyFlows()
+
+
+def test_lazy_flows_invalid(tmpdir):
+    p = str(tmpdir.join("foo"))
+    with pytest.raises(exceptions.FlowReadException):
+        LazyFlows([p])
+    with open(p, "wb") as f:
+        f.write(b"3:foo")
+    with pytest.raises(exceptions.FlowReadException):
+        LazyFlows([p])
+    with open(p, "wb") as f:
+        f.write(b"3:foo,")
+    with pytest.raises(exceptions.FlowReadException):
+        LazyFlows([p])[0]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+@pytest.mark.parametrize("indexed", [True, False])
+def test_read_flows_parallel(tmpdir, workers, indexed):
+    paths = [str(tmpdir.join("a")), str(tmpdir.join("empty")), str(tmpdir.join("b"))]
+    flows = [tflow.tflow(resp=True) for _ in range(5)] + [tflow.ttcpflow()]
+    with open(paths[0], "wb") as fo, open(index.index_path(paths[0]), "wb") as index_fo:
+        _dump(fo, flows[:4], index_fo if indexed else None)
+    open(paths[1], "wb").close()
+    with open(paths[2], "wb") as fo:
+        _dump(fo, flows[4:])
+
+    read = read_flows_parallel(paths, workers, chunk_size=1)
+    assert [f.id for f in read] == [f.id for f in flows]
+
+
+def test_read_flows_parallel_errors(tmpdir):
+    p = str(tmpdir.join("foo"))
+    with pytest.raises(IOError):
+        list(read_flows_parallel([p], 2))
+    with open(p, "wb") as fo:
+        _dump(fo, [tflow.tflow()])
+        fo.seek(0, 2)
+        fo.write(b"qibble")
+    with pytest.raises(exceptions.FlowReadException):
+        list(read_flows_parallel([p], 2))
+    with open(p, "wb") as fo:
+        fo.write(b"3:foo,")
+    with pytest.raises(exceptions.FlowReadException):
+        list(read_flows_parallel([p], 2))
+
+
+def _compressed_dump(flows, block_size):
+    fo = io.BytesIO()
+    w = FlowWriter(fo, compress=True)
+    w.max_pending_blocks = 1
+    with mock.patch("mitmproxy.io.io.BLOCK_SIZE", block_size):
+        for f in flows:
+            w.add(f)
+    w.flush()
+    fo.seek(0)
+    return fo
+
+
+@pytest.mark.parametrize("block_size", [1, 4096, 1024 * 1024])
+def test_compressed(tmpdir, block_size):
+    flows = [tflow.tflow(resp=True), tflow.ttcpflow(), tflow.tflow(), tflow.twebsocketflow()]
+    fo = _compressed_dump(flows, block_size)
+    data = fo.getvalue()
+    assert data.endswith(b"]")
+    # Appending plain flows to a compressed dump is fine.
+    extra = tflow.tflow()
+    fo.seek(0, 2)
+    dump_flow(extra, fo)
+    fo.seek(0)
+    flows.append(extra)
+
+    r = FlowReader(fo)
+    assert [f.id for f in r.stream()] == [f.id for f in flows]
+    assert r.count() == 5
+    for i, f in enumerate(flows):
+        assert r.get(i).id == f.id
+    with pytest.raises(IndexError):
+        r.get(5)
+
+    p = str(tmpdir.join("foo"))
+    with open(p, "wb") as f:
+        f.write(fo.getvalue())
+    lazy = LazyFlows([p])
+    blocks = {o for o, pos in zip(lazy._offsets, lazy._positions) if pos >= 0}
+    with mock.patch("mitmproxy.io.io._decode_block", wraps=mitmproxy.io.io._decode_block) as decode:
+        assert [f.id for f in lazy] == [f.id for f in flows]
+    # Every block is decompressed and scanned once.
+    assert decode.call_count == len(blocks)
+    assert [f.id for f in lazy[2:]] == [f.id for f in flows[2:]]
+    assert [f.id for f in read_flows_parallel([p], 2, chunk_size=1)] == [f.id for f in flows]
+
+
+def test_compressed_errors():
+    with pytest.raises(ValueError):
+        FlowWriter(io.BytesIO(), io.BytesIO(), compress=True)
+
+    for block in (["zlib", 1, b"foo"], ["lzma", 1, b""], ["zlib", 1]):
+        with pytest.raises(exceptions.FlowReadException):
+            list(FlowReader(io.BytesIO(tnetstring.dumps(block))).stream())
+    with pytest.raises(exceptions.FlowReadException):
+        FlowReader(io.BytesIO(tnetstring.dumps(["zlib", "x", b""]))).count()
+
+
+def test_compressed_write_error():
+    fo = io.BytesIO()
+    w = FlowWriter(fo, compress=True)
+    fo.close()
+    w.add(tflow.tflow())
+    with pytest.raises(ValueError):
+        w.flush()
+
+
+class TestAsyncFlowWriter:
+    def test_write(self, tmpdir):
+        p = str(tmpdir.join("foo"))
+        flows = [tflow.tflow(resp=True), tflow.ttcpflow(), tflow.tflow()]
+        w = AsyncFlowWriter(
+            FlowWriter(open(p, "wb"), open(index.index_path(p), "wb")),
+            fsync="batch"
+        )
+        for f in flows:
+            w.add(f)
+        # The flow is written as it was when it was added.
+        flows[0].request.path = "/changed"
+        w.close()
+        assert w.written == 3
+        assert w.queue_depth == 0
+        assert w.max_write_latency >= w.write_latency > 0
+
+        with open(p, "rb") as fo:
+            r = FlowReader(fo)
+            assert r.count() == 3
+            assert [f.id for f in r.stream()] == [f.id for f in flows]
+            assert r.get(0).request.path == "/path"
+            assert r.entries
+
+    def test_spilled_websocket(self, tmpdir):
+        f = tflow.twebsocketflow()
+        f.spill = spill.Spill(websocket.WebSocketMessage)
+        f.spill.extend(f.messages[:2])
+        del f.messages[:2]
+        p = str(tmpdir.join("foo"))
+        w = AsyncFlowWriter(FlowWriter(open(p, "wb")))
+        w.add(f)
+        w.close()
+        with open(p, "rb") as fo:
+            f2, = FlowReader(fo).stream()
+        assert f2.get_state()["messages"] == f.get_state()["messages"]
+
+    def test_filter_and_drop(self):
+        fo = io.BytesIO()
+        writer = FilteredFlowWriter(fo, flowfilter.parse("~q"))
+        w = AsyncFlowWriter(writer, queue_size=1, overflow="drop")
+        block = threading.Event()
+        with mock.patch.object(writer, "write", side_effect=lambda *args: block.wait()):
+            w.add(tflow.ttcpflow())
+            for _ in range(5):
+                w.add(tflow.tflow())
+            block.set()
+            w.close()
+        assert w.dropped >= 3
+        assert w.written + w.dropped == 5
+
+    def test_error(self):
+        fo = io.BytesIO()
+        w = AsyncFlowWriter(FlowWriter(fo))
+        with mock.patch.object(w.writer, "write", side_effect=ValueError("oops")):
+            w.add(tflow.tflow())
+            with pytest.raises(IOError, match="oops"):
+                w.close()
+        assert fo.closed
+        assert w.written == 0
+        with pytest.raises(IOError):
+            w.add(tflow.tflow())
+
+
+@pytest.mark.parametrize("compress", [True, False])
+def test_dedup_bodies(tmpdir, compress):
+    p = str(tmpdir.join("foo"))
+    flows = [tflow.tflow(resp=True) for _ in range(3)] + [tflow.ttcpflow()]
+    for f in flows[:3]:
+        f.response.content = b"x" * 2048
+    with open(p, "wb") as fo, open(bodies.bodies_path(p), "wb") as bodies_fo:
+        w = FlowWriter(fo, compress=compress, bodies_fo=bodies_fo)
+        for f in flows[:2]:
+            w.add(f)
+        for f in flows[2:]:
+            w.write(*w.prepare(f))
+        w.close()
+        assert w.bodies.saved == 2 * 2048
+    assert tmpdir.join("foo.bodies").size() == 2048
+
+    with open(p, "rb") as fo:
+        assert [f.get_state() for f in FlowReader(fo).stream()] == [f.get_state() for f in flows]
+        assert FlowReader(fo).get(1).response.content == b"x" * 2048
+    assert LazyFlows([p])[2].response.content == b"x" * 2048
+    assert list(read_flows_parallel([p], 2))[0].response.content == b"x" * 2048
+
+    tmpdir.join("foo.bodies").remove()
+    with open(p, "rb") as fo:
+        with pytest.raises(exceptions.FlowReadException):
+            list(FlowReader(fo).stream())
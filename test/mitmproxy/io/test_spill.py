@@ -0,0 +1,30 @@
+import io
+
+from mitmproxy import websocket
+from mitmproxy.io import spill
+from mitmproxy.io import tnetstring
+from mitmproxy.test import tflow
+
+
+def test_spill():
+    messages = tflow.twebsocketflow().messages
+    s = spill.Spill(websocket.WebSocketMessage)
+    assert not s
+    s.extend(messages[:1])
+    s.extend(messages[1:])
+    assert len(s) == len(messages)
+    assert s.size == sum(len(tnetstring.dumps(m.get_state())) for m in messages)
+    assert s.get_state() == [m.get_state() for m in messages]
+    assert [m.content for m in s] == [m.content for m in messages]
+
+    # spilled objects can still be appended after reading
+    s.extend(messages[:1])
+    assert len(list(s)) == len(messages) + 1
+
+    fo = io.BytesIO()
+    s.copy_to(fo)
+    assert len(fo.getvalue()) == s.size
+    fo = io.BytesIO()
+    s.copy_to(fo, 10)
+    assert len(fo.getvalue()) == 10
+    s.close()
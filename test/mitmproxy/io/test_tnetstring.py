@@ -92,6 +92,14 @@ class Test_Format(unittest.TestCase):
         i2 = tnetstring.loads(s)
         self.assertEqual(i1, i2)
 
+    def test_nested_length_exceeds_parent(self):
+        with self.assertRaises(ValueError):
+            tnetstring.loads(b'8:6:hello,]')
+
+    def test_dict_without_value(self):
+        with self.assertRaises(ValueError):
+            tnetstring.loads(b'4:1:a;}')
+
 
 class Test_FileLoading(unittest.TestCase):
 
@@ -128,6 +136,32 @@ class Test_FileLoading(unittest.TestCase):
             tnetstring.load(s)
         self.assertEqual(s.read(1), b':')
 
+    def test_roundtrip_buffered_file(self):
+        for data, expect in FORMAT_EXAMPLES.items():
+            s = io.BufferedReader(io.BytesIO(data + b'OK'))
+            self.assertEqual(expect, tnetstring.load(s))
+            self.assertEqual(b'OK', s.read())
+
+    def test_truncated_file(self):
+        for data in (b'5:hello', b'5:hel'):
+            for s in (io.BytesIO(data), io.BufferedReader(io.BytesIO(data))):
+                with self.assertRaises(ValueError):
+                    tnetstring.load(s)
+
+    def test_skip(self):
+        for data in FORMAT_EXAMPLES:
+            s = io.BytesIO()
+            s.write(data)
+            s.write(b'OK')
+            s.seek(0)
+            self.assertEqual(len(data), tnetstring.skip(s))
+            self.assertEqual(b'OK', s.read())
+
+    def test_skip_errors(self):
+        for data in (b'', b'5:hello', b'x', b'1000000000:pwned!,'):
+            with self.assertRaises(ValueError):
+                tnetstring.skip(io.BytesIO(data))
+
 
 def suite():
     loader = unittest.TestLoader()
@@ -1,3 +1,5 @@
+import gzip
+import zlib
 from unittest import mock
 import pytest
 
@@ -99,3 +101,64 @@ def test_cache():
             # This is not in the cache anymore
             assert encoding.encode(b"decoded", "gzip") == b"encoded"
             assert encode_gzip.call_count == 1
+
+
+def _chunks(data, size=7):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("encoder", [
+    'identity',
+    'gzip',
+    'br',
+    'deflate',
+])
+def test_stream(encoder):
+    data = b"".join(b"%d" % i for i in range(10000))
+    encoded = b"".join(encoding.encode_stream(_chunks(data, 1000), encoder))
+    assert encoding.decode(encoded, encoder) == data
+    assert b"".join(encoding.decode_stream(_chunks(encoded), encoder)) == data
+    assert b"".join(encoding.decode_stream([], encoder)) == b""
+
+    if encoder != "identity":
+        with pytest.raises(ValueError):
+            list(encoding.decode_stream(_chunks(encoded[:-10]), encoder))
+        with pytest.raises(ValueError):
+            list(encoding.decode_stream([b"foobar"], encoder))
+
+
+@pytest.mark.parametrize("encoder", ["identity", "br"])
+def test_stream_strings(encoder):
+    with pytest.raises(TypeError):
+        list(encoding.encode_stream(["foo"], encoder))
+
+
+def test_stream_flush():
+    class Decoder:
+        def decompress(self, data):
+            return b""
+
+        def flush(self):
+            return b"foo"
+
+    with mock.patch.dict(encoding.stream_decoders, {"foo": Decoder}):
+        assert list(encoding.decode_stream([b"bar"], "foo")) == [b"foo"]
+
+
+def test_stream_unsupported():
+    with pytest.raises(ValueError):
+        list(encoding.decode_stream([b"foo"], "utf8"))
+    with pytest.raises(ValueError):
+        list(encoding.encode_stream([b"foo"], "utf8"))
+
+
+def test_gzip_multiple_members():
+    data = gzip.compress(b"foo") + gzip.compress(b"bar") + b"\x00\x00"
+    assert encoding.decode(data, "gzip") == b"foobar"
+    assert b"".join(encoding.decode_stream(_chunks(data, 1), "gzip")) == b"foobar"
+
+
+def test_deflate_without_header():
+    data = zlib.compress(b"foobar" * 10)[2:-4]
+    assert encoding.decode(data, "deflate") == b"foobar" * 10
+    assert b"".join(encoding.decode_stream(_chunks(data, 1), "deflate")) == b"foobar" * 10
@@ -1 +1,169 @@
-# TODO: write tests
+import os
+import socket
+from unittest import mock
+
+import pytest
+from OpenSSL import SSL
+
+from mitmproxy.proxy.protocol import rawtcp
+from mitmproxy.test import tflow
+
+
+def fake_splice(src, dst, count):
+    # os.splice() is only available on Linux with Python 3.10+.
+    return os.write(dst, os.read(src, count))
+
+
+@pytest.fixture
+def splice():
+    if hasattr(os, "splice"):
+        yield
+    else:
+        with mock.patch.object(os, "splice", fake_splice, create=True):
+            yield
+
+
+@pytest.mark.parametrize("forwarder", [
+    rawtcp._BufferForwarder,
+    rawtcp._SpliceForwarder,
+])
+def test_forwarder(splice, forwarder):
+    client, src = socket.socketpair()
+    dst, server = socket.socketpair()
+    fwd = forwarder(16)
+    try:
+        client.sendall(b"x" * 10)
+        assert fwd(src, dst) == 10
+        assert server.recv(100) == b"x" * 10
+
+        client.sendall(b"y" * 20)
+        assert fwd(src, dst) == 16
+        assert fwd(src, dst) == 4
+        assert server.recv(100) == b"y" * 20
+
+        client.shutdown(socket.SHUT_WR)
+        assert fwd(src, dst) == 0
+    finally:
+        fwd.close()
+        for s in (client, src, dst, server):
+            s.close()
+
+
+def test_passthrough_forwarder(splice):
+    a, b = socket.socketpair()
+    with a, b:
+        fwd = rawtcp._passthrough_forwarder([a, b], 4096)
+        assert isinstance(fwd, rawtcp._SpliceForwarder)
+        tls = mock.Mock(spec=SSL.Connection)
+        fwd = rawtcp._passthrough_forwarder([a, tls], 4096)
+        assert isinstance(fwd, rawtcp._BufferForwarder)
+        with mock.patch.dict(os.__dict__):
+            del os.splice
+            fwd = rawtcp._passthrough_forwarder([a, b], 4096)
+            assert isinstance(fwd, rawtcp._BufferForwarder)
+
+
+class TestMessageForwarder:
+    def setup(self):
+        self.client, self.src = socket.socketpair()
+        self.dst, self.server = socket.socketpair()
+        self.layer = mock.Mock()
+        self.layer.server_conn.connection = self.dst
+        self.flow = tflow.ttcpflow()
+        self.flow.messages = []
+
+    def teardown(self):
+        for s in (self.client, self.src, self.dst, self.server):
+            s.close()
+
+    def test_simple(self):
+        fwd = rawtcp._MessageForwarder(self.layer, self.flow, 16)
+        self.client.sendall(b"foo")
+        assert fwd(self.src, self.dst) == 3
+        assert self.server.recv(100) == b"foo"
+        assert len(self.flow.messages) == 1
+        assert self.flow.messages[0].from_client
+        assert self.flow.messages[0].content == b"foo"
+        self.layer.channel.ask.assert_called_once_with("tcp_message", self.flow)
+
+        self.server.sendall(b"bar")
+        assert fwd(self.dst, self.src) == 3
+        assert self.client.recv(100) == b"bar"
+        assert not self.flow.messages[1].from_client
+
+        self.client.shutdown(socket.SHUT_WR)
+        assert fwd(self.src, self.dst) == 0
+        assert len(self.flow.messages) == 2
+
+    def test_coalesce(self):
+        fwd = rawtcp._MessageForwarder(self.layer, self.flow, 4, coalesce_size=10, coalesce_time=60)
+        self.client.sendall(b"x" * 8)
+        assert fwd(self.src, self.dst) == 4
+        assert fwd(self.src, self.dst) == 4
+        assert not self.flow.messages
+        assert 0 < fwd.timeout <= 60
+
+        # a change of direction flushes pending data
+        self.server.sendall(b"y")
+        assert fwd(self.dst, self.src) == 1
+        assert [m.content for m in self.flow.messages] == [b"x" * 8]
+        assert self.server.recv(100) == b"x" * 8
+
+        fwd.flush()
+        assert [m.content for m in self.flow.messages] == [b"x" * 8, b"y"]
+        assert self.client.recv(100) == b"y"
+        assert fwd.timeout == 10
+
+        # exceeding the size flushes pending data
+        self.client.sendall(b"z" * 12)
+        for _ in range(3):
+            fwd(self.src, self.dst)
+        assert self.flow.messages[-1].content == b"z" * 12
+
+    def test_coalesce_time(self):
+        fwd = rawtcp._MessageForwarder(self.layer, self.flow, 4, coalesce_size=100, coalesce_time=0)
+        self.client.sendall(b"foo")
+        fwd(self.src, self.dst)
+        assert fwd.timeout == 10
+        assert self.flow.messages[-1].content == b"foo"
+
+    def test_max_messages(self):
+        fwd = rawtcp._MessageForwarder(self.layer, self.flow, 16, max_messages=2)
+        retained = []
+        for i in range(7):
+            self.client.sendall(str(i).encode())
+            fwd(self.src, self.dst)
+            retained.append(len(self.flow.messages))
+            assert self.flow.messages[-1].content == str(i).encode()
+        assert retained == [1, 2, 3, 2, 3, 2, 3]
+        assert [m.content for m in self.flow.messages] == [b"4", b"5", b"6"]
+
+
+def test_layer_flush_timeout():
+    client, src = socket.socketpair()
+    dst, server = socket.socketpair()
+    ctx = mock.Mock()
+    ctx.client_conn.connection = src
+    ctx.server_conn.connection = dst
+    ctx.channel.should_exit.is_set.return_value = False
+    ctx.config.options.tcp_chunk_size = 16
+    ctx.config.options.tcp_coalesce_size = "1k"
+    ctx.config.options.tcp_coalesce_time = 1
+    ctx.config.options.tcp_max_messages = 0
+
+    def tcp_message(mtype, f):
+        if mtype == "tcp_message":
+            client.shutdown(socket.SHUT_WR)
+            server.shutdown(socket.SHUT_WR)
+
+    ctx.channel.ask.side_effect = tcp_message
+    try:
+        client.sendall(b"foo")
+        # Nothing else arrives, so the coalesced message is sent once the select times out.
+        rawtcp.RawTCPLayer(ctx)()
+        assert server.recv(100) == b"foo"
+        f = ctx.channel.tell.call_args[0][1]
+        assert [m.content for m in f.messages] == [b"foo"]
+    finally:
+        for s in (client, src, dst, server):
+            s.close()
@@ -11,6 +11,7 @@ from mitmproxy.websocket import WebSocketFlow
 
 from mitmproxy.net import tcp
 from mitmproxy.net import http
+from mitmproxy.proxy.protocol import websocket
 from ...net import tservers as net_tservers
 from ... import tservers
 
@@ -221,6 +222,76 @@ class TestSimple(_WebSocketTest):
         assert frame.payload == b'foo'
 
 
+class TestOriginalFrames(_WebSocketTest):
+
+    # a text message split into two frames
+    server_frames = b'\x01\x03foo' + b'\x80\x03bar'
+    # re-encoding would pick a new masking key
+    client_frame = bytes(websockets.Frame(fin=1, mask=1, opcode=websockets.OPCODE.BINARY, payload=b'\xde\xad'))
+
+    @classmethod
+    def handle_websockets(cls, rfile, wfile):
+        wfile.write(cls.server_frames + bytes(websockets.Frame(fin=1, opcode=websockets.OPCODE.TEXT, payload=b'baz')))
+        wfile.flush()
+
+        assert rfile.safe_read(len(cls.client_frame)) == cls.client_frame
+        wfile.write(bytes(websockets.Frame(fin=1, opcode=websockets.OPCODE.CLOSE)))
+        wfile.flush()
+
+    def test_original_frames(self):
+        self.setup_connection()
+
+        assert self.client.rfile.safe_read(len(self.server_frames)) == self.server_frames
+        frame = websockets.Frame.from_file(self.client.rfile)
+        assert frame.payload == b'baz'
+
+        self.client.wfile.write(self.client_frame)
+        self.client.wfile.flush()
+        websockets.Frame.from_file(self.client.rfile)
+
+        messages = self.master.state.flows[1].messages
+        assert [m.content for m in messages] == ['foobar', 'baz', b'\xde\xad']
+
+
+class TestMessageLimits(_WebSocketTest):
+
+    @classmethod
+    def handle_websockets(cls, rfile, wfile):
+        for i in range(5):
+            wfile.write(bytes(websockets.Frame(fin=1, opcode=websockets.OPCODE.BINARY, payload=b'%d' % i * 10)))
+        wfile.write(bytes(websockets.Frame(fin=1, opcode=websockets.OPCODE.CLOSE)))
+        wfile.flush()
+        websockets.Frame.from_file(rfile)
+
+    def teardown(self):
+        super().teardown()
+        self.options.update(websocket_max_messages=0, websocket_max_bytes=None, websocket_overflow="drop")
+
+    def _run(self):
+        self.setup_connection()
+        for i in range(6):
+            websockets.Frame.from_file(self.client.rfile)
+        self.client.wfile.write(bytes(websockets.Frame(fin=1, mask=1, opcode=websockets.OPCODE.CLOSE)))
+        self.client.wfile.flush()
+        self.master.event_queue.join()
+        return self.master.state.flows[1]
+
+    def test_drop(self):
+        self.options.update(websocket_max_messages=3, websocket_max_bytes="25")
+        f = self._run()
+        assert [m.content for m in f.messages] == [b'3' * 10, b'4' * 10]
+        assert f.dropped_messages == 3
+        assert f.spill is None
+
+    def test_spill(self):
+        self.options.update(websocket_max_messages=2, websocket_overflow="spill")
+        f = self._run()
+        assert [m.content for m in f.messages] == [b'3' * 10, b'4' * 10]
+        assert f.dropped_messages == 0
+        assert len(f.spill) == 3
+        assert [m[2] for m in f.get_state()["messages"]] == [b'%d' % i * 10 for i in range(5)]
+
+
 class TestKillFlow(_WebSocketTest):
 
     @classmethod
@@ -465,3 +536,19 @@ class TestExtension(_WebSocketTest):
         assert self.master.state.flows[1].messages[3].type == websockets.OPCODE.BINARY
         assert self.master.state.flows[1].messages[4].content == b'\xde\xad\xbe\xef'
         assert self.master.state.flows[1].messages[4].type == websockets.OPCODE.BINARY
+
+
+def test_frame_splitter():
+    s = websocket._FrameSplitter()
+    text = bytes(websockets.Frame(fin=0, mask=1, opcode=websockets.OPCODE.TEXT, payload=b'foo'))
+    ping = bytes(websockets.Frame(fin=1, opcode=websockets.OPCODE.PING, payload=b'ping'))
+    cont = bytes(websockets.Frame(fin=1, opcode=websockets.OPCODE.CONTINUE, payload=b'x' * 200))
+    large = bytes(websockets.Frame(fin=1, opcode=websockets.OPCODE.BINARY, payload=b'y' * 70000))
+
+    data = text + ping + cont + large
+    for i in range(0, len(data), 7):
+        s.receive_bytes(data[i:i + 7])
+    assert s.pop_message() == [text, cont]
+    assert s.pop_message() == [large]
+    assert not s.messages
+    assert not s.buf
@@ -5,6 +5,8 @@ from unittest.mock import patch
 from mitmproxy.test import tflow
 
 from mitmproxy import flowfilter
+from mitmproxy import websocket
+from mitmproxy.io import spill
 
 
 class TestParsing:
@@ -75,6 +77,42 @@ class TestParsing:
         assert isinstance(a, flowfilter.FHeadRequest)
         self._dump(a)
 
+    def test_operators_in_words(self):
+        assert flowfilter.parse("a&b").expr == "a&b"
+        assert flowfilter.parse("a|b").expr == "a|b"
+        assert flowfilter.parse("!").expr == "!"
+        assert flowfilter.parse("!a").itm.expr == "a"
+        assert flowfilter.parse("!!~q").itm.itm
+        a = flowfilter.parse("x~q")
+        assert a.lst[0].expr == "x"
+        assert isinstance(a.lst[1], flowfilter.FReq)
+
+    def test_precedence(self):
+        a = flowfilter.parse("~q ~s | ~e")
+        assert isinstance(a.lst[1], flowfilter.FOr)
+        a = flowfilter.parse("~q & ~s | ~e & ~c 200")
+        assert isinstance(a, flowfilter.FOr)
+        assert [type(i) for i in a.lst] == [flowfilter.FAnd, flowfilter.FAnd]
+        a = flowfilter.parse("a (b | c)")
+        assert isinstance(a.lst[1], flowfilter.FOr)
+
+    def test_whitespace(self):
+        assert isinstance(flowfilter.parse("\t~c\n200 "), flowfilter.FCode)
+        assert flowfilter.parse("( ~q )")
+        assert flowfilter.parse("~c 20x").lst[1].expr == "x"
+        assert flowfilter.parse("~u '\\t'").expr == "\t"
+
+    @pytest.mark.parametrize("expr", [
+        "", " ", "(~q)", "~q&~s", "~c200", "~h", "~h'foo'", "~x", "~", "~u ~q",
+        "(a b)", "a)", "(a", "'foo", "~u 'a\nb'", "~c", "~q é", "!" * 10000, "a | )", "~q & )",
+    ])
+    def test_invalid(self, expr):
+        assert flowfilter.parse(expr) is None
+
+    def test_cache(self):
+        assert flowfilter.parse("~q") is flowfilter.parse("~q")
+        assert flowfilter.parse("~q").pattern == "~q"
+
 
 class TestMatchingHTTPFlow:
 
@@ -566,3 +604,181 @@ def test_match():
 
     assert flowfilter.match(None, None)
     assert not flowfilter.match('foobar', None)
+
+
+def _evaluate(flt, f):
+    # Evaluate a filter tree without compiling it.
+    if isinstance(flt, flowfilter.FAnd):
+        return all(_evaluate(i, f) for i in flt.lst)
+    if isinstance(flt, flowfilter.FOr):
+        return any(_evaluate(i, f) for i in flt.lst)
+    if isinstance(flt, flowfilter.FNot):
+        return not _evaluate(flt.itm, f)
+    return bool(flt(f))
+
+
+class TestIndexes:
+
+    def flows(self):
+        flows = [
+            tflow.tflow(), tflow.tflow(resp=True), tflow.tflow(err=True),
+            tflow.ttcpflow(), tflow.twebsocketflow(), tflow.tdummyflow(),
+        ]
+        flows[0].marked = True
+        flows[0].request.method = "POST"
+        flows[0].request.headers["content-type"] = "application/json"
+        flows[1].request.headers["host"] = "example.com"
+        flows[1].response.status_code = 404
+        flows[1].response.headers["content-type"] = "text/css"
+        flows[2].request.host = "example.org"
+        return flows
+
+    def indexes(self, flows):
+        indexes = {name: {} for name in flowfilter.INDEXES}
+        for f in flows:
+            for name, key in zip(flowfilter.INDEXES, flowfilter.index_keys(f)):
+                indexes[name].setdefault(key, {})[f.id] = f
+        return indexes
+
+    @pytest.mark.parametrize("expr", [
+        "~http", "~tcp | ~websocket", "~q", "~s", "~c 404", "~m post", "~marked",
+        "~d example", "~d address", "~t json", "~ts css", "~tq css", "~a",
+        "~c 404 | ~m post", "~d example & ~s", "~q & ~marked & ~d address",
+    ])
+    def test_exact(self, expr):
+        p = flowfilter.parse(expr)
+        flows = self.flows()
+        ids = p.candidates(self.indexes(flows))
+        assert ids == {f.id for f in flows if p(f)}
+
+    @pytest.mark.parametrize("expr", [
+        "~d example & ~u foo", "~c 404 & !~h foo", "~tcp & ~b hello",
+    ])
+    def test_partial(self, expr):
+        p = flowfilter.parse(expr)
+        flows = self.flows()
+        ids = p.candidates(self.indexes(flows))
+        assert ids is not None
+        assert ids < {f.id for f in flows}
+        assert ids >= {f.id for f in flows if p(f)}
+
+    @pytest.mark.parametrize("expr", [
+        "~u example", "!~http", "~h foo | ~d example",
+    ])
+    def test_none(self, expr):
+        flows = self.flows()
+        assert flowfilter.parse(expr).candidates(self.indexes(flows)) is None
+
+
+class TestCompile:
+
+    def test_cheap_first(self):
+        f = tflow.tflow(resp=True)
+        with patch.object(f.response, "get_content", return_value=b"message") as content:
+            assert not flowfilter.parse("~bs foo & ~c 404")(f)
+            assert flowfilter.parse("~bs foo | ~c 200")(f)
+            assert not content.called
+            assert not flowfilter.parse("~bs foo & ~c 200")(f)
+            assert content.called
+
+    def test_body_group(self):
+        f = tflow.tflow(resp=True)
+        with patch.object(f.request, "get_content", return_value=b"content") as request:
+            with patch.object(f.response, "get_content", return_value=b"message") as response:
+                assert flowfilter.parse("~b foo | ~b bar | ~b message")(f)
+                assert request.call_count == 1
+                assert response.call_count == 1
+                assert not flowfilter.parse("~b content & ~b foo & ~b message")(f)
+                assert request.call_count == 2
+                assert response.call_count == 2
+        p = flowfilter.parse("~b foo | ~bq bar | ~b baz")
+        assert p.compile()[1] == flowfilter.FBod.cost * 2 + 1
+        assert p.reads_body
+        assert not flowfilter.parse("~q | !(~h foo & ~m get)").reads_body
+
+    def test_facets(self):
+        assert flowfilter.parse("~q & ~d foo").facets == {
+            flowfilter.REQUEST_HEAD, flowfilter.RESPONSE_HEAD
+        }
+        assert flowfilter.parse("!~e & ~http | ~marked").facets == {
+            flowfilter.ERROR, flowfilter.MARKED
+        }
+        assert flowfilter.parse("~bq foo | ~src bar").facets == {
+            flowfilter.REQUEST_BODY, flowfilter.MESSAGES, flowfilter.CONNECTIONS
+        }
+        assert flowfilter.parse("~bq foo").reads_body
+        assert not flowfilter.parse("~h foo").reads_body
+
+        facets = sorted(flowfilter.ALL_FACETS)
+        for f in [
+            tflow.tflow(), tflow.tflow(resp=True, err=True),
+            tflow.ttcpflow(), tflow.twebsocketflow(), tflow.tdummyflow(),
+        ]:
+            assert flowfilter.facet_key(facets, f) == flowfilter.facet_key(facets, f)
+
+        f = tflow.tflow(resp=True)
+        for facet, change in [
+            (flowfilter.REQUEST_HEAD, lambda: setattr(f.request, "path", "/foo")),
+            (flowfilter.REQUEST_BODY, lambda: setattr(f.request, "content", b"foo")),
+            (flowfilter.RESPONSE_HEAD, lambda: setattr(f.response, "status_code", 404)),
+            (flowfilter.RESPONSE_BODY, lambda: f.response.headers.update(foo="bar")),
+            (flowfilter.CONNECTIONS, lambda: setattr(f.server_conn, "address", ("foo", 80))),
+            (flowfilter.ERROR, lambda: setattr(f, "error", tflow.terr())),
+            (flowfilter.MARKED, lambda: setattr(f, "marked", True)),
+        ]:
+            key = flowfilter.facet_key([facet], f)
+            change()
+            assert flowfilter.facet_key([facet], f) != key
+
+        f = tflow.ttcpflow()
+        for change in [
+            lambda: f.messages.append(f.messages[0]),
+            lambda: setattr(f.messages[0], "content", b"foo"),
+            lambda: setattr(f.messages[-1], "content", b"bar"),
+        ]:
+            key = flowfilter.facet_key([flowfilter.MESSAGES], f)
+            change()
+            assert flowfilter.facet_key([flowfilter.MESSAGES], f) != key
+
+        f = tflow.twebsocketflow()
+        key = flowfilter.facet_key([flowfilter.MESSAGES], f)
+        f.spill = spill.Spill(websocket.WebSocketMessage)
+        f.spill.extend(f.messages[:1])
+        assert flowfilter.facet_key([flowfilter.MESSAGES], f) != key
+        f.messages.clear()
+        assert flowfilter.facet_key([flowfilter.MESSAGES], f) is not None
+
+    def test_types(self):
+        p = flowfilter.parse("~c 200 & ~m get")
+        types, cost, _ = p.compile()
+        assert types == {flowfilter.http.HTTPFlow}
+        assert cost == flowfilter.FCode.cost + flowfilter.FMethod.cost
+        assert not p(tflow.ttcpflow())
+        assert not p(tflow.twebsocketflow())
+
+        assert flowfilter.parse("~tcp & ~http").compile()[0] == frozenset()
+        assert flowfilter.parse("~tcp | ~http").compile()[0] == {
+            flowfilter.tcp.TCPFlow, flowfilter.http.HTTPFlow
+        }
+        assert flowfilter.parse("~tcp | ~e").compile()[0] is None
+        assert flowfilter.parse("!~tcp").compile()[0] is None
+
+    @pytest.mark.parametrize("expr", [
+        "(~tcp | ~d example.com) & !~s",
+        "~b message | ~e | ~c 200 | ~marked",
+        "~d example.com & ~b message & !~c 200",
+        "!~q & !~websocket & (~src address | ~b foo)",
+        "~tcp & ~http",
+        "~b content & ~b message | ~bq hello & ~bq me",
+        "~bs foo | ~bs message | ~bs me | ~c 404",
+        "~b hello & ~b it & !(~bq binary | ~bq text)",
+    ])
+    def test_equivalent(self, expr):
+        p = flowfilter.parse(expr)
+        flows = [
+            tflow.tflow(), tflow.tflow(resp=True), tflow.tflow(err=True),
+            tflow.ttcpflow(), tflow.twebsocketflow(), tflow.tdummyflow(),
+        ]
+        flows[0].marked = True
+        for f in flows:
+            assert p(f) == _evaluate(p, f)
@@ -1,4 +1,5 @@
 import pytest
+from unittest import mock
 
 from mitmproxy.test import tflow
 from mitmproxy.net.http import Headers
@@ -7,6 +8,7 @@ from mitmproxy import flowfilter
 from mitmproxy.exceptions import Kill, ControlException
 from mitmproxy import flow
 from mitmproxy import http
+from mitmproxy.coretypes import bodystore
 
 
 class TestHTTPRequest:
@@ -152,6 +154,48 @@ class TestHTTPFlow:
         f.backup()
         f.revert()
 
+    def test_backup_shallow(self):
+        store = bodystore.BodyStore(min_size=0, spill_size=0)
+        f = tflow.tflow(resp=True)
+        f.response.content = b"x" * 100
+        f.response.data.content = store.add(f.response.content)
+        with mock.patch.object(store, "load", wraps=store.load) as load:
+            f.backup()
+            assert f._backup["response"].data.stored_content is f.response.data.stored_content
+            assert not f.modified()
+            f.response.headers["foo"] = "bar"
+            assert f.modified()
+            del f.response.headers["foo"]
+            assert not f.modified()
+            assert not load.called
+        # Equal content is not a modification, even if it is no longer shared.
+        f.response.content = b"x" * 100
+        assert not f.modified()
+        f.response.content = b"y" * 100
+        assert f.modified()
+
+        state = f.get_state()
+        assert state["backup"]["response"]["content"] == b"x" * 100
+        f2 = http.HTTPFlow.from_state(state)
+        assert f2.modified()
+        f2.revert()
+        f.revert()
+        assert f.response.content == f2.response.content == b"x" * 100
+        assert not f.modified() and not f2.modified()
+
+    def test_backup_replay(self):
+        f = tflow.tflow(resp=True)
+        resp = f.response
+        f.backup()
+        f.response = None
+        f.request.is_replay = True
+        assert f.modified()
+        f.request.is_replay = False
+        assert f.modified()
+        f.revert()
+        assert f.response == resp
+        assert f.response is not resp
+
     def test_getset_state(self):
         f = tflow.tflow(resp=True)
         state = f.get_state()
@@ -175,6 +219,17 @@ class TestHTTPFlow:
         f.set_state(f2.get_state())
         assert f.get_state() == f2.get_state()
 
+    def test_slots(self):
+        f = tflow.tflow(resp=True)
+        for o in (f, f.request.data, f.response.data, f.client_conn, f.server_conn):
+            assert not hasattr(o, "__dict__")
+        assert f.request.data.get_state()["content"] == f.request.content
+        with pytest.raises(AttributeError):
+            f.foo = 1
+        # Messages take attributes of addons, but do not need a dict otherwise.
+        assert not f.request.__dict__
+        f.request.foo = 1
+
     def test_kill(self):
         f = tflow.tflow()
         with pytest.raises(ControlException):
@@ -2,7 +2,7 @@ import typing
 
 import pytest
 
-from mitmproxy.stateobject import StateObject
+from mitmproxy.stateobject import StateObject, Snapshot
 
 
 class TObject(StateObject):
@@ -144,3 +144,23 @@ def test_none():
     a = Child(42)
     a.set_state({"x": None})
     assert a.x is None
+
+
+def test_snapshot():
+    a = TSerializableChild(Child(42))
+    s = Snapshot(a)
+    assert s.matches(a)
+    assert s.get_state() == a.get_state()
+    a.x.x = 43
+    assert not s.matches(a)
+    assert s.get_state() == {"x": {"x": 42}}
+    a.x = None
+    assert not s.matches(a)
+    assert not s.matches(Child(42))
+
+    a = TList([Child(1)])
+    s = Snapshot(a)
+    a.x.append(Child(2))
+    assert not s.matches(a)
+    a.x.pop()
+    assert s.matches(a)
@@ -7,6 +7,11 @@ from mitmproxy.test import tflow
 
 class TestTCPFlow:
 
+    def test_slots(self):
+        f = tflow.ttcpflow()
+        assert not hasattr(f, "__dict__")
+        assert not hasattr(f.messages[0], "__dict__")
+
     def test_copy(self):
         f = tflow.ttcpflow()
         f.get_state()
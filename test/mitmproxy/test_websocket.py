@@ -1,6 +1,8 @@
 import io
 import pytest
 
+from mitmproxy import websocket
+from mitmproxy.io import spill
 from mitmproxy.io import tnetstring
 from mitmproxy import flowfilter
 from mitmproxy.exceptions import Kill, ControlException
@@ -87,8 +89,37 @@ class TestWebSocketFlow:
         tnetstring.dump(d, b)
         assert b.getvalue()
 
+    def test_spill(self):
+        f = tflow.twebsocketflow()
+        state = f.get_state()
+        f.spill = spill.Spill(websocket.WebSocketMessage)
+        f.spill.extend(f.messages[:1])
+        del f.messages[:1]
+        assert f.get_state() == state
+        assert flowfilter.match("~bq binary", f)
+        assert len(f.get_memory_state()["messages"]) == len(state["messages"]) - 1
+
+        f.set_state(state)
+        assert f.spill is None
+        assert len(f.messages) == len(state["messages"])
+
+    def test_backup_missing_state(self):
+        f = tflow.twebsocketflow()
+        f.backup()
+        assert not f.modified()
+        state = f.get_state()
+        state["backup"] = state.copy()
+        del state["backup"]["dropped_messages"]
+        f = websocket.WebSocketFlow.from_state(state)
+        assert f.modified()
+        assert "dropped_messages" not in f.get_state()["backup"]
+
     def test_message_kill(self):
         f = tflow.twebsocketflow()
         assert not f.messages[-1].killed
         f.messages[-1].kill()
         assert f.messages[-1].killed
+
+    def test_message_slots(self):
+        f = tflow.twebsocketflow()
+        assert not hasattr(f.messages[0], "__dict__")
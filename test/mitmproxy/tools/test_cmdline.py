@@ -1,8 +1,11 @@
 import argparse
 
+import pytest
+
 from mitmproxy import options
 from mitmproxy.tools import cmdline, web, dump, console
 from mitmproxy.tools import main
+from mitmproxy.test import tutils
 
 
 def test_common():
@@ -27,6 +30,34 @@ def test_mitmdump():
     assert ap
 
 
+def test_mitmdump_upgrade_dump(tmpdir, capsys):
+    opts = options.Options()
+    dump.DumpMaster(opts)
+    ap = cmdline.mitmdump(opts)
+    src = tutils.test_data.path("mitmproxy/data/dumpfile-011")
+    dst = str(tmpdir.join("upgraded"))
+
+    args = ap.parse_args(["--upgrade-dump", src, dst])
+    with pytest.raises(SystemExit) as e:
+        main.process_options(ap, opts, args)
+    assert e.value.code == 0
+    assert "Upgraded 1 flows" in capsys.readouterr().out
+    assert tmpdir.join("upgraded").size()
+
+    args = ap.parse_args(["--upgrade-dump", str(tmpdir.join("nonexistent")), dst])
+    with pytest.raises(SystemExit) as e:
+        main.process_options(ap, opts, args)
+    assert e.value.code == 1
+
+    size = tmpdir.join("upgraded").size()
+    args = ap.parse_args(["--upgrade-dump", dst, dst])
+    with pytest.raises(SystemExit) as e:
+        main.process_options(ap, opts, args)
+    assert e.value.code == 1
+    assert "same file" in capsys.readouterr().err
+    assert tmpdir.join("upgraded").size() == size
+
+
 def test_mitmweb():
     opts = options.Options()
     web.master.WebMaster(opts)